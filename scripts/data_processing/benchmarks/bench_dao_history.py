@@ -0,0 +1,124 @@
+"""
+Benchmark of the DAO metrics history (dao_history.DAOHistoryStore) on synthetic daily expand runs:
+size on disk, append and open time, latest / range / growth query latency,
+compared with keeping one expand csv per run and re-reading them
+
+    python benchmarks/bench_dao_history.py --daos 2000 --runs 365
+"""
+# =============================================================================
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import numpy as np
+import pandas as pd
+import config
+from dao_history import DAOHistoryStore
+
+DAY = 86400
+#probability that a metric changes between two daily runs
+CHANGE_RATES = {
+    'treasury_size': 0.6,
+    'token_price_usd': 0.5,
+    'market_cap_usd': 0.5,
+    'num_token_holders': 0.3,
+    'discord_users_count': 0.4,
+    'twitter_followers_count': 0.2,
+}
+
+
+def iter_runs(n_daos, n_runs, seed=0):
+    """
+    (timestamp, dataframe) of each run, a third of the DAOs have no token
+    """
+    rng = np.random.default_rng(seed)
+    eth_names = ['dao{}.eth'.format(i) for i in range(n_daos)]
+    values = {name: rng.lognormal(8, 2, n_daos).round(2) for name in config.HISTORY_METRICS}
+    no_token = rng.random(n_daos) < 0.33
+    for name in ['token_price_usd', 'market_cap_usd', 'num_token_holders']:
+        values[name][no_token] = np.nan
+    for run in range(n_runs):
+        for name in config.HISTORY_METRICS:
+            changed = rng.random(n_daos) < CHANGE_RATES.get(name, 0.5)
+            values[name] = np.where(changed, (values[name] * rng.normal(1, 0.02, n_daos)).round(2), values[name])
+        yield 1.6e9 + run * DAY, pd.DataFrame(values, index=eth_names)
+
+
+def time_ms(fn, repeat):
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start_time) * 1000 / repeat, result
+
+
+def get_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--daos", dest="daos", type=int, default=2000)
+    parser.add_argument("--runs", dest="runs", type=int, default=365)
+    parser.add_argument("--repeat", dest="repeat", type=int, default=20)
+    parser.add_argument("--no-csv", dest="no_csv", action="store_true", help="skip the csv per run baseline")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='dao_history_bench_')
+    history_dir = os.path.join(workdir, 'history')
+    csv_dir = os.path.join(workdir, 'csv')
+    os.makedirs(csv_dir)
+
+    try:
+        store = DAOHistoryStore(history_dir)
+        append_s = 0
+        for run, (timestamp, df) in enumerate(iter_runs(args.daos, args.runs)):
+            start_time = time.perf_counter()
+            store.append_run(df, timestamp=timestamp)
+            append_s += time.perf_counter() - start_time
+            if not args.no_csv:
+                df.to_csv(os.path.join(csv_dir, '{:05d}_{}.csv'.format(run, int(timestamp))))
+
+        open_ms, store = time_ms(lambda: DAOHistoryStore(history_dir), 3)
+        n_values = args.daos * args.runs * len(config.HISTORY_METRICS)
+        print('{} DAOs x {} runs: {} records for {} values ({:.1%}), {:.1f} kb on disk'.format(
+            args.daos, args.runs, len(store.changes), n_values, len(store.changes) / n_values, get_size(history_dir) / 1024))
+        print('append {:.2f} ms per run, open {:.1f} ms'.format(append_s * 1000 / args.runs, open_ms))
+
+        last_timestamp = store.runs[-1]['timestamp']
+        #the window starts at the first run when there are fewer than 30 days of runs
+        month_ago = max(last_timestamp - 30 * DAY, store.runs[0]['timestamp'])
+        eth_name = 'dao{}.eth'.format(args.daos // 2)
+        print('{:<28} {:>10}'.format('query', 'ms'))
+        for name, fn in [
+            ('latest (one DAO)', lambda: store.get_latest(eth_name)),
+            ('latest (all DAOs)', lambda: store.get_latest()),
+            ('range (one DAO, all runs)', lambda: store.get_range(eth_name)),
+            ('range (one DAO, 30 days)', lambda: store.get_range(eth_name, month_ago)),
+            ('values at (all DAOs)', lambda: store.get_values_at(month_ago)),
+            ('growth 30d (all DAOs)', lambda: store.get_growth(month_ago)),
+        ]:
+            print('{:<28} {:>10.3f}'.format(name, time_ms(fn, args.repeat)[0]))
+
+        if not args.no_csv:
+            csv_files = sorted(os.listdir(csv_dir))
+
+            def csv_range():
+                rows = [pd.read_csv(os.path.join(csv_dir, name), index_col=0).loc[eth_name] for name in csv_files]
+                return pd.DataFrame(rows)
+
+            def csv_growth():
+                start_name = [name for name in csv_files if int(name.split('_')[1][:-4]) <= month_ago][-1]
+                start = pd.read_csv(os.path.join(csv_dir, start_name), index_col=0)
+                end = pd.read_csv(os.path.join(csv_dir, csv_files[-1]), index_col=0)
+                return end / start - 1
+
+            print('csv per run: {:.1f} kb on disk'.format(get_size(csv_dir) / 1024))
+            print('{:<28} {:>10.3f}'.format('csv range (one DAO)', time_ms(csv_range, 1)[0]))
+            print('{:<28} {:>10.3f}'.format('csv growth 30d', time_ms(csv_growth, 3)[0]))
+    finally:
+        shutil.rmtree(workdir)
@@ -0,0 +1,88 @@
+"""
+Benchmark of the local query service (dao_server.py) on a synthetic expand output:
+index build time, in-process query latency with and without the response cache,
+and http round trips with and without a matching ETag
+
+    python benchmarks/bench_dao_server.py --daos 5000
+"""
+# =============================================================================
+
+import os
+import sys
+import tempfile
+import time
+import urllib.request
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import numpy as np
+import pandas as pd
+from dao_server import DAOQueryIndex, DAOQueryServer
+from mock_server import CATEGORIES, WORDS
+
+
+def make_output(n_daos, seed=0):
+    """
+    expand-like output: list reprs for categories and tags, a few missing numbers
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'id': np.arange(n_daos),
+        'name': ['DAO {}'.format(i) for i in range(n_daos)],
+        'network': 'Ethereum Mainnet',
+        'categories': [str(sorted(rng.choice(CATEGORIES, rng.integers(1, 4), replace=False).tolist())) for _ in range(n_daos)],
+        'tags': [str(set(rng.choice(WORDS, rng.integers(0, 6), replace=False).tolist()) or 'set()') for _ in range(n_daos)],
+        'treasury_size': np.where(rng.random(n_daos) < 0.1, np.nan, rng.lognormal(12, 3, n_daos)),
+        'twitter_followers_count': rng.integers(0, 500000, n_daos),
+        'discord_users_count': rng.integers(0, 100000, n_daos),
+        'num_token_holders': rng.integers(0, 50000, n_daos),
+    })
+
+
+def time_us(fn, repeat):
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start_time) * 1e6 / repeat
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--daos", dest="daos", type=int, default=5000)
+    parser.add_argument("--repeat", dest="repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix='dao_server_bench_'), 'dao_list_updated.csv')
+    make_output(args.daos).to_csv(path)
+
+    start_time = time.perf_counter()
+    index = DAOQueryIndex.from_file(path)
+    print('{} DAOs indexed in {:.1f} ms'.format(args.daos, (time.perf_counter() - start_time) * 1000))
+
+    queries = [
+        ('by id', '/daos/{}'.format(args.daos // 2), ()),
+        ('list first page', '/daos', ()),
+        ('category', '/daos', (('category', 'protocol'),)),
+        ('2 categories + tag, sorted', '/daos', (('category', 'grant,media'), ('sort', '-treasury_size'), ('tag', 'governance'))),
+        ('sorted by followers, page 10', '/daos', (('limit', '20'), ('offset', '200'), ('sort', '-twitter_followers_count'))),
+    ]
+    print('{:<30} {:>12} {:>12}'.format('query', 'build_us', 'cached_us'))
+    for name, route, params in queries:
+        build_us = time_us(lambda: index.build_response(route, params), args.repeat)
+        cached_us = time_us(lambda: index.get_response(route, params), args.repeat)
+        print('{:<30} {:>12.1f} {:>12.1f}'.format(name, build_us, cached_us))
+
+    server = DAOQueryServer(path, port=0).start(reload_interval=0)
+    url = 'http://127.0.0.1:{}/daos?category=protocol&sort=-treasury_size'.format(server.server_address[1])
+    etag = urllib.request.urlopen(url).headers['ETag']
+
+    def get(headers):
+        try:
+            urllib.request.urlopen(urllib.request.Request(url, headers=headers)).read()
+        except urllib.error.HTTPError as e:
+            assert e.code == 304
+
+    n_requests = min(args.repeat, 500)
+    print('http 200: {:.0f} us, http 304 (If-None-Match): {:.0f} us per request'.format(
+        time_us(lambda: get({}), n_requests), time_us(lambda: get({'If-None-Match': etag}), n_requests)))
+    server.stop()
@@ -0,0 +1,103 @@
+"""
+Micro-benchmark of DDDAODownloader.flatten_curate_data_from_dd on synthetic deepdao data,
+compared with the row by row reference implementation
+
+    python benchmarks/bench_dd_flatten.py --sizes 1000 5000 20000
+"""
+# =============================================================================
+
+import os
+import sys
+import random
+import time
+import logging
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import pandas as pd
+from dd_dao_download import DDDAODownloader
+
+SOCIAL_TYPES = ['Website', 'Twitter', 'Discord', 'Telegram', 'Github', 'Discourse', 'Medium']
+
+
+def make_dd_data(n_orgs, seed=0):
+    """
+    synthetic daosSummary list with the matching org details and assets
+    """
+    rnd = random.Random(seed)
+    org_ids = ['org-{}'.format(i) for i in range(n_orgs)]
+    df_dd_dao = pd.DataFrame({'organizationId': org_ids})
+    org_details = {}
+    org_assets = {}
+    for i, org_id in enumerate(org_ids):
+        socials = [{'type': t, 'url': 'https://{}.com/org{}'.format(t.lower(), i)}
+                    for t in rnd.sample(SOCIAL_TYPES, rnd.randint(0, len(SOCIAL_TYPES)))]
+        org_details[org_id] = {'data': {
+            'id': org_id, 'name': 'Org {}'.format(i), 'description': 'synthetic org',
+            'proposalsCount': rnd.randint(0, 500), 'votesCount': rnd.randint(0, 10000),
+            'aum': rnd.random() * 1e7, 'socials': socials, 'rankings': [],
+        }}
+        assets = [{'type': 'treasury', 'address': '0x{:040x}'.format(rnd.getrandbits(160)), 'description': None}
+                    for _ in range(rnd.randint(0, 4))]
+        assets += [{'type': 'governance', 'address': 'org{}-{}.eth'.format(i, j), 'description': 'Snapshot space'}
+                    for j in range(rnd.randint(0, 2))]
+        org_assets[org_id] = {'data': assets}
+    return df_dd_dao, org_details, org_assets
+
+
+def legacy_flatten(df_dd_dao, org_details, org_assets):
+    """
+    the iterrows based flattening, kept as the reference
+    """
+    org_infos = []
+    for idx, row in df_dd_dao.iterrows():
+        org_id = row['organizationId']
+        org_info = {}
+        for k,v in org_details[org_id]['data'].items():
+            if k == 'rankings':
+                continue
+            if k == 'socials':
+                for s in v:
+                    social_key = s['type'].strip().lower()
+                    if social_key not in org_info:
+                        org_info[social_key] = s['url'].split('/')[-1] if social_key == 'twitter' else s['url']
+                continue
+            new_key = k.strip().lower()
+            if new_key not in org_info:
+                org_info[new_key] = v
+        treasury_address = []
+        dd_eth_names = []
+        for ast in org_assets[org_id]['data']:
+            if ast['type'] == 'treasury':
+                treasury_address.append(ast['address'])
+            if ast['description'] is not None:
+                if 'snapshot' in ast['description'].strip().lower():
+                    if ast['address'] is not None:
+                        dd_eth_names.append(ast['address'])
+        org_info['treasury_address'] = ','.join(treasury_address)
+        org_info['dd_eth_names'] = ','.join(dd_eth_names)
+        org_infos.append(org_info)
+    return pd.DataFrame(org_infos)
+
+
+def timed(fn, *args):
+    start_time = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start_time, result
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    parser = ArgumentParser()
+    parser.add_argument("--sizes", dest="sizes", type=int, nargs='+', default=[1000, 5000, 20000])
+    args = parser.parse_args()
+
+    print('{:>8} {:>12} {:>12} {:>9} {:>8}'.format('orgs', 'flatten_s', 'legacy_s', 'speedup', 'same'))
+    for size in args.sizes:
+        dd_data = make_dd_data(size)
+        elapsed, df_new = timed(DDDAODownloader.flatten_curate_data_from_dd, *dd_data)
+        legacy_elapsed, df_legacy = timed(legacy_flatten, *dd_data)
+
+        columns = sorted(df_legacy.columns)
+        same = df_new[columns].fillna('').astype(str).equals(df_legacy[columns].fillna('').astype(str))
+        print('{:>8} {:>12.3f} {:>12.3f} {:>9.1f} {:>8}'.format(size, elapsed, legacy_elapsed, legacy_elapsed / elapsed, str(same)))
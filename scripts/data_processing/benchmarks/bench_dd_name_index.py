@@ -0,0 +1,148 @@
+"""
+Micro-benchmark of the approximate DD name index (name_index.NameIndex) on synthetic deepdao orgs:
+build time, query latency and how often the perturbed name of an org ranks it first,
+compared with a pairwise difflib scan on a few queries
+
+    python benchmarks/bench_dd_name_index.py --sizes 10000 50000 --queries 2000
+"""
+# =============================================================================
+
+import os
+import sys
+import random
+import time
+import difflib
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import numpy as np
+import config
+from name_index import NameIndex, normalize_name
+
+#consonant-vowel(-consonant) syllables, about the trigram diversity of real project names
+SYLLABLES = [c + v + e for c in 'bcdfghklmnprstvwxz' for v in 'aeiouy' for e in ['', '', 'n', 'r', 'x', 'l']]
+SUFFIXES = ['', '', ' DAO', ' Finance', ' Protocol', ' Collective', ' Labs']
+TLDS = ['org', 'com', 'xyz', 'io', 'fi', 'finance']
+
+
+def make_orgs(n_orgs, seed=0):
+    """
+    synthetic org records with unique base names
+    """
+    rnd = random.Random(seed)
+    orgs = []
+    seen = set()
+    while len(orgs) < n_orgs:
+        base = ''.join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4)))
+        if base in seen:
+            continue
+        seen.add(base)
+        orgs.append({
+            'name': base.capitalize() + rnd.choice(SUFFIXES),
+            'dd_eth_names': ['{}.eth'.format(base)] if rnd.random() < 0.3 else [],
+            'website': 'https://{}{}.{}'.format(rnd.choice(['', 'www.', 'app.']), base, rnd.choice(TLDS)) if rnd.random() < 0.8 else '',
+            'twitter': '{}{}'.format(base, rnd.choice(['', 'dao', '_fi'])) if rnd.random() < 0.7 else '',
+        })
+    return orgs
+
+
+def perturb(text, rnd):
+    """
+    one typo: a dropped, swapped or replaced character
+    """
+    if len(text) < 4:
+        return text
+    i = rnd.randrange(1, len(text) - 1)
+    kind = rnd.randrange(3)
+    if kind == 0:
+        return text[:i] + text[i + 1:]
+    if kind == 1:
+        return text[:i - 1] + text[i] + text[i - 1] + text[i + 1:]
+    return text[:i] + rnd.choice('abcdefghijklmnopqrstuvwxyz') + text[i + 1:]
+
+
+def make_queries(orgs, n_queries, seed=1):
+    """
+    snapshot-like spaces for random orgs: renamed eth name, typo in the name, same website
+    """
+    rnd = random.Random(seed)
+    queries = []
+    for org_idx in rnd.sample(range(len(orgs)), min(n_queries, len(orgs))):
+        org = orgs[org_idx]
+        base = normalize_name(org['name'])
+        name = perturb(org['name'], rnd) if rnd.random() < 0.7 else org['name'].upper()
+        eth_name = '{}{}.eth'.format(base, rnd.choice(['', 'dao', 'gov']))
+        website = org['website'] if rnd.random() < 0.5 else ''
+        queries.append((org_idx, NameIndex.get_query_keys(eth_name, name, website, None)))
+    return queries
+
+
+def pairwise_search(orgs, keys):
+    """
+    reference: best difflib ratio of the query keys against every org name
+    """
+    best = (None, 0)
+    for org_idx, org in enumerate(orgs):
+        org_key = normalize_name(org['name'])
+        for key in keys:
+            if key == '':
+                continue
+            score = difflib.SequenceMatcher(None, key, org_key).ratio()
+            if score > best[1]:
+                best = (org_idx, score)
+    return best
+
+
+def run(n_orgs, n_queries, n_pairwise):
+    orgs = make_orgs(n_orgs)
+    queries = make_queries(orgs, n_queries)
+
+    start_time = time.perf_counter()
+    index = NameIndex.from_records(orgs)
+    build_s = time.perf_counter() - start_time
+
+    #ranked candidates (DD_FUZZY_CANDIDATE_MIN_SCORE) and the DDDAOIndex.lookup path (top 1 above the threshold)
+    ranked_latencies = []
+    lookup_latencies = []
+    n_top1 = 0
+    n_accepted = 0
+    n_accepted_correct = 0
+    for org_idx, keys in queries:
+        start_time = time.perf_counter()
+        candidates = index.search(keys, top_k=5)
+        ranked_latencies.append(time.perf_counter() - start_time)
+        if candidates and candidates[0][0] == org_idx:
+            n_top1 += 1
+
+        start_time = time.perf_counter()
+        candidates = index.search(keys, top_k=1, min_score=config.DD_FUZZY_MATCH_THRESHOLD)
+        lookup_latencies.append(time.perf_counter() - start_time)
+        if candidates:
+            n_accepted += 1
+            n_accepted_correct += candidates[0][0] == org_idx
+    ranked_latencies = np.array(ranked_latencies) * 1000
+    lookup_latencies = np.array(lookup_latencies) * 1000
+
+    start_time = time.perf_counter()
+    for _, keys in queries[:n_pairwise]:
+        pairwise_search(orgs, keys)
+    pairwise_ms = (time.perf_counter() - start_time) * 1000 / max(min(n_pairwise, len(queries)), 1)
+
+    print('{:>8} {:>9.2f} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f} {:>8.1%} {:>9.1%} {:>10.1%} {:>12.1f}'.format(
+        n_orgs, build_s, np.mean(ranked_latencies), np.percentile(ranked_latencies, 99),
+        np.mean(lookup_latencies), np.percentile(lookup_latencies, 99),
+        n_top1 / len(queries), n_accepted / len(queries), n_accepted_correct / max(n_accepted, 1), pairwise_ms))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--sizes", dest="sizes", type=int, nargs='+', default=[10000, 50000])
+    parser.add_argument("--queries", dest="queries", type=int, default=2000)
+    parser.add_argument("--pairwise-queries", dest="pairwise_queries", type=int, default=20,
+                        help="queries timed with the pairwise difflib scan")
+    args = parser.parse_args()
+
+    print('{:>8} {:>9} {:>10} {:>10} {:>10} {:>10} {:>8} {:>9} {:>10} {:>12}'.format(
+        'orgs', 'build_s', 'ranked_ms', 'ranked_p99', 'lookup_ms', 'lookup_p99', 'top1', 'accepted', 'precision', 'pairwise_ms'))
+    for n_orgs in args.sizes:
+        run(n_orgs, args.queries, args.pairwise_queries)
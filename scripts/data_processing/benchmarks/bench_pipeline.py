@@ -0,0 +1,174 @@
+"""
+Offline end to end benchmark of the pipeline against the local stand-in server (mock_server.py).
+Runs the deepdao crawl, collect_snapshot_orgs_data and format_curated_data and reports per stage
+the wall time, requests per host, requests per second and peak memory
+
+    python benchmarks/bench_pipeline.py --spaces 2000 --orgs 500 --limit 200 --latency-ms 50
+"""
+# =============================================================================
+
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import config
+import mock_server
+
+
+def run_stage(name, server, trace_memory, fn, *args):
+    """
+    run one stage and measure it
+    """
+    counts_before = dict(server.counts)
+    if trace_memory:
+        tracemalloc.start()
+    start_time = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - start_time
+    peak_memory = None
+    if trace_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    requests_by_host = {}
+    for (host, kind), count in server.counts.items():
+        delta = count - counts_before.get((host, kind), 0)
+        if delta > 0:
+            requests_by_host['{}:{}'.format(host, kind)] = delta
+    n_requests = sum(v for k, v in requests_by_host.items() if k.endswith(':requests'))
+    return {
+        'stage': name,
+        'wall_s': round(elapsed, 3),
+        'requests': n_requests,
+        'requests_per_s': round(n_requests / elapsed, 1) if elapsed > 0 else None,
+        'peak_traced_bytes': peak_memory,
+        'requests_by_host': requests_by_host,
+    }
+
+
+def curate(collect_file, curated_file):
+    """
+    stands in for the manual curation : every collected DAO is marked clean
+    """
+    import pandas as pd
+    df = pd.read_csv(collect_file, index_col=0)
+    df['mission'] = df['about']
+    df['data_clean_status'] = 'Y'
+    df.to_csv(curated_file)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    mock_server.add_server_arguments(parser)
+    parser.add_argument("--limit", dest="limit", type=int, default=100, help="MAX_ORG_PARSE_LIMIT")
+    parser.add_argument("--workdir", dest="workdir", default=None, help="where the outputs are written, temporary by default")
+    parser.add_argument("--rate", dest="rate", type=float, nargs=2, default=[50, 500], metavar=('INITIAL', 'MAX'),
+                        help="initial and max request rate of every host, the live api defaults are too slow for a local server")
+    parser.add_argument("--networks", dest="networks", nargs='+', default=None,
+                        help="COLLECT_NETWORKS, every network with a Covalent chain by default")
+    parser.add_argument("--no-chain-shards", dest="no_chain_shards", action="store_true",
+                        help="one rate limiter and connection pool for all the Covalent chains")
+    parser.add_argument("--nlp", dest="nlp", action="store_true", help="extract the tags with spaCy in expand")
+    parser.add_argument("--trace-memory", dest="trace_memory", action="store_true",
+                        help="report the peak python memory of each stage (slows the run down)")
+    parser.add_argument("--json", dest="json_file", default=None, help="write the report as json")
+    parser.add_argument("--metrics-json", dest="metrics_json", default=None, help="write the pipeline run metrics as json")
+    parser.add_argument("--metrics-prom", dest="metrics_prom", default=None, help="write the pipeline run metrics as a prometheus textfile")
+    parser.add_argument("--verbose", dest="verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(asctime)s %(message)s")
+
+    server = mock_server.make_server(args).start()
+    workdir = args.workdir or tempfile.mkdtemp(prefix='dao_bench_')
+    os.makedirs(workdir, exist_ok=True)
+
+    config.HTTP_HOST_OVERRIDES = server.get_host_overrides()
+    config.HTTP_CACHE_MODE = 'off'
+    config.ORG_INFOS_FILE = os.path.join(workdir, 'dd_org_infos.csv')
+    config.DD_CRAWL_DIR = os.path.join(workdir, 'dd_raw')
+    config.MAX_ORG_PARSE_LIMIT = args.limit
+    config.HTTP_HOST_RATES = {host: tuple(args.rate) for host in mock_server.HOSTS}
+    config.NLP_ENABLED = args.nlp
+    if args.networks is not None:
+        config.COLLECT_NETWORKS = args.networks
+    if args.no_chain_shards:
+        config.HTTP_SHARDED_HOSTS = {}
+
+    from dd_dao_download import DDDAODownloader
+    from dao_extract import collect_snapshot_orgs_data, format_curated_data, COLLECT_COLUMNS, EXPAND_COLUMNS
+    from output_writer import CheckpointedWriter
+
+    collect_file = os.path.join(workdir, 'dao_list.csv')
+    curated_file = os.path.join(workdir, 'dao_list_curated.csv')
+    expand_file = os.path.join(workdir, 'dao_list_updated.csv')
+
+    def collect():
+        writer = CheckpointedWriter(collect_file, COLLECT_COLUMNS)
+        try:
+            collect_snapshot_orgs_data(writer=writer)
+        finally:
+            writer.close()
+
+    def expand():
+        writer = CheckpointedWriter(expand_file, EXPAND_COLUMNS)
+        try:
+            format_curated_data(curated_file, writer=writer)
+        finally:
+            writer.close()
+
+    total_start = time.perf_counter()
+    stages = [
+        run_stage('dd_crawl', server, args.trace_memory, DDDAODownloader.load_data, config.ORG_INFOS_FILE),
+        run_stage('collect', server, args.trace_memory, collect),
+        run_stage('curate', server, args.trace_memory, curate, collect_file, curated_file),
+        run_stage('expand', server, args.trace_memory, expand),
+    ]
+    total_elapsed = time.perf_counter() - total_start
+
+    with open(collect_file) as f:
+        n_collected = sum(1 for _ in f) - 1
+    with open(expand_file) as f:
+        n_expanded = sum(1 for _ in f) - 1
+
+    report = {
+        'params': vars(args),
+        'workdir': workdir,
+        'stages': stages,
+        'total_wall_s': round(total_elapsed, 3),
+        'total_requests': sum(stage['requests'] for stage in stages),
+        'rows': {'collect': n_collected, 'expand': n_expanded},
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+    print('{:<10} {:>9} {:>9} {:>10} {:>14}'.format('stage', 'wall_s', 'requests', 'req_per_s', 'peak_traced_kb'))
+    for stage in stages:
+        peak = '-' if stage['peak_traced_bytes'] is None else str(stage['peak_traced_bytes'] // 1024)
+        print('{:<10} {:>9.3f} {:>9} {:>10} {:>14}'.format(stage['stage'], stage['wall_s'], stage['requests'],
+                                                        str(stage['requests_per_s']), peak))
+    print('total {:.3f}s, {} requests, rows collect/expand {}/{}, max rss {} kb'.format(
+        total_elapsed, report['total_requests'], n_collected, n_expanded, report['max_rss_kb']))
+    for stage in stages:
+        print('  {}: {}'.format(stage['stage'], stage['requests_by_host']))
+
+    if args.json_file is not None:
+        with open(args.json_file, 'w') as f:
+            json.dump(report, f, indent=4)
+
+    import http_util
+    print('request rates: {}'.format(http_util.get_host_rates()))
+
+    import metrics
+    if args.metrics_json is not None:
+        metrics.write_json(args.metrics_json)
+    if args.metrics_prom is not None:
+        metrics.write_prometheus(args.metrics_prom)
+
+    server.shutdown()
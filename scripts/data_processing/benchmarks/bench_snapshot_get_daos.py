@@ -0,0 +1,71 @@
+"""
+Benchmarks the parsing of the snapshot explore payload (SnapshotDAOLoader.parse_daos)
+on synthetic payloads of growing size, the time per space should stay flat
+
+    python benchmarks/bench_snapshot_get_daos.py --sizes 12500 25000 50000 100000
+"""
+# =============================================================================
+
+import os
+import sys
+import random
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from snapshot_dao import SnapshotDAOLoader
+
+CATEGORIES = ['protocol', 'social', 'investment', 'grant', 'service', 'media', 'creator', 'collector', 'gaming']
+
+
+def make_payload(n_spaces, seed=0):
+    """
+    synthetic explore payload with n_spaces spaces, 0 to 3 categories each
+    """
+    rnd = random.Random(seed)
+    return {
+        'space-{}.eth'.format(i): {
+            'name': 'Space {}'.format(i),
+            'categories': rnd.sample(CATEGORIES, rnd.randint(0, 3)),
+            'followers': int(rnd.paretovariate(1.2)),
+            'network': rnd.choice(['1', '1', '1', '137', '56']),
+        }
+        for i in range(n_spaces)
+    }
+
+
+def legacy_parse_daos(dao_spaces):
+    """
+    the list concatenation based parsing, kept as the reference
+    """
+    category_list = []
+    for dao_name in dao_spaces:
+        category_list = category_list + dao_spaces[dao_name].get('categories',[])
+    dao_list = []
+    for k,v in dao_spaces.items():
+        categories = v.get('categories',['NA']) 
+        categories = categories if len(categories) > 0 else ['NA']
+        dao_list = dao_list + [(c, k, v['name'], v.get('followers',0)) for c in categories]
+    return dao_list
+
+
+def timed(fn, *args):
+    start_time = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start_time
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--sizes", dest="sizes", type=int, nargs='+', default=[12500, 25000, 50000, 100000])
+    parser.add_argument("--top-k", dest="top_k", type=int, default=None)
+    parser.add_argument("--legacy-max-size", dest="legacy_max_size", type=int, default=25000,
+                        help="largest size the legacy parsing is timed on")
+    args = parser.parse_args()
+
+    print('{:>10} {:>12} {:>16} {:>12}'.format('spaces', 'parse_s', 'us_per_space', 'legacy_s'))
+    for size in args.sizes:
+        payload = make_payload(size)
+        elapsed = timed(SnapshotDAOLoader.parse_daos, payload, args.top_k)
+        legacy = '{:.3f}'.format(timed(legacy_parse_daos, payload)) if size <= args.legacy_max_size else '-'
+        print('{:>10} {:>12.3f} {:>16.2f} {:>12}'.format(size, elapsed, elapsed / size * 1e6, legacy))
@@ -0,0 +1,337 @@
+"""
+Local stand-in for the Snapshot, DeepDAO, Covalent, Discord and Twitter APIs of config.py,
+serving synthetic payloads of configurable size with injectable latency, errors and 429s,
+or a per-host rate limit enforced like a real provider (429 + Retry-After, X-RateLimit-* headers),
+per chain for Covalent. Spaces are spread over several networks, one of which Covalent does not support.
+
+Requests are expected on /<original host>/<original path>, see MockAPIServer.get_host_overrides
+(to be set as config.HTTP_HOST_OVERRIDES). Can also run standalone:
+
+    python benchmarks/mock_server.py --port 8765 --spaces 2000 --orgs 500
+"""
+# =============================================================================
+
+import json
+import random
+import re
+import threading
+import time
+from argparse import ArgumentParser
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+SNAPSHOT_HOST = 'hub.snapshot.org'
+DD_HOST = 'golden-gate-server.deepdao.io'
+COVALENT_HOST = 'api.covalenthq.com'
+DISCORD_HOST = 'discord.com'
+TWITTER_HOST = 'api.twitter.com'
+HOSTS = [SNAPSHOT_HOST, DD_HOST, COVALENT_HOST, DISCORD_HOST, TWITTER_HOST]
+
+#snapshot network ids and their share of the spaces
+NETWORKS = [('1', 0.6), ('137', 0.2), ('42161', 0.1), ('10', 0.05), ('1666600000', 0.05)]
+COVALENT_CHAIN_PATTERN = re.compile(r'^/v1/(?:pricing/historical_by_addresses_v2/)?(\d+)/')
+
+CATEGORIES = ['protocol', 'social', 'investment', 'grant', 'service', 'media', 'creator', 'collector', 'gaming']
+WORDS = ['decentralized', 'protocol', 'community', 'governance', 'lending', 'liquidity', 'artists', 'builders',
+            'ethereum', 'grants', 'treasury', 'collective', 'music', 'games', 'network', 'open']
+
+
+class SyntheticData:
+    """
+    Consistent synthetic dataset: space i in snapshot is org i in deepdao (for i < n_orgs)
+    with its own treasury wallet holding its governance token TK<i>
+    """
+
+    def __init__(self, n_spaces, n_orgs, n_holders, tokens_per_wallet=20, seed=0):
+        self.n_spaces = n_spaces
+        self.n_orgs = min(n_orgs, n_spaces)
+        self.n_holders = n_holders
+        self.tokens_per_wallet = tokens_per_wallet
+        self.seed = seed
+
+    def rnd(self, *key):
+        return random.Random('{}-{}'.format(self.seed, '-'.join(str(k) for k in key)))
+
+    @staticmethod
+    def network(value):
+        """
+        network of a space from a uniform random value
+        """
+        for network, share in NETWORKS:
+            if value < share:
+                return network
+            value -= share
+        return NETWORKS[0][0]
+
+    @staticmethod
+    def eth_name(i):
+        return 'space-{}.eth'.format(i)
+
+    @staticmethod
+    def wallet(i):
+        return '0x{:040x}'.format(0xa000000000 + i)
+
+    @staticmethod
+    def contract(i):
+        return '0x{:040x}'.format(0xc000000000 + i)
+
+    @staticmethod
+    def index_of(value, pattern):
+        match = re.search(pattern, value)
+        return int(match.group(1)) if match else None
+
+    def explore(self):
+        spaces = {}
+        for i in range(self.n_spaces):
+            rnd = self.rnd('space', i)
+            spaces[self.eth_name(i)] = {
+                'name': 'Space {}'.format(i),
+                'categories': rnd.sample(CATEGORIES, rnd.randint(0, 2)),
+                'followers': self.n_spaces - i,
+                'network': self.network(rnd.random()),
+            }
+        return {'spaces': spaces}
+
+    def space(self, eth_name):
+        i = self.index_of(eth_name, r'^space-(\d+)\.eth$')
+        if i is None or i >= self.n_spaces:
+            return None
+        rnd = self.rnd('space', i)
+        rnd.sample(CATEGORIES, rnd.randint(0, 2))
+        network = self.network(rnd.random())
+        return {
+            'id': eth_name, 'name': 'Space {}'.format(i), 'about': 'About space {}'.format(i),
+            'categories': ['protocol'], 'network': network, 'avatar': 'ipfs://avatar{}'.format(i),
+            'website': 'https://space{}.org'.format(i) if i % 2 else '', 'twitter': '',
+            'symbol': 'TK{}'.format(i), 'followersCount': self.n_spaces - i, 'proposalsCount': i % 97,
+        }
+
+    def dd_summary(self):
+        return {'daosSummary': [{'organizationId': 'org-{}'.format(i), 'name': 'Space {}'.format(i),
+                                    'proposalsCount': i % 97, 'votesCount': i * 3, 'aum': float(i * 1000)}
+                                    for i in range(self.n_orgs)]}
+
+    def dd_details(self, i):
+        return {'data': {
+            'id': 'org-{}'.format(i), 'name': 'Space {}'.format(i), 'description': 'Org {}'.format(i),
+            'proposalsCount': i % 97, 'votesCount': i * 3, 'aum': float(i * 1000), 'rankings': [],
+            'socials': [
+                {'type': 'Website', 'url': 'https://space{}.org'.format(i)},
+                {'type': 'Twitter', 'url': 'https://twitter.com/space{}'.format(i)},
+                {'type': 'Discord', 'url': 'https://discord.gg/invite{}'.format(i)},
+            ],
+        }}
+
+    def dd_assets(self, i):
+        return {'data': [
+            {'type': 'treasury', 'address': self.wallet(i), 'description': None},
+            {'type': 'governance', 'address': self.eth_name(i), 'description': 'Snapshot space'},
+        ]}
+
+    def balances(self, wallet):
+        i = int(wallet, 16) - 0xa000000000
+        rnd = self.rnd('balances', i)
+        items = [{'contract_ticker_symbol': 'TK{}'.format(i), 'contract_address': self.contract(i),
+                    'quote_rate': 1.5, 'quote': 1000.0 * (i + 1), 'logo_url': 'https://logos/{}.png'.format(i),
+                    'nft_data': None, 'balance': str(10 ** 21)}]
+        for j in range(self.tokens_per_wallet - 1):
+            items.append({'contract_ticker_symbol': 'OTHER{}'.format(j), 'contract_address': self.contract(10 ** 6 + j),
+                            'quote_rate': rnd.random() * 10, 'quote': rnd.random() * 1e4,
+                            'logo_url': 'https://logos/other{}.png'.format(j), 'nft_data': None, 'balance': '1'})
+        return {'data': {'address': wallet, 'items': items}}
+
+    def prices(self, addresses):
+        return {'data': [{'contract_address': address, 'prices': [{'price': 1.5}]} for address in addresses]}
+
+    def token_holders(self, contract, page_size):
+        n_items = min(page_size, self.n_holders)
+        items = [{'address': '0x{:040x}'.format(k), 'balance': '1', 'total_supply': str(10 ** 24),
+                    'contract_decimals': 18} for k in range(n_items)]
+        return {'data': {'items': items, 'pagination': {'total_count': self.n_holders}}}
+
+    def discord_invite(self, invite):
+        return {'code': invite, 'approximate_member_count': 100 + len(invite)}
+
+    def twitter_user(self, screen_name):
+        rnd = self.rnd('twitter', screen_name)
+        return {'screen_name': screen_name, 'followers_count': rnd.randint(10, 10 ** 5),
+                'description': ' '.join(rnd.choice(WORDS) for _ in range(12))}
+
+
+class MockAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        self.handle_request()
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_request(self):
+        server = self.server
+        parts = urlsplit(self.path)
+        host, _, path = parts.path.lstrip('/').partition('/')
+        path = '/' + path
+        query = parse_qs(parts.query)
+        body = None
+        if self.headers.get('Content-Length'):
+            body = self.rfile.read(int(self.headers['Content-Length']))
+
+        server.record(host)
+        if server.latency_ms > 0:
+            time.sleep(server.latency_ms / 1000.0)
+
+        rate_limit_headers = {}
+        if server.host_rate_limit > 0:
+            allowed, rate_limit_headers = server.take_token(server.get_limit_key(host, path))
+            if not allowed:
+                server.record(host, '429')
+                return self.send_json(429, {'error': 'rate limited'}, rate_limit_headers)
+
+        rnd = random.random()
+        if rnd < server.rate_limit_rate:
+            server.record(host, '429')
+            return self.send_json(429, {'error': 'rate limited'}, {'Retry-After': str(server.retry_after)})
+        if rnd < server.rate_limit_rate + server.error_rate:
+            server.record(host, '500')
+            return self.send_json(500, {'error': 'internal error'})
+
+        status, payload = server.route(host, path, query, body)
+        self.send_json(status, payload, rate_limit_headers)
+
+
+class MockAPIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, data, port=0, latency_ms=0, error_rate=0.0, rate_limit_rate=0.0, retry_after=1, host_rate_limit=0):
+        super().__init__(('127.0.0.1', port), MockAPIHandler)
+        self.data = data
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.host_rate_limit = host_rate_limit
+        self.counts = Counter()
+        self.counts_lock = threading.Lock()
+        #host -> (tokens, updated at), buckets of one second of requests
+        self.buckets = {}
+        self.buckets_lock = threading.Lock()
+
+    @staticmethod
+    def get_limit_key(host, path):
+        """
+        the host, with the chain for Covalent whose limits apply per chain
+        """
+        match = COVALENT_CHAIN_PATTERN.match(path) if host == COVALENT_HOST else None
+        return host if match is None else '{}/{}'.format(host, match.group(1))
+
+    def take_token(self, host):
+        """
+        token bucket of host_rate_limit requests per second of a host (or limit key),
+        returns (allowed, rate limit headers)
+        """
+        capacity = self.host_rate_limit
+        with self.buckets_lock:
+            now = time.monotonic()
+            tokens, updated_at = self.buckets.get(host, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * self.host_rate_limit)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[host] = (tokens, now)
+        headers = {
+            'X-RateLimit-Limit': str(int(capacity)),
+            'X-RateLimit-Remaining': str(int(tokens)),
+            'X-RateLimit-Reset-After': '{:.3f}'.format((capacity - tokens) / self.host_rate_limit),
+        }
+        if not allowed:
+            headers['Retry-After'] = '{:.3f}'.format((1 - tokens) / self.host_rate_limit)
+        return allowed, headers
+
+    def record(self, host, kind='requests'):
+        with self.counts_lock:
+            self.counts[(host, kind)] += 1
+
+    def get_host_overrides(self):
+        base_url = 'http://127.0.0.1:{}'.format(self.server_address[1])
+        return {host: '{}/{}'.format(base_url, host) for host in HOSTS}
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def route(self, host, path, query, body):
+        data = self.data
+        if host == SNAPSHOT_HOST and path == '/api/explore':
+            return 200, data.explore()
+        if host == SNAPSHOT_HOST and path.startswith('/graphql'):
+            variables = json.loads(body or b'{}').get('variables', {})
+            spaces = [data.space(eth_name) for eth_name in variables.get('ids', [])]
+            return 200, {'data': {'spaces': [space for space in spaces if space is not None]}}
+
+        if host == DD_HOST and path.startswith('/dashboard/'):
+            return 200, data.dd_summary()
+        if host == DD_HOST and path.startswith('/organization/'):
+            i = data.index_of(path, r'/org-(\d+)')
+            if i is None or i >= data.n_orgs:
+                return 404, {'error': 'not found'}
+            return 200, data.dd_assets(i) if path.endswith('/assets') else data.dd_details(i)
+
+        if host == COVALENT_HOST and '/balances_v2/' in path:
+            return 200, data.balances(path.split('/address/')[1].split('/')[0])
+        if host == COVALENT_HOST and '/pricing/' in path:
+            return 200, data.prices(path.split('/USD/')[1].split('/')[0].split(','))
+        if host == COVALENT_HOST and '/token_holders/' in path:
+            page_size = int(query.get('page-size', ['100'])[0])
+            return 200, data.token_holders(path.split('/tokens/')[1].split('/')[0], page_size)
+
+        if host == DISCORD_HOST and path.startswith('/api/v9/invites/'):
+            return 200, data.discord_invite(path.rsplit('/', 1)[-1])
+        if host == TWITTER_HOST and path.startswith('/1.1/users/show.json'):
+            return 200, data.twitter_user(query.get('screen_name', [''])[0])
+
+        return 404, {'error': 'no route for {}{}'.format(host, path)}
+
+
+def add_server_arguments(parser):
+    parser.add_argument("--spaces", dest="n_spaces", type=int, default=2000, help="snapshot spaces")
+    parser.add_argument("--orgs", dest="n_orgs", type=int, default=500, help="deepdao orgs")
+    parser.add_argument("--holders", dest="n_holders", type=int, default=10000, help="token holders per token")
+    parser.add_argument("--latency-ms", dest="latency_ms", type=float, default=20)
+    parser.add_argument("--error-rate", dest="error_rate", type=float, default=0.0, help="share of 500 responses")
+    parser.add_argument("--rate-limit-rate", dest="rate_limit_rate", type=float, default=0.0, help="share of 429 responses")
+    parser.add_argument("--retry-after", dest="retry_after", type=int, default=1, help="Retry-After of the 429 responses")
+    parser.add_argument("--host-rate-limit", dest="host_rate_limit", type=float, default=0,
+                        help="requests per second accepted per host, 0 for no limit")
+
+
+def make_server(args, port=0):
+    data = SyntheticData(args.n_spaces, args.n_orgs, args.n_holders)
+    return MockAPIServer(data, port, args.latency_ms, args.error_rate, args.rate_limit_rate, args.retry_after,
+                         args.host_rate_limit)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--port", dest="port", type=int, default=8765)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = make_server(args, args.port)
+    print('serving on port {}, set config.HTTP_HOST_OVERRIDES to:'.format(args.port))
+    print(json.dumps(server.get_host_overrides(), indent=4))
+    server.serve_forever()
@@ -1,19 +1,159 @@
 SNAPSHOT_DAO_LIST_URL = 'https://hub.snapshot.org/api/explore'
 SNAPSHOT_GRAPHQL_URL = 'https://hub.snapshot.org/graphql?'
 
-#If this file is not available, the program will automatically generate it but it will take ~30 minutes to load
-ORG_INFOS_FILE = 'data/dd_org_infos.csv' 
+#If this file is not available, the program will automatically generate it (see the DD crawl settings below)
+ORG_INFOS_FILE = 'data/dd_org_infos.csv' #.parquet / .feather are also supported (requires pyarrow)
 DD_ORGS_URL = "https://golden-gate-server.deepdao.io/dashboard/ksdf3ksa-937slj3"
 DD_ORGS_DETAILS_URL = "https://golden-gate-server.deepdao.io/organization/ksdf3ksa-937slj3/{}"
 DD_ORGS_ASSETS_URL = "https://golden-gate-server.deepdao.io/organization/ksdf3ksa-937slj3/{}/assets"
 
 COVALENT_BALANCES_API_URL = "https://api.covalenthq.com/v1/{}/address/{}/balances_v2/?key={}"
-COVALENT_PRICING_API_URL = "https://api.covalenthq.com/v1/pricing/historical_by_addresses_v2/1/USD/{}/?&key={}"
-COVALENT_TOKEN_HOLDERS_API_URL = "https://api.covalenthq.com/v1/1/tokens/{}/token_holders/?page-size=200000&key={}"
+COVALENT_PRICING_API_URL = "https://api.covalenthq.com/v1/pricing/historical_by_addresses_v2/{}/USD/{}/?&key={}"
+COVALENT_TOKEN_HOLDERS_API_URL = "https://api.covalenthq.com/v1/{}/tokens/{}/token_holders/?page-size=1&key={}"
 COVALENT_API_KEY = ""
+#Snapshot network id -> (Covalent chain id, network name)
+COVALENT_CHAINS = {
+    '1': (1, 'Ethereum Mainnet'),
+    '10': (10, 'Optimism'),
+    '56': (56, 'BNB Chain'),
+    '100': (100, 'Gnosis'),
+    '137': (137, 'Polygon'),
+    '250': (250, 'Fantom'),
+    '42161': (42161, 'Arbitrum'),
+    '43114': (43114, 'Avalanche'),
+}
 
 DISCORD_API_URL = "https://discord.com/api/v9/invites/{}?with_counts=true&with_expiration=true"
 TWITTER_API_URL = "https://api.twitter.com/1.1/users/show.json?screen_name={}"
 
 TWITTER_BEARER_TOKEN = ""
-MAX_ORG_PARSE_LIMIT = 50
\ No newline at end of file
+MAX_ORG_PARSE_LIMIT = 50
+
+#Concurrency settings for collect mode
+COLLECT_WORKERS = 16
+COLLECT_PREFETCH_WINDOW = 32 #orgs submitted ahead of the one being consumed, never more than the rows still needed
+COLLECT_SNAPSHOT_LOOKAHEAD_BATCHES = 1 #snapshot batches fetched ahead of the one being consumed
+COLLECT_NETWORKS = list(COVALENT_CHAINS) #snapshot networks collected, they need a Covalent chain
+DEFAULT_HOST_CONCURRENCY = 4
+HOST_CONCURRENCY_LIMITS = {
+    'hub.snapshot.org': 8,
+    'api.covalenthq.com': 8, #all the chains
+    'api.covalenthq.com/*': 4, #each chain
+    'discord.com': 2,
+    'api.twitter.com': 4,
+}
+
+#DeepDAO crawl settings, raw responses are checkpointed per org so an interrupted crawl resumes
+#(the request rate is set in HTTP_HOST_RATES)
+DD_CRAWL_DIR = 'data/dd_raw'
+DD_CRAWL_WORKERS = 8
+
+#DeepDAO incremental refresh (main.py --refresh-dd): orgs whose summary fields changed
+#or whose record is older than the max age are fetched again
+DD_REFRESH_DIFF_FIELDS = ['proposalscount', 'votescount', 'aum']
+DD_REFRESH_MAX_AGE_HOURS = 24 * 7
+
+#Approximate matching of snapshot spaces to DeepDAO orgs, used when neither the eth name nor the name match exactly.
+#Names, eth names, website domains and twitter handles are compared, a candidate is accepted above the threshold
+DD_FUZZY_MATCH_ENABLED = True
+DD_FUZZY_MATCH_THRESHOLD = 0.8 #dice similarity of the character trigrams, 1 for identical keys
+DD_FUZZY_CANDIDATE_MIN_SCORE = 0.5 #lowest score of the ranked candidates, the lower the slower the search
+DD_FUZZY_MIN_KEY_LENGTH = 3
+DD_FUZZY_STOPWORDS = ['dao', 'the', 'finance', 'protocol', 'network', 'governance', 'official']
+DD_FUZZY_SHARED_DOMAINS = ['github.com', 'github.io', 'medium.com', 'gitbook.io', 'notion.site', 'mirror.xyz',
+                            'substack.com', 'linktr.ee', 'twitter.com', 'discord.gg', 'snapshot.org', 'eth.limo']
+
+#HTTP response cache shared by all loaders
+#HTTP_CACHE_MODE : 'on', 'off' or 'replay' (serve only from the cache, never hit the network)
+HTTP_CACHE_MODE = 'on'
+HTTP_CACHE_DIR = 'data/http_cache'
+HTTP_CACHE_MAX_BYTES = 512 * 1024 * 1024
+HTTP_CACHE_DEFAULT_TTL = 60 * 60
+HTTP_CACHE_TTLS = {
+    'hub.snapshot.org': 60 * 60,
+    'golden-gate-server.deepdao.io': 6 * 60 * 60,
+    'api.covalenthq.com': 60 * 60,
+    'discord.com': 60 * 60,
+    'api.twitter.com': 60 * 60,
+}
+HTTP_CACHE_SECRET_PARAMS = ['key'] #query params left out of the cache key and of the stored url
+
+SNAPSHOT_BATCH_SIZE = 100 #spaces fetched per snapshot graphql request
+
+#Covalent batch fetches in expand mode
+COVALENT_PRICING_BATCH_SIZE = 50 #contract addresses per pricing request
+COVALENT_BATCH_WORKERS = 4 #per chain, the chains are prefetched concurrently
+
+EXPAND_STAGE_WORKERS = 8 #fetch stages of a DAO run concurrently in expand mode
+
+#NLP settings for the twitter description keywords
+NLP_ENABLED = True #when disabled the tags are left empty and spaCy is never loaded
+NLP_EXCLUDED_COMPONENTS = ['parser', 'ner', 'lemmatizer']
+NLP_BATCH_SIZE = 64
+NLP_PROCESSES = 1
+
+#HTTP transport settings
+HTTP_POOL_SIZE = 16 #keep-alive connections per host
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_READ_TIMEOUT = 30
+HTTP_MAX_RETRIES = 4
+HTTP_BACKOFF_BASE = 0.5 #seconds, doubled on each retry
+HTTP_BACKOFF_MAX = 30
+HTTP_HOST_OVERRIDES = {} #host -> base url, used to point the loaders to a local stand-in server
+
+#Adaptive request rates per host (additive increase / multiplicative decrease):
+#(initial, max) requests per second, increased by HTTP_RATE_INCREASE after each successful response
+#and multiplied by HTTP_RATE_DECREASE on each 429. Retry-After and RateLimit headers pause or cap a host
+HTTP_DEFAULT_RATE = (10, 50)
+HTTP_HOST_RATES = {
+    'hub.snapshot.org': (10, 50),
+    'golden-gate-server.deepdao.io': (4, 20),
+    'api.covalenthq.com': (5, 20),
+    'discord.com': (2, 10),
+    'api.twitter.com': (1, 15),
+}
+HTTP_RATE_MIN = 0.2
+HTTP_RATE_INCREASE = 0.25
+HTTP_RATE_DECREASE = 0.5
+HTTP_RATE_DECREASE_COOLDOWN = 1 #seconds
+HTTP_RATE_BURST = 4 #requests a host can take at once after an idle period
+HTTP_MAX_RATE_LIMIT_RETRIES = 8 #429 responses retried, on top of HTTP_MAX_RETRIES
+#Hosts whose rate limiter, concurrency slots and connection pool are split per shard of the url path
+#(the chain of the Covalent APIs). A shard uses the HTTP_HOST_RATES / HOST_CONCURRENCY_LIMITS entry
+#of '<host>/<shard>' if any, else the one of '<host>/*', else the one of the host.
+#The quota of a Covalent API key is shared by all chains: the requests of every shard also go through
+#the rate limiter and the slots of the host, its entry bounds the total
+HTTP_SHARDED_HOSTS = {
+    'api.covalenthq.com': r'^/v1/(?:pricing/historical_by_addresses_v2/)?(\d+)/',
+}
+
+#Run metrics, written at the end of every run (main.py --metrics-json / --metrics-prom / --progress-interval)
+METRICS_JSON_FILE = 'data/metrics/run_metrics.json'
+METRICS_PROMETHEUS_FILE = 'data/metrics/dao_pipeline.prom' #for the node exporter textfile collector
+METRICS_PROMETHEUS_PREFIX = 'dao_pipeline'
+METRICS_LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30] #seconds
+METRICS_SOURCES = {
+    'hub.snapshot.org': 'snapshot',
+    'golden-gate-server.deepdao.io': 'deepdao',
+    'api.covalenthq.com': 'covalent',
+    'discord.com': 'discord',
+    'api.twitter.com': 'twitter',
+}
+PROGRESS_INTERVAL = 0 #seconds between progress lines, 0 disables them
+
+#History of the expand metrics, each expand run appends the values which changed since the previous run
+#(main.py --history-dir, '' disables it)
+HISTORY_DIR = 'data/history'
+HISTORY_METRICS = ['treasury_size', 'token_price_usd', 'market_cap_usd', 'num_token_holders',
+                   'discord_users_count', 'twitter_followers_count']
+
+#Local query service over the expand output (python dao_server.py --infile dao_list_updated.csv)
+DAO_SERVER_HOST = '127.0.0.1'
+DAO_SERVER_PORT = 8090
+DAO_SERVER_RELOAD_INTERVAL = 2 #seconds between checks of the file, a new file is loaded once it stops changing
+DAO_SERVER_PAGE_SIZE = 50
+DAO_SERVER_MAX_PAGE_SIZE = 500
+DAO_SERVER_CACHE_SIZE = 1024 #encoded responses kept per version of the file
+DAO_SERVER_FACETS = {'category': 'categories', 'tag': 'tags', 'network': 'network'} #filter parameter -> column
+DAO_SERVER_SORT_COLUMNS = ['name', 'treasury_size', 'twitter_followers_count', 'discord_users_count',
+                           'market_cap_usd', 'num_token_holders', 'num_proposals']
@@ -10,29 +10,176 @@ The Module fetches the below information from covalent APIs
     - market cap
     - num token holders
     - contract address (if not provided)
+on the chain of the DAO snapshot network (see COVALENT_CHAINS in config)
 """
 # =============================================================================
 
-import requests
+import logging
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import http_util
 import config
+import metrics
 
 COVALENT_API_KEY = config.COVALENT_API_KEY
 COVALENT_BALANCES_API_URL = config.COVALENT_BALANCES_API_URL
 COVALENT_PRICING_API_URL = config.COVALENT_PRICING_API_URL
 COVALENT_TOKEN_HOLDERS_API_URL = config.COVALENT_TOKEN_HOLDERS_API_URL
+MAX_QUOTE_RATE = 80000 #some tokens are with insane quote_rates eg mini wth.
+
+
+def get_network_id(network):
+    """
+    snapshot network id as a string, network ids read back from a csv may be numbers
+    """
+    if isinstance(network, float) and network.is_integer():
+        network = int(network)
+    return str(network).strip()
+
+
+def get_chain_id(network):
+    """
+    covalent chain id of a snapshot network id, None if the network is not supported
+    """
+    chain = config.COVALENT_CHAINS.get(get_network_id(network))
+    return None if chain is None else chain[0]
+
+
+def get_network_name(network):
+    """
+    display name of a snapshot network id, the id itself if the network is not known
+    """
+    chain = config.COVALENT_CHAINS.get(get_network_id(network))
+    return get_network_id(network) if chain is None else chain[1]
+
+
+class TokenBalances:
+    """
+    Compact balances of one wallet, only the fields used by the pipeline are kept from the balances_v2 items:
+    quote rates and quotes as float arrays (None as NaN) and the contract address of each ticker
+    """
+
+    __slots__ = ('quote_rates', 'quotes', 'contract_addresses')
+
+    def __init__(self, quote_rates, quotes, contract_addresses):
+        self.quote_rates = quote_rates
+        self.quotes = quotes
+        self.contract_addresses = contract_addresses
+
+    @staticmethod
+    def from_items(items):
+        quote_rates = np.array([np.nan if item['quote_rate'] is None else item['quote_rate'] for item in items], dtype=np.float64)
+        quotes = np.array([np.nan if item['quote'] is None else item['quote'] for item in items], dtype=np.float64)
+        #the last token of a ticker wins, as with the scan it replaces
+        contract_addresses = {item['contract_ticker_symbol']: item['contract_address'] for item in items}
+        return TokenBalances(quote_rates, quotes, contract_addresses)
+
+    @staticmethod
+    def get_total_quote(balances_list):
+        """
+        sum of the token quotes of all the wallets, tokens without a quote rate or above MAX_QUOTE_RATE are left out
+        """
+        if len(balances_list) == 0:
+            return 0
+        quote_rates = np.concatenate([balances.quote_rates for balances in balances_list])
+        quotes = np.concatenate([balances.quotes for balances in balances_list])
+        return float(np.nansum(quotes[quote_rates <= MAX_QUOTE_RATE]))
+
+class CovalentBatchClient:
+    """
+    Fetches the token prices and treasury balances needed by all the DAOs of a run at once.
+    Contract and wallet addresses are deduplicated across DAOs, prices are requested
+    COVALENT_PRICING_BATCH_SIZE addresses at a time and balances once per (chain, wallet).
+    Each chain has its own workers (and its own rate limiter in http_util), the chains are fetched concurrently
+    """
+
+    def __init__(self):
+        self.token_prices = {}
+        self.token_balances = {}
+
+    @staticmethod
+    def get_chain_addresses(items):
+        """
+        distinct (chain id, lowercase address) of the (network, address) items on a supported chain
+        """
+        chain_addresses = {}
+        for network, address in items:
+            chain_id = get_chain_id(network)
+            address = str(address).strip().lower()
+            if chain_id is not None and address != '':
+                chain_addresses[(chain_id, address)] = True
+        return list(chain_addresses)
+
+    @metrics.timed('covalent', 'prefetch')
+    def prefetch(self, treasury_wallets, contract_addresses):
+        """
+        treasury_wallets : list of (network, wallet address)
+        contract_addresses : list of (network, token contract address)
+        """
+        treasury_wallets = CovalentBatchClient.get_chain_addresses(treasury_wallets)
+        contract_addresses = CovalentBatchClient.get_chain_addresses(contract_addresses)
+        chain_ids = sorted(set(chain_id for chain_id, _ in treasury_wallets + contract_addresses))
+        logging.info('covalent prefetch: {}'.format(', '.join('chain {}: {} wallets, {} contracts'.format(
+            chain_id, sum(1 for c, _ in treasury_wallets if c == chain_id),
+            sum(1 for c, _ in contract_addresses if c == chain_id)) for chain_id in chain_ids)))
+
+        executors = {chain_id: ThreadPoolExecutor(max_workers=config.COVALENT_BATCH_WORKERS) for chain_id in chain_ids}
+        try:
+            for chain_id, wallet in treasury_wallets:
+                executors[chain_id].submit(self.prefetch_token_balances, chain_id, wallet)
+
+            batch_size = config.COVALENT_PRICING_BATCH_SIZE
+            for chain_id in chain_ids:
+                addresses = [address for c, address in contract_addresses if c == chain_id]
+                for start in range(0, len(addresses), batch_size):
+                    executors[chain_id].submit(self.prefetch_token_prices, chain_id, addresses[start:start + batch_size])
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=True)
+
+    def prefetch_token_balances(self, chain_id, address):
+        try:
+            url = COVALENT_BALANCES_API_URL.format(chain_id, address, COVALENT_API_KEY)
+            response = http_util.get(url)
+            self.token_balances[(chain_id, address)] = TokenBalances.from_items(response.json()['data']['items'])
+        except Exception as e:
+            metrics.record_exception('covalent', e)
+            logging.error(traceback.format_exc())
+
+    def prefetch_token_prices(self, chain_id, contract_addresses):
+        try:
+            url = COVALENT_PRICING_API_URL.format(chain_id, ','.join(contract_addresses), COVALENT_API_KEY)
+            response = http_util.get(url)
+            for token in response.json()['data']:
+                if len(token['prices']) > 0:
+                    self.token_prices[(chain_id, token['contract_address'].lower())] = token['prices'][0]['price']
+        except Exception as e:
+            metrics.record_exception('covalent', e)
+            logging.error(traceback.format_exc())
+
+    def get_token_balances(self, chain_id, address):
+        return self.token_balances.get((chain_id, address.strip().lower()))
+
+    def get_token_price(self, chain_id, contract_address):
+        return self.token_prices.get((chain_id, contract_address.strip().lower()))
+
 
 class CovalentDAOLoader:
 
-    def __init__(self, dao_name, network, ticker_symbol, treasury_wallets, contract_address=''):
+    def __init__(self, dao_name, network, ticker_symbol, treasury_wallets, contract_address='', batch_client=None):
         self.dao_name = dao_name
+        self.batch_client = batch_client
         self.dao_info = {}
         self.dao_info['network'] = network
+        self.dao_info['chain_id'] = get_chain_id(network)
         self.dao_info['ticker_symbol'] = ticker_symbol
         self.dao_info['treasury_wallets'] = treasury_wallets
         if contract_address != '':
             self.dao_info['contract_address'] = contract_address
 
 
+    @metrics.timed('covalent', 'get_dao_info')
     def get_dao_info(self, info_level = 'all'):
         """
         fetch dao info from covalent apis
@@ -45,37 +192,47 @@ class CovalentDAOLoader:
             self.compute_treasury_size()
             self.fetch_token_price()
             self.fetch_token_stats()
+            self.compute_market_cap()
 
         return self.dao_info
 
-    def get_token_balances(self, network, address):
+    def get_chain_id(self):
         """
-        fetch token balances
+        covalent chain id of the DAO network, raises for the networks which are not supported
         """
-        url = COVALENT_BALANCES_API_URL.format(network, address, COVALENT_API_KEY)
-        response = requests.get(url)
-        return response.json()['data']['items']
+        if self.dao_info['chain_id'] is None:
+            raise ValueError('network {} is not supported by covalent'.format(self.dao_info['network']))
+        return self.dao_info['chain_id']
+
+    def get_token_balances(self, chain_id, address):
+        """
+        fetch token balances, from the batch client results if available
+        returns the compact TokenBalances of the wallet
+        """
+        if self.batch_client is not None:
+            token_balances = self.batch_client.get_token_balances(chain_id, address)
+            if token_balances is not None:
+                return token_balances
+
+        url = COVALENT_BALANCES_API_URL.format(chain_id, address, COVALENT_API_KEY)
+        response = http_util.get(url)
+        return TokenBalances.from_items(response.json()['data']['items'])
 
     def fetch_treasury_balances(self):
         """
         get token balances for each of the treasury wallet
         """
+        chain_id = self.get_chain_id()
         treasury_list = []
         for treasury_wallet in self.dao_info['treasury_wallets']:
-            treasury_list.append(self.get_token_balances(self.dao_info['network'], treasury_wallet))
+            treasury_list.append(self.get_token_balances(chain_id, treasury_wallet))
         self.dao_info['treasury_list'] = treasury_list
 
     def compute_treasury_size(self):
         """
         for each wallet, for each token, add up the balances to get the total treasury balance
         """
-        treasury_size = 0
-        for treasury in self.dao_info['treasury_list']:
-            for token in treasury:
-                if token['quote_rate'] is not None:
-                    if token['quote_rate'] <= 80000: #some tokens are with insane quote_rates eg mini wth.
-                        treasury_size = treasury_size + token['quote']
-        self.dao_info['treasury_size'] = treasury_size
+        self.dao_info['treasury_size'] = TokenBalances.get_total_quote(self.dao_info['treasury_list'])
 
 
     def fetch_contract_address(self):
@@ -84,18 +241,24 @@ class CovalentDAOLoader:
         """
         self.dao_info['contract_address'] = None
         for treasury in self.dao_info['treasury_list']:
-            for token in treasury:
-                if token['contract_ticker_symbol']==self.dao_info['ticker_symbol']:
-                    self.dao_info['contract_address'] = token['contract_address']
-                       
+            contract_address = treasury.contract_addresses.get(self.dao_info['ticker_symbol'])
+            if contract_address is not None:
+                self.dao_info['contract_address'] = contract_address
 
     def fetch_token_price(self):
         """
         retrieve the token price of the DAO token
         """
+        chain_id = self.get_chain_id()
         contract_address = self.dao_info['contract_address']
-        url = COVALENT_PRICING_API_URL.format(contract_address, COVALENT_API_KEY)
-        response = requests.get(url)
+        if self.batch_client is not None:
+            token_price = self.batch_client.get_token_price(chain_id, contract_address)
+            if token_price is not None:
+                self.dao_info['token_price'] = token_price
+                return
+
+        url = COVALENT_PRICING_API_URL.format(chain_id, contract_address, COVALENT_API_KEY)
+        response = http_util.get(url)
         self.dao_info['token_price'] = response.json()['data'][0]['prices'][0]['price']
         
      
@@ -104,12 +267,21 @@ class CovalentDAOLoader:
         fetch token status
             - token holders
             - total supply
+
+        Only the first holder is requested, the holders count comes from the pagination block
+        and total supply / decimals are repeated on every item
         """
         contract_address = self.dao_info['contract_address']
-        url = COVALENT_TOKEN_HOLDERS_API_URL.format(contract_address, COVALENT_API_KEY)
-        response = requests.get(url)
-        self.dao_info['num_voters'] = response.json()['data']['pagination']['total_count']
-        total_supply = int(response.json()['data']['items'][0]['total_supply'])
-        contract_decimals = int(response.json()['data']['items'][0]['contract_decimals'])
+        url = COVALENT_TOKEN_HOLDERS_API_URL.format(self.get_chain_id(), contract_address, COVALENT_API_KEY)
+        response = http_util.get(url)
+        data = response.json()['data']
+        self.dao_info['num_voters'] = data['pagination']['total_count']
+        total_supply = int(data['items'][0]['total_supply'])
+        contract_decimals = int(data['items'][0]['contract_decimals'])
         self.dao_info['total_supply'] = total_supply / (10 ** contract_decimals)
+
+    def compute_market_cap(self):
+        """
+        market cap from the token price and the total supply
+        """
         self.dao_info['market_cap'] = self.dao_info['total_supply'] * self.dao_info['token_price']
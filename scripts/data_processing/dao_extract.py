@@ -10,170 +10,418 @@ import logging
 import sys
 import pandas as pd
 import traceback
+from collections import deque, Counter
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 from snapshot_dao import SnapshotDAOLoader
-from dd_dao import DDDAOLoader
+from dd_dao import DDDAOLoader, DDDAOIndex
 from dd_dao_download import DDDAODownloader
-from covalent_dao import CovalentDAOLoader
+from covalent_dao import CovalentDAOLoader, CovalentBatchClient, get_network_name
 from social_dao import SocialDAOLoader
-from ml_util import get_hotwords
+from ml_util import get_hotwords_batch
 import os
 import config
+from output_writer import RowCollector, COMPLETED
+from stage_graph import StageGraph
+import storage
+import metrics
 
+COLLECT_COLUMNS = ['eth_name', 'name', 'about', 'categories', 'network', 'logo', 'website', 'twitter', 'symbol',
+                    'ss_followers_count', 'ss_proposals_count', 'treasury_address', 'description', 'discord',
+                    'discord_valid', 'twitter_valid', 'contract_address']
 
-def format_curated_data(data_path):
+EXPAND_COLUMNS = ['id', 'logo', 'name', 'mission', 'about', 'network', 'categories', 'website_url', 'discord_url',
+                    'twitter_handle', 'symbol', 'contract_address', 'discord_users_count', 'twitter_followers_count',
+                    'tags', 'treasury_size', 'num_proposals', 'token_price_usd', 'market_cap_usd', 'num_token_holders',
+                    'establishment_date']
+
+
+def build_dao_stages(social_dao_loader, covalent_dao_loader):
+    """
+    fetch stages of one DAO and their dependencies:
+    social and covalent are independent, price and holders only need the contract address,
+    which is derived from the treasury balances when the curated data does not provide it
+    """
+    graph = StageGraph()
+    graph.add('discord', social_dao_loader.fetch_discord_member_count, source='discord')
+    graph.add('twitter', social_dao_loader.fetch_twitter_stats, source='twitter')
+
+    graph.add('treasury_balances', covalent_dao_loader.fetch_treasury_balances, source='covalent')
+    graph.add('treasury_size', covalent_dao_loader.compute_treasury_size, ['treasury_balances'], 'covalent')
+    contract_inputs = []
+    if covalent_dao_loader.dao_info.get('contract_address', '') == '':
+        graph.add('contract_address', covalent_dao_loader.fetch_contract_address, ['treasury_balances'], 'covalent')
+        contract_inputs = ['contract_address']
+    graph.add('token_price', covalent_dao_loader.fetch_token_price, contract_inputs, 'covalent')
+    graph.add('token_stats', covalent_dao_loader.fetch_token_stats, contract_inputs, 'covalent')
+    graph.add('market_cap', covalent_dao_loader.compute_market_cap, ['token_price', 'token_stats'], 'covalent')
+    return graph
+
+
+def format_curated_data(data_path, writer=None):
     """
     read the manually curated data and fetch additional details
+
+    The fetches of each DAO run as a stage graph (see build_dao_stages), a failed stage
+    leaves its fields empty instead of dropping the row
+
+    Rows are handed to the writer every NLP_BATCH_SIZE DAOs (once their tags are extracted)
+    and when the run stops, DAOs the writer already completed are not processed again.
+    Without a writer the rows are returned as a dataframe
     """
-    df_curated_data = pd.read_csv(data_path)
+    collector = RowCollector() if writer is None else None
+    writer = writer or collector
 
-    dao_data_agg = []
-    for idx, row in df_curated_data[df_curated_data.data_clean_status=='Y'].iterrows():
-        logging.info("processing  {}".format(row["eth_name"]))
+    df_curated_data = storage.read_table(data_path, list_columns=['treasury_address']).reset_index(drop=True)
+    df_curated_data = df_curated_data[df_curated_data.data_clean_status=='Y']
+    df_curated_data = df_curated_data[~df_curated_data['eth_name'].map(writer.is_done)]
+    metrics.set_progress_total(len(df_curated_data))
+
+    #Fetch prices and balances of every DAO upfront, shared wallets and tokens are fetched once
+    covalent_batch_client = CovalentBatchClient()
+    covalent_batch_client.prefetch(
+        [(network, wallet) for network, treasury_address in zip(df_curated_data['network'], df_curated_data['treasury_address'])
+                                    for wallet in treasury_address],
+        [(network, str(address)) for network, address in zip(df_curated_data['network'], df_curated_data['contract_address'])
+                                    if not pd.isna(address)]
+    )
+
+    #completed rows waiting for their tags : (eth_name, dao_data, twitter description)
+    pending_rows = []
+
+    def flush_pending_rows():
+        twitter_descriptions = [description for _, _, description in pending_rows]
         try:
-            dao_data = {}
-            dao_data['id'] = idx
-            dao_data['logo'] = row['logo']
-            dao_data['name'] = row['name']
-            dao_data['mission'] = row['mission']
-            dao_data['about'] = row['about']
-            dao_data['network'] = "Ethereum Mainnet"
-            dao_data['categories'] = row['categories']
-            dao_data['website_url'] = row['website']
-            dao_data['discord_url'] = row['discord']
-            dao_data['twitter_handle'] = row['twitter']
-            dao_data['symbol'] = row['symbol']
-            dao_data['contract_address'] = row['contract_address'].strip().lower()
-
-            social_dao_loader = SocialDAOLoader(row['eth_name'], 
-                        row['discord'], 
-                        row['twitter']
-                    )
-            social_dao_info = social_dao_loader.get_dao_info()
-            dao_data['discord_users_count'] = social_dao_info['discord_member_count']
-            dao_data['twitter_followers_count'] = social_dao_info['twitter_followers_count']
-            dao_data['tags'] = get_hotwords(social_dao_info['twitter_profile_description'])
-
-            covalent_dao_loader = CovalentDAOLoader(row['eth_name'], 
-                row['network'], 
-                row['symbol'],
-                row['treasury_address'].split(','),
-                dao_data['contract_address']
-            )
-            
-            covalent_data_info = covalent_dao_loader.get_dao_info('all') 
-            dao_data['contract_address'] = covalent_data_info['contract_address']
-
-            dao_data['treasury_size'] = covalent_data_info['treasury_size']
-            dao_data['num_proposals'] = row['ss_proposals_count'] 
-            dao_data['token_price_usd'] = covalent_data_info['token_price']
-            dao_data['market_cap_usd'] = covalent_data_info['market_cap']
-            dao_data['num_token_holders'] = covalent_data_info['num_voters']
-
-            dao_data['establishment_date'] = ''
-
-            dao_data_agg.append(dao_data)
-
-        except Exception as e:
+            tags_batch = get_hotwords_batch(twitter_descriptions)
+        except Exception:
+            #same as a failed stage, the rows are written without their tags
             logging.error(traceback.format_exc())
-            print('failed for', row['eth_name'])
-            pass #Ignore failed ones and move on
+            metrics.increment('pipeline', 'partial_rows', len(pending_rows))
+            tags_batch = [None] * len(pending_rows)
+        for (eth_name, dao_data, _), tags in zip(pending_rows, tags_batch):
+            dao_data['tags'] = tags
+            writer.write_row(eth_name, dao_data)
+        pending_rows.clear()
+
+    #Columns copied as is from the curated data
+    df_dao_data = pd.DataFrame({
+        'id': df_curated_data.index,
+        'logo': df_curated_data['logo'],
+        'name': df_curated_data['name'],
+        'mission': df_curated_data['mission'],
+        'about': df_curated_data['about'],
+        'network': df_curated_data['network'].map(get_network_name),
+        'categories': df_curated_data['categories'],
+        'website_url': df_curated_data['website'],
+        'discord_url': df_curated_data['discord'],
+        'twitter_handle': df_curated_data['twitter'],
+        'symbol': df_curated_data['symbol'],
+        'contract_address': df_curated_data['contract_address'].fillna('').astype(str).str.strip().str.lower(),
+    })
+
+    stage_executor = ThreadPoolExecutor(max_workers=config.EXPAND_STAGE_WORKERS)
+    try:
+        for dao_data, row in zip(df_dao_data.to_dict('records'), df_curated_data.to_dict('records')):
+            logging.info("processing  {}".format(row["eth_name"]))
+            try:
+                social_dao_loader = SocialDAOLoader(row['eth_name'], 
+                            row['discord'], 
+                            row['twitter']
+                        )
+                covalent_dao_loader = CovalentDAOLoader(row['eth_name'], 
+                    row['network'], 
+                    row['symbol'],
+                    row['treasury_address'],
+                    dao_data['contract_address'],
+                    batch_client = covalent_batch_client
+                )
+
+                stage_errors = build_dao_stages(social_dao_loader, covalent_dao_loader).run(stage_executor)
+                if stage_errors:
+                    logging.info('partial row for {}, failed stages: {}'.format(row['eth_name'], ', '.join(stage_errors)))
+                    metrics.increment('pipeline', 'partial_rows')
+
+                social_dao_info = social_dao_loader.dao_info
+                dao_data['discord_users_count'] = social_dao_info.get('discord_member_count')
+                dao_data['twitter_followers_count'] = social_dao_info.get('twitter_followers_count')
+                dao_data['tags'] = None #extracted for NLP_BATCH_SIZE DAOs at once
+
+                covalent_data_info = covalent_dao_loader.dao_info
+                dao_data['contract_address'] = covalent_data_info.get('contract_address')
+
+                dao_data['treasury_size'] = covalent_data_info.get('treasury_size')
+                dao_data['num_proposals'] = row['ss_proposals_count'] 
+                dao_data['token_price_usd'] = covalent_data_info.get('token_price')
+                dao_data['market_cap_usd'] = covalent_data_info.get('market_cap')
+                dao_data['num_token_holders'] = covalent_data_info.get('num_voters')
+
+                dao_data['establishment_date'] = ''
+
+                pending_rows.append((row['eth_name'], dao_data, social_dao_info.get('twitter_profile_description')))
+                if len(pending_rows) >= config.NLP_BATCH_SIZE:
+                    flush_pending_rows()
+
+            except Exception as e:
+                logging.error(traceback.format_exc())
+                logging.info('failed for {}'.format(row['eth_name']))
+                writer.mark_failed(row['eth_name'], repr(e))
+                pass #Ignore failed ones and move on
+    finally:
+        stage_executor.shutdown(wait=True)
+        #also on an interrupt, the rows already fetched are written and journaled
+        flush_pending_rows()
+
+    if collector is not None:
+        return collector.get_dataframe()
+
+def collect_snapshot_org(org, snapshot_dao_info):
+    """
+    collects the details of a single snapshot org
+    from the basic DAO info prefetched from snapshot
+    returns None if the org has to be skipped
+    """
+    if snapshot_dao_info is None:
+        logging.info('skipped : space not found in snapshot : {}'.format(org['eth_name']))
+        return None
+
+    dao_data = {}
+    dao_data['eth_name'] = org['eth_name']
+    dao_data['name'] = snapshot_dao_info['name']
+    dao_data['about'] = snapshot_dao_info['about']
+    dao_data['categories'] = snapshot_dao_info['categories']
+    dao_data['network'] = snapshot_dao_info['network']
+    dao_data['logo'] = snapshot_dao_info['avatar']
+    dao_data['website'] = snapshot_dao_info['website']
+    dao_data['twitter'] = snapshot_dao_info['twitter']
+    dao_data['symbol'] = snapshot_dao_info['symbol']
+    dao_data['ss_followers_count'] = snapshot_dao_info['followersCount']
+    dao_data['ss_proposals_count'] = snapshot_dao_info['proposalsCount']
+
+    #Covalent APIs do have limitations on the networks supported,
+    #COLLECT_NETWORKS lists the ones with a Covalent chain
+    if dao_data['network'] not in config.COLLECT_NETWORKS:
+        logging.info('skipped : network not supported : {} '.format(dao_data['network']))
+        return None
+
+    #Retrieve data from DD : primarily treasury address
+    dd_dao_loader = DDDAOLoader(org['eth_name'], dao_data['name'], config.ORG_INFOS_FILE,
+                                website=dao_data['website'], twitter=dao_data['twitter'])
+    dd_dao_info = dd_dao_loader.get_dao_info()
+
+    if dd_dao_info is None:
+        return None
+
+    #Ignore if treasury details are not available
+    treasury_wallets = dd_dao_info['treasury_address']
+    if len(treasury_wallets) == 0:
+        logging.info('skipped : treasury not found')
+        return None
+    dao_data['treasury_address'] = ','.join(treasury_wallets)
+
+    dao_data['description'] = dd_dao_info['description']
+
+    #Reload social from DD if snapshot data is empty
+    if dao_data['website'] is None or dao_data['website'] == '':
+        dao_data['website'] = dd_dao_info['website']
+
+    if dao_data['twitter'] is None or dao_data['twitter'] == '':
+        dao_data['twitter'] = dd_dao_info['twitter']
+
+    dao_data['discord'] = dd_dao_info['discord']
+
+
+    #Check if Twitter and Discord Links are valid
+    social_dao_loader = SocialDAOLoader(org['eth_name'], 
+        dao_data['discord'], 
+        dao_data['twitter']
+    )
+    social_dao_info = social_dao_loader.get_dao_info()
+    dao_data['discord_valid'] = 'Y' if social_dao_info['discord_member_count'] is not None else 'N'
+    dao_data['twitter_valid'] = 'Y' if social_dao_info['twitter_followers_count'] is not None else 'N'
+
+    #Extract Contract Address from Covalent
+    covalent_dao_loader = CovalentDAOLoader(dao_data['eth_name'], 
+        dao_data['network'], 
+        dao_data['symbol'],
+        treasury_wallets = treasury_wallets
+        )
+
+    covalent_data_info = covalent_dao_loader.get_dao_info('basic') #retrieve only contract address
+    dao_data['contract_address'] = covalent_data_info['contract_address']
+
+    return dao_data
+
+def iter_candidate_orgs(snapshot_orgs, writer, drops):
+    """
+    snapshot orgs in followers count order, each org once (it is listed once per category),
+    the orgs the writer already completed or skipped are left out
+    """
+    seen_eth_names = set()
+    for idx, org in enumerate(snapshot_orgs):
+        if org['eth_name'] in seen_eth_names:
+            continue
+        seen_eth_names.add(org['eth_name'])
+        if writer.is_done(org['eth_name']):
+            drops['done'] += 1
+            continue
+        yield idx, org
+
+
+def filter_network(orgs, writer, drops):
+    """
+    drop the orgs whose network in the explore payload is not collected
+    """
+    for idx, org in orgs:
+        network = org.get('network')
+        if network is not None and network != '' and network not in config.COLLECT_NETWORKS:
+            drops['network'] += 1
+            writer.mark_skipped(org['eth_name'], 'network not supported: {}'.format(network))
+            continue
+        yield idx, org
+
+
+def filter_dd_treasury(orgs, dd_index, writer, drops):
+    """
+    drop the orgs without a deepdao match or without a treasury, from the local deepdao index.
+    Only exact matches are decided here, with the approximate match enabled the orgs without one are kept:
+    their website and twitter are only known once the snapshot info is fetched, collect_snapshot_org matches them
+    """
+    for idx, org in orgs:
+        record = dd_index.lookup_exact(org['eth_name'], org['name'])
+        if record is None and config.DD_FUZZY_MATCH_ENABLED:
+            yield idx, org
+            continue
+        if record is None:
+            drops['dd_match'] += 1
+            writer.mark_skipped(org['eth_name'], 'no deepdao match')
+            continue
+        if len(record['treasury_address']) == 0:
+            drops['treasury'] += 1
+            writer.mark_skipped(org['eth_name'], 'treasury not found')
+            continue
+        yield idx, org
+
+
+def iter_snapshot_info(orgs, executor, get_n_needed):
+    """
+    the orgs with their snapshot info, fetched SNAPSHOT_BATCH_SIZE orgs at a time,
+    and the error of the batch when the request failed (None otherwise).
+    Up to COLLECT_SNAPSHOT_LOOKAHEAD_BATCHES batches are fetched ahead while the current one is consumed,
+    as long as the orgs queued do not cover the get_n_needed() rows still needed
+    """
+    batches = deque()
+
+    def submit_batch():
+        batch = list(islice(orgs, config.SNAPSHOT_BATCH_SIZE))
+        if batch:
+            eth_names = [org['eth_name'] for _, org in batch]
+            batches.append((batch, executor.submit(SnapshotDAOLoader.get_daos_info, eth_names)))
+        return len(batch) > 0
+
+    submit_batch()
+    while batches:
+        batch, future = batches.popleft()
+        while (len(batches) < config.COLLECT_SNAPSHOT_LOOKAHEAD_BATCHES and
+                len(batch) + sum(len(queued) for queued, _ in batches) < get_n_needed()):
+            if not submit_batch():
+                break
+        snapshot_daos_info, failed = future.result()
+        for idx, org in batch:
+            yield idx, org, snapshot_daos_info.get(org['eth_name']), failed.get(org['eth_name'])
+        if not batches:
+            submit_batch()
 
-    df_dao_data_agg = pd.DataFrame(dao_data_agg)
-    return df_dao_data_agg
 
-def collect_snapshot_orgs_data():
+def collect_snapshot_orgs_data(refresh_dd=False, writer=None):
     """
     collects all the DAO orgs from snapshot
     Fetch treasurt from DD
     Fetch token, marketcap, treasury balances from Covalent
     Fetch followers count from twitter & discord api
+
+    The orgs flow through a chain of generators, the cheap local filters (network of the explore
+    payload, exact deepdao match and treasury from the local index) run before any request is made.
+    The snapshot info of the remaining orgs is fetched in batches of SNAPSHOT_BATCH_SIZE, one batch ahead.
+    Orgs are then processed concurrently by a pool of workers, no more are submitted than the rows
+    still needed (up to COLLECT_PREFETCH_WINDOW) and the results are consumed in the submission order
+    so that the output stays sorted by followers count. No candidate is pulled once MAX_ORG_PARSE_LIMIT rows are written
+
+    Each row is handed to the writer as soon as the org is processed, orgs the writer
+    already completed or skipped are not processed again.
+    Without a writer the rows are returned as a dataframe
     """
+    collector = RowCollector() if writer is None else None
+    writer = writer or collector
 
     snapshot_orgs = SnapshotDAOLoader.get_daos()
 
     #Extract data from snapshot (sorted by followers count)
-    DDDAODownloader.load_data(config.ORG_INFOS_FILE)
-
-    dao_data_agg = []
+    DDDAODownloader.load_data(config.ORG_INFOS_FILE, refresh=refresh_dd)
+    dd_index = DDDAOIndex.load(config.ORG_INFOS_FILE)
 
     n_orgs = len(snapshot_orgs)
+    #the run ends once MAX_ORG_PARSE_LIMIT rows are written, skipped orgs do not count
+    metrics.set_progress_total(max(config.MAX_ORG_PARSE_LIMIT - writer.n_rows, 0), counted=[COMPLETED])
 
-    for idx, org in zip(range(n_orgs),snapshot_orgs):
-
-        if len(dao_data_agg) == config.MAX_ORG_PARSE_LIMIT:
-            logging.info('orgs limit reached as defined in config')
-            break
-
-        logging.info('processing org: {}, {}/{}, successfully_parsed:{}/{}'.format(org['name'],str(idx+1),str(n_orgs),str(len(dao_data_agg)+1),str(config.MAX_ORG_PARSE_LIMIT)))
-
-        # Retrieve basic DAO info from snapshot
-        snapshot_loader = SnapshotDAOLoader(org['eth_name'])
-        snapshot_dao_info = snapshot_loader.get_dao_info()
-        dao_data = {}
-        dao_data['eth_name'] = org['eth_name']
-        dao_data['name'] = snapshot_dao_info['name']
-        dao_data['about'] = snapshot_dao_info['about']
-        dao_data['categories'] = snapshot_dao_info['categories']
-        dao_data['network'] = snapshot_dao_info['network']
-        dao_data['logo'] = snapshot_dao_info['avatar']
-        dao_data['website'] = snapshot_dao_info['website']
-        dao_data['twitter'] = snapshot_dao_info['twitter']
-        dao_data['symbol'] = snapshot_dao_info['symbol']
-        dao_data['ss_followers_count'] = snapshot_dao_info['followersCount']
-        dao_data['ss_proposals_count'] = snapshot_dao_info['proposalsCount']
-
-        #Covalent APIs do have limitations on the networks supported.
-        #Need to review and filter only those
-        if dao_data['network'] != '1':
-            logging.info('skipped : network not supported : {} '.format(dao_data['network']))
-            continue
+    #orgs dropped by each stage
+    drops = Counter()
 
-        #Retrieve data from DD : primarily treasury address
-        dd_dao_loader = DDDAOLoader(org['eth_name'], dao_data['name'], config.ORG_INFOS_FILE)
-        dd_dao_info = dd_dao_loader.get_dao_info()
+    executor = ThreadPoolExecutor(max_workers=config.COLLECT_WORKERS)
+    snapshot_executor = ThreadPoolExecutor(max_workers=1)
+    orgs = iter_candidate_orgs(snapshot_orgs, writer, drops)
+    orgs = filter_network(orgs, writer, drops)
+    orgs = filter_dd_treasury(orgs, dd_index, writer, drops)
+    orgs = iter_snapshot_info(orgs, snapshot_executor, lambda: config.MAX_ORG_PARSE_LIMIT - writer.n_rows)
+    pending = deque()
 
-        if dd_dao_info is None:
-            continue
+    def submit_orgs():
+        while len(pending) < min(config.COLLECT_PREFETCH_WINDOW, config.MAX_ORG_PARSE_LIMIT - writer.n_rows):
+            item = next(orgs, None)
+            if item is None:
+                return
+            idx, org, snapshot_dao_info, error = item
+            if error is not None:
+                #the snapshot request failed, the org is retried on resume
+                writer.mark_failed(org['eth_name'], error)
+                drops['failed'] += 1
+                continue
+            pending.append((idx, org, executor.submit(collect_snapshot_org, org, snapshot_dao_info)))
 
-        #Ignore if treasury details are not available
-        dao_data['treasury_address'] = dd_dao_info['treasury_address']
-        if dao_data['treasury_address'] is None or dao_data['treasury_address'] == '':
-            logging.info('skipped : treasury not found')
-            continue
+    try:
+        submit_orgs()
+        while pending:
 
-        dao_data['description'] = dd_dao_info['description']
+            if writer.n_rows >= config.MAX_ORG_PARSE_LIMIT:
+                logging.info('orgs limit reached as defined in config')
+                break
 
-        #Reload social from DD if snapshot data is empty
-        if dao_data['website'] is None or dao_data['website'] == '':
-            dao_data['website'] = dd_dao_info['website']
+            idx, org, future = pending.popleft()
 
-        if dao_data['twitter'] is None or dao_data['twitter'] == '':
-            dao_data['twitter'] = dd_dao_info['twitter']
+            logging.info('processing org: {}, {}/{}, successfully_parsed:{}/{}'.format(org['name'],str(idx+1),str(n_orgs),str(writer.n_rows+1),str(config.MAX_ORG_PARSE_LIMIT)))
 
-        dao_data['discord'] = dd_dao_info['discord']
-        
+            try:
+                dao_data = future.result()
+            except Exception as e:
+                logging.error(traceback.format_exc())
+                writer.mark_failed(org['eth_name'], repr(e))
+                drops['failed'] += 1
+                submit_orgs()
+                continue
 
-        #Check if Twitter and Discord Links are valid
-        social_dao_loader = SocialDAOLoader(org['eth_name'], 
-            dao_data['discord'], 
-            dao_data['twitter']
-        )
-        social_dao_info = social_dao_loader.get_dao_info()
-        dao_data['discord_valid'] = 'Y' if social_dao_info['discord_member_count'] is not None else 'N'
-        dao_data['twitter_valid'] = 'Y' if social_dao_info['twitter_followers_count'] is not None else 'N'
-        
-        #Extract Contract Address from Covalent
-        covalent_dao_loader = CovalentDAOLoader(dao_data['eth_name'], 
-            dao_data['network'], 
-            dao_data['symbol'],
-            treasury_wallets = dao_data['treasury_address'].split(',')
-            )
-        
-        covalent_data_info = covalent_dao_loader.get_dao_info('basic') #retrieve only contract address
-        dao_data['contract_address'] = covalent_data_info['contract_address']
-
-        dao_data_agg.append(dao_data)
-     
-    df_dao_data_agg = pd.DataFrame(dao_data_agg)
-    return df_dao_data_agg
-     
\ No newline at end of file
+            if dao_data is None:
+                writer.mark_skipped(org['eth_name'])
+                drops['skipped'] += 1
+            else:
+                writer.write_row(org['eth_name'], dao_data)
+            submit_orgs()
+    finally:
+        #drop the orgs prefetched beyond the limit
+        executor.shutdown(wait=True, cancel_futures=True)
+        snapshot_executor.shutdown(wait=True, cancel_futures=True)
+
+    logging.info('orgs dropped by stage: {}'.format(', '.join('{} {}'.format(stage, n) for stage, n in drops.items()) or 'none'))
+    for stage, n in drops.items():
+        metrics.increment('pipeline', 'collect_dropped_{}'.format(stage), n)
+
+    if collector is not None:
+        return collector.get_dataframe()
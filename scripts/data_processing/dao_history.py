@@ -0,0 +1,268 @@
+"""
+The Module keeps the history of the DAO metrics computed by each expand run (treasury, price, holders, followers...)
+    - append-only: a run only appends the values which changed since the previous observation of the DAO,
+      unchanged values are carried forward (run-length encoding of the series)
+    - values are fixed size binary records (run, dao, metric, value) loaded at once with numpy
+    - the latest values are kept in a dense dao x metric matrix, the records are indexed by (dao, metric, run)
+      for the range queries of one DAO and the values of all DAOs at a given run (growth rates)
+"""
+# =============================================================================
+
+import json
+import logging
+import os
+import time
+import numpy as np
+import pandas as pd
+import config
+import storage
+
+CHANGE_DTYPE = np.dtype([('run', '<i4'), ('dao', '<i4'), ('metric', '<u2'), ('value', '<f8')])
+
+DAOS_FILE = 'daos.txt'
+METRICS_FILE = 'metrics.txt'
+CHANGES_FILE = 'changes.bin'
+RUNS_FILE = 'runs.jsonl'
+
+
+def truncate_partial_line(path):
+    """
+    drop the last line of a text file if an interrupted write left it without its newline
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        content = f.read()
+        if content != b'' and not content.endswith(b'\n'):
+            f.truncate(content.rfind(b'\n') + 1)
+
+
+def read_lines(path):
+    truncate_partial_line(path)
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [line.rstrip('\n') for line in f]
+
+
+def append_lines(path, lines):
+    if len(lines) == 0:
+        return
+    with open(path, 'a') as f:
+        f.write(''.join(line + '\n' for line in lines))
+
+
+def to_timestamp(value):
+    """
+    unix timestamp of a number, a datetime or a date string
+    """
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize('UTC')
+    return timestamp.timestamp()
+
+
+class DAOHistoryStore:
+    """
+    History of the DAO metrics in a directory. A run is committed once its line is in runs.jsonl,
+    the records an interrupted append left behind are dropped when the store is opened
+    """
+
+    def __init__(self, directory, metric_names=None):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        self.daos = read_lines(self.get_path(DAOS_FILE))
+        self.dao_ids = {eth_name: dao_id for dao_id, eth_name in enumerate(self.daos)}
+
+        self.metric_names = read_lines(self.get_path(METRICS_FILE))
+        new_metrics = [name for name in (metric_names or config.HISTORY_METRICS) if name not in self.metric_names]
+        append_lines(self.get_path(METRICS_FILE), new_metrics)
+        self.metric_names += new_metrics
+        self.metric_ids = {name: metric_id for metric_id, name in enumerate(self.metric_names)}
+
+        self.runs = [json.loads(line) for line in read_lines(self.get_path(RUNS_FILE))]
+        self.run_timestamps = np.array([run['timestamp'] for run in self.runs], dtype=np.float64)
+
+        #records past the last committed run come from an interrupted append
+        n_changes = self.runs[-1]['changes_end'] if self.runs else 0
+        changes_path = self.get_path(CHANGES_FILE)
+        if os.path.exists(changes_path) and os.path.getsize(changes_path) != n_changes * CHANGE_DTYPE.itemsize:
+            with open(changes_path, 'rb+') as f:
+                f.truncate(n_changes * CHANGE_DTYPE.itemsize)
+        self.changes = np.fromfile(changes_path, dtype=CHANGE_DTYPE, count=n_changes) \
+            if n_changes > 0 else np.empty(0, dtype=CHANGE_DTYPE)
+
+        self.index = None
+        self.latest = np.full((len(self.daos), len(self.metric_names)), np.nan)
+        if len(self.changes) > 0:
+            #the last record of each (dao, metric) group holds its latest value
+            index = self.get_index()
+            last = np.flatnonzero(np.diff(index['groups'], append=-1))
+            records = self.changes[index['order'][last]]
+            self.latest[records['dao'], records['metric']] = records['value']
+
+    def get_path(self, file_name):
+        return os.path.join(self.directory, file_name)
+
+    def get_index(self):
+        """
+        records sorted by (dao, metric, run), built on first use after each append.
+        groups : dao * n_metrics + metric of each sorted record, keys : group * n_runs + run,
+        group_ids : distinct groups, in order
+        """
+        if self.index is None:
+            groups = self.changes['dao'].astype(np.int64) * len(self.metric_names) + self.changes['metric']
+            keys = groups * max(len(self.runs), 1) + self.changes['run']
+            order = np.argsort(keys, kind='stable')
+            groups = groups[order]
+            group_starts = np.flatnonzero(np.diff(groups, prepend=-1))
+            self.index = {'order': order, 'groups': groups, 'keys': keys[order], 'group_ids': groups[group_starts]}
+        return self.index
+
+    def append_run(self, df, timestamp=None, source=''):
+        """
+        append a run from a dataframe indexed by eth name with one column per metric, returns the number
+        of values written. Missing and NaN values are not observations, the previous value is kept
+        """
+        run_id = len(self.runs)
+        timestamp = time.time() if timestamp is None else to_timestamp(timestamp)
+        if self.runs and timestamp < self.runs[-1]['timestamp']:
+            raise ValueError('run at {} is older than the last run at {}'.format(timestamp, self.runs[-1]['timestamp']))
+
+        df = df[~df.index.duplicated(keep='last')]
+        values = np.column_stack([
+            pd.to_numeric(df[name], errors='coerce').to_numpy(dtype=np.float64) if name in df.columns
+                else np.full(len(df), np.nan)
+            for name in self.metric_names
+        ]) if len(df) > 0 else np.empty((0, len(self.metric_names)))
+
+        new_daos = [str(eth_name) for eth_name in df.index if str(eth_name) not in self.dao_ids]
+        for eth_name in new_daos:
+            self.dao_ids[eth_name] = len(self.daos)
+            self.daos.append(eth_name)
+        self.latest = np.vstack([self.latest, np.full((len(new_daos), len(self.metric_names)), np.nan)])
+
+        dao_ids = np.array([self.dao_ids[str(eth_name)] for eth_name in df.index], dtype=np.int64)
+        changed = np.isfinite(values) & (values != self.latest[dao_ids])
+        rows, metric_ids = np.nonzero(changed)
+        records = np.empty(len(rows), dtype=CHANGE_DTYPE)
+        records['run'] = run_id
+        records['dao'] = dao_ids[rows]
+        records['metric'] = metric_ids
+        records['value'] = values[rows, metric_ids]
+
+        #the run line is written last, it commits the records
+        append_lines(self.get_path(DAOS_FILE), new_daos)
+        with open(self.get_path(CHANGES_FILE), 'ab') as f:
+            f.write(records.tobytes())
+        run = {'run': run_id, 'timestamp': timestamp, 'source': source, 'n_daos': len(df),
+               'n_changes': len(records), 'changes_end': len(self.changes) + len(records)}
+        append_lines(self.get_path(RUNS_FILE), [json.dumps(run)])
+
+        self.runs.append(run)
+        self.run_timestamps = np.append(self.run_timestamps, timestamp)
+        self.changes = np.concatenate([self.changes, records])
+        self.latest[records['dao'], records['metric']] = records['value']
+        self.index = None
+        return len(records)
+
+    def append_expand_output(self, out_file, curated_file, timestamp=None):
+        """
+        append the metrics of an expand output, its id column is the row of the DAO in the curated input
+        """
+        df_out = storage.read_table(out_file, columns=['id'] + self.metric_names)
+        eth_names = storage.read_table(curated_file, columns=['eth_name']).reset_index(drop=True)['eth_name']
+        df_out.index = eth_names.iloc[df_out['id'].astype(int).to_numpy()].to_numpy()
+        n_changes = self.append_run(df_out, timestamp=timestamp, source=out_file)
+        logging.info('history: run {} of {} DAOs appended to {}, {} values changed'.format(
+            len(self.runs) - 1, len(df_out), self.directory, n_changes))
+        return n_changes
+
+    def get_run_id(self, timestamp=None):
+        """
+        last run at or before the timestamp (the last run by default), None if there is none
+        """
+        if timestamp is None:
+            return len(self.runs) - 1 if self.runs else None
+        run_id = int(np.searchsorted(self.run_timestamps, to_timestamp(timestamp), side='right')) - 1
+        return run_id if run_id >= 0 else None
+
+    def get_latest(self, eth_name=None):
+        """
+        latest value of each metric, of one DAO as a dict or of every DAO as a dataframe
+        """
+        if eth_name is not None:
+            dao_id = self.dao_ids.get(eth_name)
+            if dao_id is None:
+                return {}
+            return {name: value for name, value in zip(self.metric_names, self.latest[dao_id].tolist())}
+        return pd.DataFrame(self.latest, index=pd.Index(self.daos, name='eth_name'), columns=self.metric_names)
+
+    def get_values_at(self, timestamp=None):
+        """
+        value of each metric of every DAO as of the last run at or before the timestamp, in one vectorized pass
+        """
+        run_id = self.get_run_id(timestamp)
+        if run_id is not None and run_id == len(self.runs) - 1:
+            return self.get_latest()
+        values = np.full((len(self.daos), len(self.metric_names)), np.nan)
+        if run_id is not None and len(self.changes) > 0:
+            index = self.get_index()
+            n_runs = max(len(self.runs), 1)
+            groups = index['group_ids']
+            #last record of each group at or before the run
+            positions = np.searchsorted(index['keys'], groups * n_runs + run_id, side='right') - 1
+            found = positions >= 0
+            found[found] = index['groups'][positions[found]] == groups[found]
+            records = self.changes[index['order'][positions[found]]]
+            values[records['dao'], records['metric']] = records['value']
+        return pd.DataFrame(values, index=pd.Index(self.daos, name='eth_name'), columns=self.metric_names)
+
+    def get_range(self, eth_name, start=None, end=None):
+        """
+        values of one DAO at each run between the start and end timestamps, indexed by the run time
+        """
+        columns = ['run'] + self.metric_names
+        dao_id = self.dao_ids.get(eth_name)
+        end_run = self.get_run_id(end)
+        if dao_id is None or end_run is None:
+            return pd.DataFrame(columns=columns)
+        start_run = 0 if start is None else int(np.searchsorted(self.run_timestamps, to_timestamp(start), side='left'))
+        if start_run > end_run:
+            return pd.DataFrame(columns=columns)
+
+        #the records of the DAO are contiguous in the index
+        index = self.get_index()
+        n_metrics = len(self.metric_names)
+        first, last = np.searchsorted(index['groups'], [dao_id * n_metrics, (dao_id + 1) * n_metrics])
+        records = self.changes[index['order'][first:last]]
+        records = records[records['run'] <= end_run]
+
+        #forward fill each metric from its last change
+        values = np.full((end_run + 1, n_metrics), np.nan)
+        values[records['run'], records['metric']] = records['value']
+        changed_at = np.full((end_run + 1, n_metrics), -1)
+        changed_at[records['run'], records['metric']] = records['run']
+        changed_at = np.maximum.accumulate(changed_at, axis=0)
+        values = np.where(changed_at >= 0, values[np.maximum(changed_at, 0), np.arange(n_metrics)], np.nan)
+
+        runs = np.arange(start_run, end_run + 1)
+        df = pd.DataFrame(values[start_run:], columns=self.metric_names)
+        df.insert(0, 'run', runs)
+        df.index = pd.to_datetime(self.run_timestamps[start_run:end_run + 1], unit='s', utc=True).rename('run_at')
+        return df
+
+    def get_growth(self, start, end=None, metric_names=None):
+        """
+        relative growth (end / start - 1) of the metrics of every DAO between the runs at the start
+        and end timestamps (the last run by default), NaN when the start value is missing or zero
+        """
+        metric_names = metric_names or self.metric_names
+        start_values = self.get_values_at(start)[metric_names].to_numpy()
+        end_values = self.get_values_at(end)[metric_names].to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            growth = np.where(start_values != 0, end_values / start_values - 1, np.nan)
+        return pd.DataFrame(growth, index=pd.Index(self.daos, name='eth_name'), columns=metric_names)
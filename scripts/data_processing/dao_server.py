@@ -0,0 +1,338 @@
+"""
+The Module serves the expand output to the DAO explorer frontend from a local http server
+    - the output file is loaded once into an index: records by id, categories / tags / network postings
+      and the sort order of the numeric columns (treasury size, followers...)
+    - list, filter, sort and by id queries are answered from the index, encoded responses are cached
+      and carry an ETag, a request whose If-None-Match matches gets a 304
+    - the file is reloaded in the background when a new output lands
+
+    python dao_server.py --infile dao_list_updated.csv --port 8090
+
+    GET /daos?category=defi,nft&tag=governance&sort=-treasury_size&limit=50&offset=0
+    GET /daos/<id>
+    GET /facets
+"""
+# =============================================================================
+
+import json
+import logging
+import os
+import sys
+import threading
+import traceback
+import zlib
+from argparse import ArgumentParser
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+import numpy as np
+import pandas as pd
+import config
+import storage
+
+
+class QueryError(Exception):
+    """
+    invalid query parameters, answered with a 400
+    """
+
+
+def parse_values(value):
+    """
+    lowercase values of a list cell: a python list / set repr as written by expand, a list or a comma joined string
+    """
+    return sorted(set(v.strip().lower() for v in storage.to_list(value) if v.strip() != ''))
+
+
+def to_json_value(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class DAOQueryIndex:
+    """
+    Read-only index over one version of the expand output, replaced as a whole on reload
+    """
+
+    def __init__(self, df, version=''):
+        self.version = version
+        df = df.reset_index(drop=True)
+        self.n_daos = len(df)
+        if 'id' not in df.columns:
+            df['id'] = df.index
+
+        #facet values are indexed lowercase, the records keep them as lists
+        facet_values = {facet: [parse_values(v) for v in df[column]] if column in df.columns else [[]] * self.n_daos
+                        for facet, column in config.DAO_SERVER_FACETS.items()}
+        self.postings = {}
+        for facet, values in facet_values.items():
+            positions = {}
+            for position, row_values in enumerate(values):
+                for value in row_values:
+                    positions.setdefault(value, []).append(position)
+            self.postings[facet] = {value: np.array(p, dtype=np.int64) for value, p in positions.items()}
+
+        #rows in the ascending and descending order of each sort column, missing values last
+        self.orders = {}
+        for column in config.DAO_SERVER_SORT_COLUMNS:
+            if column not in df.columns:
+                continue
+            if column == 'name':
+                values = np.array([str(v).lower() if isinstance(v, str) else '' for v in df[column]], dtype=object)
+                order = np.argsort(values, kind='stable')
+                self.orders[(column, True)] = order
+                self.orders[(column, False)] = order[::-1].copy()
+            else:
+                #numpy sorts NaN last, in both orders
+                values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64)
+                self.orders[(column, True)] = np.argsort(values, kind='stable')
+                self.orders[(column, False)] = np.argsort(-values, kind='stable')
+
+        #records are encoded once, responses join them
+        self.ids = {}
+        self.record_json = []
+        list_facets = {facet: column for facet, column in config.DAO_SERVER_FACETS.items()
+                       if column != 'network' and column in df.columns}
+        for position, row in enumerate(df.to_dict('records')):
+            record = {column: to_json_value(value) for column, value in row.items() if column != ''}
+            for facet, column in list_facets.items():
+                record[column] = facet_values[facet][position]
+            self.ids[str(record['id'])] = position
+            self.record_json.append(json.dumps(record).encode('utf-8'))
+
+        self.facet_counts = {facet: {value: len(p) for value, p in sorted(postings.items())}
+                             for facet, postings in self.postings.items()}
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+
+    @staticmethod
+    def from_file(path):
+        stat = os.stat(path)
+        return DAOQueryIndex(storage.read_table(path), version='{:x}-{:x}'.format(stat.st_mtime_ns, stat.st_size))
+
+    def filter(self, filters):
+        """
+        mask of the rows matching the filters {facet: [values]}, any value of a facet and every facet
+        """
+        mask = np.ones(self.n_daos, dtype=bool)
+        for facet, values in filters.items():
+            facet_mask = np.zeros(self.n_daos, dtype=bool)
+            for value in values:
+                positions = self.postings[facet].get(value)
+                if positions is not None:
+                    facet_mask[positions] = True
+            mask &= facet_mask
+        return mask
+
+    def query(self, filters, sort=None, limit=None, offset=0):
+        """
+        (number of matching rows, positions of the page) sorted by the sort column, -column for descending
+        """
+        if sort:
+            ascending = not sort.startswith('-')
+            order = self.orders.get((sort.lstrip('-'), ascending))
+            if order is None:
+                raise QueryError('unknown sort column {}, expected one of {}'.format(
+                    sort.lstrip('-'), ', '.join(sorted(set(column for column, _ in self.orders)))))
+        else:
+            order = np.arange(self.n_daos)
+        if filters:
+            order = order[self.filter(filters)[order]]
+        return len(order), order[offset:offset + limit if limit is not None else None]
+
+    def get_response(self, route, params):
+        """
+        (status, encoded body) of a request, cached per normalized query
+        """
+        key = (route, params)
+        with self.cache_lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+        response = self.build_response(route, params)
+        with self.cache_lock:
+            self.cache[key] = response
+            if len(self.cache) > config.DAO_SERVER_CACHE_SIZE:
+                self.cache.popitem(last=False)
+        return response
+
+    def build_response(self, route, params):
+        if route == '/facets':
+            return 200, json.dumps(self.facet_counts).encode('utf-8')
+
+        if route.startswith('/daos/'):
+            position = self.ids.get(route[len('/daos/'):])
+            if position is None:
+                return 404, json.dumps({'error': 'unknown dao {}'.format(route[len('/daos/'):])}).encode('utf-8')
+            return 200, self.record_json[position]
+
+        if route == '/daos':
+            try:
+                filters, sort, limit, offset = self.parse_params(params)
+                total, positions = self.query(filters, sort, limit, offset)
+            except QueryError as e:
+                return 400, json.dumps({'error': str(e)}).encode('utf-8')
+            body = b''.join([
+                '{{"total": {}, "offset": {}, "limit": {}, "daos": ['.format(total, offset, limit).encode('utf-8'),
+                b', '.join(self.record_json[position] for position in positions.tolist()),
+                b']}',
+            ])
+            return 200, body
+
+        return 404, json.dumps({'error': 'unknown path {}'.format(route)}).encode('utf-8')
+
+    @staticmethod
+    def parse_params(params):
+        """
+        filters, sort, limit and offset of a /daos query, facet values may be repeated or comma joined
+        """
+        filters = {}
+        sort = None
+        limit = config.DAO_SERVER_PAGE_SIZE
+        offset = 0
+        for name, value in params:
+            if name in config.DAO_SERVER_FACETS:
+                filters.setdefault(name, set()).update(parse_values(value))
+            elif name == 'sort':
+                sort = value
+            elif name in ('limit', 'offset'):
+                try:
+                    number = int(value)
+                except ValueError:
+                    raise QueryError('{} must be an integer'.format(name))
+                if number < 0:
+                    raise QueryError('{} must be positive'.format(name))
+                if name == 'limit':
+                    limit = min(number, config.DAO_SERVER_MAX_PAGE_SIZE)
+                else:
+                    offset = number
+            else:
+                raise QueryError('unknown parameter {}'.format(name))
+        return filters, sort, limit, offset
+
+
+class DAOQueryHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        index = server.index
+        parts = urlsplit(self.path)
+        route = parts.path.rstrip('/') or '/'
+        params = tuple(sorted(parse_qsl(parts.query)))
+
+        if route == '/health':
+            return self.send_body(200, json.dumps({'version': index.version, 'daos': index.n_daos}).encode('utf-8'))
+
+        #the version of the file and the normalized query identify the response, no need to build it for a 304
+        etag = '"{}-{:08x}"'.format(index.version, zlib.crc32(repr((route, params)).encode('utf-8')))
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None and (if_none_match.strip() == '*' or
+                                          etag in [tag.strip() for tag in if_none_match.split(',')]):
+            return self.send_body(304, b'', etag)
+
+        status, body = index.get_response(route, params)
+        self.send_body(status, body, etag if status == 200 else None)
+
+    def send_body(self, status, body, etag=None):
+        self.send_response(status)
+        if status != 304:
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+        if etag is not None:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+
+class DAOQueryServer(ThreadingHTTPServer):
+    """
+    Serves the index of path and swaps it for a new one when the file changes. A file still being
+    written (expand streams its rows) is loaded once it has not changed for a reload interval
+    """
+    daemon_threads = True
+
+    def __init__(self, path, host=None, port=None):
+        super().__init__((host or config.DAO_SERVER_HOST, config.DAO_SERVER_PORT if port is None else port), DAOQueryHandler)
+        self.path = path
+        self.index = DAOQueryIndex.from_file(path)
+        self.file_state = self.get_file_state()
+        self.stopped = threading.Event()
+        logging.info('serving {} DAOs of {} on port {}'.format(self.index.n_daos, path, self.server_address[1]))
+
+    def get_file_state(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def reload_if_changed(self, previous_state):
+        """
+        reload the file if it changed and is stable since the previous check, returns the current file state
+        """
+        state = self.get_file_state()
+        if state is not None and state != self.file_state and state == previous_state:
+            try:
+                index = DAOQueryIndex.from_file(self.path)
+                self.index = index
+                self.file_state = state
+                logging.info('reloaded {}: {} DAOs, version {}'.format(self.path, index.n_daos, index.version))
+            except Exception:
+                #keep serving the previous version
+                logging.error(traceback.format_exc())
+        return state
+
+    def run_reloader(self, interval):
+        state = self.file_state
+        while not self.stopped.wait(interval):
+            state = self.reload_if_changed(state)
+
+    def start_reloader(self, reload_interval=None):
+        """
+        watch the file from a background thread, a reload interval of 0 disables it
+        """
+        reload_interval = config.DAO_SERVER_RELOAD_INTERVAL if reload_interval is None else reload_interval
+        if reload_interval > 0:
+            threading.Thread(target=self.run_reloader, args=(reload_interval,), daemon=True).start()
+        return self
+
+    def start(self, reload_interval=None):
+        """
+        serve and watch the file from background threads
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.start_reloader(reload_interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s", stream=sys.stdout)
+
+    parser = ArgumentParser()
+    parser.add_argument("-i", "--infile", dest="in_file", required=True, help="expand output (.csv, .parquet or .feather)")
+    parser.add_argument("--host", dest="host", default=config.DAO_SERVER_HOST)
+    parser.add_argument("--port", dest="port", type=int, default=config.DAO_SERVER_PORT)
+    parser.add_argument("--reload-interval", dest="reload_interval", type=float, default=config.DAO_SERVER_RELOAD_INTERVAL,
+                        help="seconds between checks of the input file, 0 disables the reload")
+    args = parser.parse_args()
+
+    server = DAOQueryServer(args.in_file, args.host, args.port).start_reloader(args.reload_interval)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stopped.set()
+        server.server_close()
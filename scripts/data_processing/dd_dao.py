@@ -8,51 +8,152 @@ import requests
 import config
 import logging
 import pandas as pd
+import threading
 import time
 import os
+import storage
+import metrics
+from name_index import NameIndex
+
+#columns of the org infos used by the pipeline
+DD_INDEX_COLUMNS = ['name', 'description', 'website', 'twitter', 'discord', 'treasury_address', 'dd_eth_names']
 
 REQUEST_HEADER = {
     'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_6) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/56.0.2924.87 Safari/537.36',
 }
 
+
+class DDDAOIndex:
+    """
+    In-memory lookup index over the deepdao org infos.
+    Loaded once per process and data file, shared by every DDDAOLoader
+    """
+
+    _indexes = {}
+    _indexes_lock = threading.Lock()
+
+    def __init__(self, data_path):
+        df_org_infos = storage.read_table(data_path, columns=DD_INDEX_COLUMNS)
+        df_org_infos = df_org_infos.astype(object).fillna('')
+        self.records = df_org_infos.to_dict('records')
+
+        #first occurrence wins, same as the row scan it replaces
+        self.by_eth_name = {}
+        self.by_lower_name = {}
+        for record in self.records:
+            for eth_name in record['dd_eth_names']:
+                self.by_eth_name.setdefault(eth_name, record)
+            self.by_lower_name.setdefault(str(record['name']).lower(), record)
+
+        #snapshot eth name -> record, remembered between orgs
+        self.dao_eth_name = {}
+        self.lock = threading.Lock()
+
+        #approximate index, built on the first lookup without an exact match
+        self.name_index = None
+        self.name_index_lock = threading.Lock()
+
+    @staticmethod
+    def load(data_path):
+        """
+        returns the shared index for the data file, building it on first use
+        """
+        with DDDAOIndex._indexes_lock:
+            if data_path not in DDDAOIndex._indexes:
+                logging.info('building DD index from {}'.format(data_path))
+                DDDAOIndex._indexes[data_path] = DDDAOIndex(data_path)
+            return DDDAOIndex._indexes[data_path]
+
+    @staticmethod
+    def invalidate(data_path):
+        """
+        drop the shared index so that the next load rereads the data file
+        """
+        with DDDAOIndex._indexes_lock:
+            DDDAOIndex._indexes.pop(data_path, None)
+
+    def get_name_index(self):
+        with self.name_index_lock:
+            if self.name_index is None:
+                start_time = time.perf_counter()
+                self.name_index = NameIndex.from_records(self.records)
+                logging.info('DD name index built in {:.1f} s'.format(time.perf_counter() - start_time))
+            return self.name_index
+
+    def search(self, dao_eth_name, dao_name, website=None, twitter=None, top_k=5, min_score=None):
+        """
+        ranked [(record, score)] candidates of the approximate name index
+        """
+        keys = NameIndex.get_query_keys(dao_eth_name, dao_name, website, twitter)
+        candidates = self.get_name_index().search(keys, top_k, min_score)
+        return [(self.records[record_idx], score) for record_idx, score in candidates]
+
+    def lookup_exact(self, dao_eth_name, dao_name):
+        """
+        match on the mapped or identical eth name, or the identical name, without the approximate index.
+        None only means that there is no exact match, the match is not cached
+        """
+        with self.lock:
+            if dao_eth_name in self.dao_eth_name:
+                return self.dao_eth_name[dao_eth_name]
+
+        record = self.by_eth_name.get(dao_eth_name)
+        if record is None and dao_name is not None:
+            record = self.by_lower_name.get(dao_name.lower())
+        return record
+
+    def lookup(self, dao_eth_name, dao_name, website=None, twitter=None):
+        """
+        Mapping between snapshot & DD is done based on
+            if dao_eth_name is already mapped
+            if dao_eth_name matches
+            if dao_name matches
+            if the best candidate of the approximate name index (names, website, twitter)
+            scores above DD_FUZZY_MATCH_THRESHOLD
+        """
+        record = self.lookup_exact(dao_eth_name, dao_name)
+        if record is None and config.DD_FUZZY_MATCH_ENABLED:
+            candidates = self.search(dao_eth_name, dao_name, website, twitter, top_k=1,
+                                     min_score=config.DD_FUZZY_MATCH_THRESHOLD)
+            if candidates and candidates[0][1] >= config.DD_FUZZY_MATCH_THRESHOLD:
+                record, score = candidates[0]
+                logging.info('approximate DD match: {} -> {} ({:.2f})'.format(dao_eth_name, record['name'], score))
+                metrics.increment('deepdao', 'fuzzy_matches')
+        if record is None:
+            return None
+
+        with self.lock:
+            self.dao_eth_name[dao_eth_name] = record
+        return record
+
+
 class DDDAOLoader:
 
-    def __init__(self, dao_eth_name, dao_name, data_path):
+    def __init__(self, dao_eth_name, dao_name, data_path, website=None, twitter=None):
         """
         Initialize DAO and load the data
         """
         self.dao_name = dao_name
         self.dao_eth_name = dao_eth_name
+        self.website = website
+        self.twitter = twitter
         self.dao_details = {}
         self.dao_assets = {}
 
-        self.df_org_infos = pd.read_csv(data_path)
-        self.df_org_infos.fillna('', inplace=True)
-        self.df_org_infos['dao_eth_name']= '' #dynamically mapped 
+        self.dd_index = DDDAOIndex.load(data_path)
 
+    @metrics.timed('deepdao', 'lookup')
     def get_dao_info(self):
         """
         Mapping between snapshot & DD is done based on
             if dao_eth_name matches
             if dao_name matches
+            if the name, website or twitter handle match approximately
         """
-        #check if the snapshot eth name is already mapped
-        match = (self.df_org_infos['dao_eth_name'] == self.dao_eth_name)
-        if self.df_org_infos[match].shape[0] == 1:
-            return self.df_org_infos[match].iloc[0].to_dict()
-
-        #If not , map using dd_eth_names fetched from dd
-        for idx, row in self.df_org_infos.iterrows():
-            for eth_name in row['dd_eth_names'].split(','):
-                if self.dao_eth_name==eth_name:
-                    self.df_org_infos.loc[idx, 'dao_eth_name'] = self.dao_eth_name
-                    return self.df_org_infos.loc[idx,:].to_dict()
-
-        for idx, row in self.df_org_infos.iterrows():
-                if self.dao_name.lower()==row['name'].lower():
-                    self.df_org_infos.loc[idx, 'dao_eth_name'] = self.dao_eth_name
-                    return self.df_org_infos.loc[idx,:].to_dict()
-        
-        return None
-
+        record = self.dd_index.lookup(self.dao_eth_name, self.dao_name, self.website, self.twitter)
+        if record is None:
+            return None
 
+        dao_info = dict(record)
+        dao_info['dao_eth_name'] = self.dao_eth_name
+        return dao_info
@@ -4,12 +4,20 @@
 # =============================================================================
 """The Module crawls and downloads data from deepdao"""
 # =============================================================================
-import requests
+import http_util
 import config
 import logging
 import pandas as pd
 import time
 import os
+import json
+import math
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from dd_dao import DDDAOIndex
+import storage
+import metrics
 
 DD_ORGS_URL = config.DD_ORGS_URL
 DD_ORGS_DETAILS_URL = config.DD_ORGS_DETAILS_URL
@@ -29,34 +37,138 @@ class DDDAODownloader:
         self.df_org_infos = None
 
     @staticmethod
+    @metrics.timed('deepdao', 'get_orgs')
     def get_orgs():
         """
         loads all the organization details
         """
         orgs_url = DD_ORGS_URL
-        r = requests.get(orgs_url,headers=REQUEST_HEADER) 
+        r = http_util.get(orgs_url,headers=REQUEST_HEADER) 
         return r.json()
 
     @staticmethod
+    @metrics.timed('deepdao', 'get_org_details')
     def get_org_details(org_id):
         """
         loads all the organization details (general and socials)
         """
         orgs_url = DD_ORGS_DETAILS_URL.format(org_id)
-        r = requests.get(orgs_url,headers=REQUEST_HEADER) 
+        r = http_util.get(orgs_url,headers=REQUEST_HEADER) 
         return r.json()  
 
     @staticmethod
+    @metrics.timed('deepdao', 'get_org_assets')
     def get_org_assets(org_id):
         """
         loads all the organization assets (treasury address)
         """
         assets_url = DD_ORGS_ASSETS_URL.format(org_id)
-        r = requests.get(assets_url,headers=REQUEST_HEADER) 
+        r = http_util.get(assets_url,headers=REQUEST_HEADER) 
         return r.json() 
 
     @staticmethod
-    def load_org_details_from_dd():
+    def get_checkpoint_path(crawl_dir, org_id):
+        return os.path.join(crawl_dir, '{}.json'.format(org_id))
+
+    @staticmethod
+    def read_checkpoint(crawl_dir, org_id):
+        """
+        returns the raw (details, assets, fetched_at) saved for the org, None if not crawled yet
+        """
+        path = DDDAODownloader.get_checkpoint_path(crawl_dir, org_id)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            raw = json.load(f)
+        fetched_at = raw.get('fetched_at')
+        if fetched_at is None:
+            fetched_at = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc).isoformat()
+        return raw['details'], raw['assets'], fetched_at
+
+    @staticmethod
+    def write_checkpoint(crawl_dir, org_id, details, assets, fetched_at):
+        """
+        save the raw responses of one org, written atomically so that
+        an interruption never leaves a partial file behind
+        """
+        path = DDDAODownloader.get_checkpoint_path(crawl_dir, org_id)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'details': details, 'assets': assets, 'fetched_at': fetched_at}, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def crawl_org(org_id, crawl_dir):
+        """
+        fetch details and assets of one org and checkpoint them,
+        the requests are paced by the deepdao rate limiter of http_util
+        """
+        fetched_at = datetime.now(timezone.utc).isoformat()
+        details = DDDAODownloader.get_org_details(org_id)
+        assets = DDDAODownloader.get_org_assets(org_id)
+
+        if 'data' not in details or 'data' not in assets:
+            raise ValueError('unexpected response for organization {}'.format(org_id))
+
+        DDDAODownloader.write_checkpoint(crawl_dir, org_id, details, assets, fetched_at)
+        return details, assets, fetched_at
+
+    @staticmethod
+    def crawl_orgs(org_ids, crawl_dir=None, fetched_after=None):
+        """
+        returns the raw details, assets and fetch time of the given orgs
+
+        Orgs already checkpointed in crawl_dir are not fetched again unless the
+        checkpoint is not newer than fetched_after[org_id] or older than DD_REFRESH_MAX_AGE_HOURS,
+        the others are fetched concurrently within the deepdao request rate (HTTP_HOST_RATES)
+        """
+        crawl_dir = crawl_dir or config.DD_CRAWL_DIR
+        fetched_after = fetched_after or {}
+        expiry = datetime.now(timezone.utc) - timedelta(hours=config.DD_REFRESH_MAX_AGE_HOURS)
+        org_details = {}
+        org_assets = {}
+        org_fetched_at = {}
+
+        os.makedirs(crawl_dir, exist_ok=True)
+
+        #Resume from the checkpoints of a previous crawl
+        org_ids_to_crawl = []
+        for org_id in org_ids:
+            checkpoint = DDDAODownloader.read_checkpoint(crawl_dir, org_id)
+            if checkpoint is not None:
+                checkpoint_time = datetime.fromisoformat(checkpoint[2])
+                min_time = fetched_after.get(org_id)
+                if checkpoint_time < expiry or (min_time is not None and checkpoint_time <= min_time):
+                    checkpoint = None
+            if checkpoint is None:
+                org_ids_to_crawl.append(org_id)
+            else:
+                org_details[org_id], org_assets[org_id], org_fetched_at[org_id] = checkpoint
+
+        logging.info('organizations checkpointed: {}, to crawl: {}'.format(len(org_details), len(org_ids_to_crawl)))
+
+        #Fetch DAO org details( general, socials) and assets (treasury) from third party sources
+        failed_org_ids = []
+        with ThreadPoolExecutor(max_workers=config.DD_CRAWL_WORKERS) as executor:
+            futures = {executor.submit(DDDAODownloader.crawl_org, org_id, crawl_dir): org_id
+                        for org_id in org_ids_to_crawl}
+            for idx, future in enumerate(as_completed(futures)):
+                org_id = futures[future]
+                logging.info('processing organization {}/{}'.format(idx+1, len(futures)))
+                try:
+                    org_details[org_id], org_assets[org_id], org_fetched_at[org_id] = future.result()
+                except Exception:
+                    logging.error(traceback.format_exc())
+                    failed_org_ids.append(org_id)
+
+        if len(failed_org_ids) > 0:
+            raise RuntimeError('DD crawl failed for {} organizations, rerun to resume: {}'.format(
+                len(failed_org_ids), ','.join(failed_org_ids)))
+
+        return org_details, org_assets, org_fetched_at
+
+    @staticmethod
+    def load_org_details_from_dd(crawl_dir=None):
         """
         Iterates through every organization
         and fetches general such as name, description etc, 
@@ -64,97 +176,165 @@ class DDDAODownloader:
                     assets such as treasury
         from third party source
         """
+        crawl_dir = crawl_dir or config.DD_CRAWL_DIR
         orgs = DDDAODownloader.get_orgs()
         df_dd_dao = pd.DataFrame(orgs['daosSummary'])
-        org_details = {}
-        org_assets = {}
+        org_details, org_assets, org_fetched_at = DDDAODownloader.crawl_orgs(df_dd_dao['organizationId'].unique(), crawl_dir)
+        df_dd_dao['fetched_at'] = df_dd_dao['organizationId'].map(org_fetched_at)
+        return df_dd_dao, org_details, org_assets
 
+    @staticmethod
+    def is_summary_changed(summary, org_info):
+        """
+        compare the fields of DD_REFRESH_DIFF_FIELDS between the daosSummary entry and the stored org info
+        """
+        for field in config.DD_REFRESH_DIFF_FIELDS:
+            if field not in summary or field not in org_info:
+                continue
+            new_value, old_value = summary[field], org_info[field]
+            #a value missing on both sides (None in the summary, NaN in the stored file) did not change
+            if pd.isna(new_value) and pd.isna(old_value):
+                continue
+            try:
+                if not math.isclose(float(new_value), float(old_value), rel_tol=1e-9):
+                    return True
+            except (TypeError, ValueError):
+                if str(new_value) != str(old_value):
+                    return True
+        return False
 
-        #Fetch DAO org details( general, socials) and assets (treasury) from third party sources
-        for idx, row in df_dd_dao.iterrows():
-            logging.info('processing organization {}'.format(idx))
-            org_id = row['organizationId']
+    @staticmethod
+    def refresh_data(data_path, crawl_dir=None):
+        """
+        Refetch only the orgs that are new, whose summary changed or
+        whose record is older than DD_REFRESH_MAX_AGE_HOURS and merge them back in place
+        """
+        crawl_dir = crawl_dir or config.DD_CRAWL_DIR
+        df_existing = storage.read_table(data_path)
+        file_time = datetime.fromtimestamp(os.path.getmtime(data_path), timezone.utc)
+        expiry = datetime.now(timezone.utc) - timedelta(hours=config.DD_REFRESH_MAX_AGE_HOURS)
 
-            #wait before calling
-            if org_id not in org_details or org_id not in org_assets:
-                time.sleep(2)
+        #older extracts have no organizationid / fetched_at columns
+        id_column = 'organizationid' if 'organizationid' in df_existing.columns else 'id'
+        existing_infos = {}
+        for org_info in df_existing.to_dict('records'):
+            existing_infos[org_info[id_column]] = org_info
 
-            if org_id not in org_details:
-                org_details[org_id] = DDDAODownloader.get_org_details(org_id)
+        orgs = DDDAODownloader.get_orgs()
+        df_dd_dao = pd.DataFrame(orgs['daosSummary']).drop_duplicates('organizationId')
 
-            if org_id not in org_assets:
-                org_assets[org_id] = DDDAODownloader.get_org_assets(org_id)
-        
-        return df_dd_dao, org_details, org_assets
+        fetched_after = {}
+        stale_org_ids = []
+        for summary in df_dd_dao.to_dict('records'):
+            org_id = summary['organizationId']
+            org_info = existing_infos.get(org_id)
+            if org_info is None:
+                stale_org_ids.append(org_id)
+                continue
+
+            fetched_at = org_info.get('fetched_at')
+            if isinstance(fetched_at, str):
+                fetched_at = datetime.fromisoformat(fetched_at)
+            if not isinstance(fetched_at, datetime) or pd.isna(fetched_at):
+                #rows of older extracts take the file time once, it is written back with the row
+                #so that they still age out after the file is rewritten
+                fetched_at = file_time
+                org_info['fetched_at'] = file_time.isoformat()
+            summary = {k.strip().lower(): v for k, v in summary.items()}
+            if fetched_at < expiry or DDDAODownloader.is_summary_changed(summary, org_info):
+                stale_org_ids.append(org_id)
+                fetched_after[org_id] = fetched_at
+
+        logging.info('DD refresh: {} organizations, {} new or changed'.format(df_dd_dao.shape[0], len(stale_org_ids)))
+
+        org_details, org_assets, org_fetched_at = DDDAODownloader.crawl_orgs(stale_org_ids, crawl_dir, fetched_after)
+        df_stale = df_dd_dao[df_dd_dao['organizationId'].isin(stale_org_ids)].copy()
+        df_stale['fetched_at'] = df_stale['organizationId'].map(org_fetched_at)
+        df_refreshed = DDDAODownloader.flatten_curate_data_from_dd(df_stale, org_details, org_assets)
+        refreshed_infos = {}
+        for org_info in df_refreshed.to_dict('records'):
+            refreshed_infos[org_info['organizationid']] = org_info
+
+        #keep the order of the daosSummary list, orgs dropped from deepdao are removed
+        org_infos = []
+        for org_id in df_dd_dao['organizationId']:
+            org_info = refreshed_infos.get(org_id, existing_infos.get(org_id))
+            if id_column != 'organizationid' and org_id not in refreshed_infos:
+                org_info['organizationid'] = org_id
+            org_infos.append(org_info)
+
+        return pd.DataFrame(org_infos)
 
     @staticmethod
     def flatten_curate_data_from_dd(df_dd_dao, org_details, org_assets):
         """
         Flatten and combine the data points into one dataframe
+
+        The raw data is normalized into one table per org, per social link and per asset,
+        combined with groupby / join. General information takes precedence over a social link
+        of the same name
         """
-        org_infos = []
+        org_ids = list(dict.fromkeys(df_dd_dao['organizationId']))
+        if len(org_ids) == 0:
+            return pd.DataFrame()
 
-        for idx, row in df_dd_dao.iterrows():
-            logging.info('processing organization {}'.format(idx))
-            org_id = row['organizationId']
-
-            org_info = {}
-
-            #Extract general and social information from org_details
-            for k,v in org_details[org_id]['data'].items():
-
-                if k == 'rankings':
-                    continue #not relevant at the moment
-                
-                if k == 'socials':
-                    for s in v:
-                        social_key = s['type'].strip().lower()
-                        if social_key not in org_info:
-                            org_info[social_key] = s['url'].split('/')[-1] if social_key == 'twitter' else s['url']
-                    continue
-                
-                new_key = k.strip().lower()
-                if new_key not in org_info:
-                    org_info[new_key] = v
-
-            #Extract treasury address and eth names from assets data
-            treasury_address = []
-            dd_eth_names = []
-            for ast in org_assets[org_id]['data']:
-                if ast['type'] == 'treasury':
-                    treasury_address.append(ast['address'])
-
-                if ast['description'] is not None:
-                    if 'snapshot' in ast['description'].strip().lower():
-                        if ast['address'] is not None:
-                            dd_eth_names.append(ast['address'])
-
-            org_info['treasury_address'] = ','.join(treasury_address)
-            
-            org_info['dd_eth_names'] = ','.join(dd_eth_names)
+        #Extract general information from org_details : one record per org
+        df_orgs = pd.DataFrame.from_records([org_details[org_id]['data'] for org_id in org_ids], index=org_ids)
+        df_orgs = df_orgs.drop(columns=['rankings', 'socials'], errors='ignore') #rankings not relevant at the moment
+        df_orgs.columns = df_orgs.columns.str.strip().str.lower()
+        df_orgs = df_orgs.loc[:, ~df_orgs.columns.duplicated()]
 
-            org_infos.append(org_info)
+        #Extract social information from org_details : one record per social link, first link of each type wins
+        df_socials = pd.DataFrame.from_records(
+            [(org_id, social['type'], social['url']) for org_id in org_ids
+                for social in (org_details[org_id]['data'].get('socials') or [])],
+            columns=['org_id', 'social_key', 'url'])
+        df_socials['social_key'] = df_socials['social_key'].str.strip().str.lower()
+        df_socials = df_socials.drop_duplicates(['org_id', 'social_key'])
+        is_twitter = df_socials['social_key'] == 'twitter'
+        df_socials.loc[is_twitter, 'url'] = df_socials.loc[is_twitter, 'url'].str.split('/').str[-1]
+        social_keys = [k for k in df_socials['social_key'].unique() if k not in df_orgs.columns]
+        df_socials = df_socials.pivot(index='org_id', columns='social_key', values='url').reindex(columns=social_keys)
 
-        df_org_infos = pd.DataFrame(org_infos)
+        #Extract treasury address and eth names from assets data : one record per asset
+        df_assets = pd.DataFrame.from_records(
+            [(org_id, ast['type'], ast['address'], ast['description']) for org_id in org_ids
+                for ast in org_assets[org_id]['data']],
+            columns=['org_id', 'type', 'address', 'description'])
+        is_treasury = df_assets['type'] == 'treasury'
+        is_snapshot = (df_assets['description'].str.strip().str.lower().str.contains('snapshot', regex=False, na=False)
+                        & df_assets['address'].notna())
+        df_assets['address'] = df_assets['address'] + ',' #joined by a groupby sum, the trailing comma is cut below
+        treasury_address = df_assets[is_treasury].groupby('org_id', sort=False)['address'].sum().str[:-1]
+        dd_eth_names = df_assets[is_snapshot].groupby('org_id', sort=False)['address'].sum().str[:-1]
+
+        df_org_infos = df_orgs.join(df_socials)
+        df_org_infos['treasury_address'] = treasury_address.reindex(df_org_infos.index).fillna('')
+        df_org_infos['dd_eth_names'] = dd_eth_names.reindex(df_org_infos.index).fillna('')
+
+        #one row per entry of the daosSummary list, in the same order
+        df_org_infos = df_org_infos.reindex(df_dd_dao['organizationId']).reset_index(drop=True)
+        df_org_infos['organizationid'] = df_dd_dao['organizationId'].values
+        df_org_infos['fetched_at'] = df_dd_dao['fetched_at'].values if 'fetched_at' in df_dd_dao.columns else None
         return df_org_infos
 
     @staticmethod
-    def load_data(data_path):
+    @metrics.timed('deepdao', 'load_data')
+    def load_data(data_path, refresh=False):
         """
-        Reload the data if the file doesn't exist
+        Reload the data if the file doesn't exist,
+        refresh the new and changed orgs if requested
         """
-        if os.path.exists(data_path):
+        if os.path.exists(data_path) and refresh:
+            logging.info("DD data extract available. refreshing new and changed organizations")
+            df_org_infos = DDDAODownloader.refresh_data(data_path)
+            storage.write_table(df_org_infos, data_path)
+            DDDAOIndex.invalidate(data_path)
+        elif os.path.exists(data_path):
             logging.info("DD data extract available. skipping loading")
         else:
-            logging.info("DD data extract unavailable. data needs to be extracted from dd. Expected time ~30 minutes ")
+            logging.info("DD data extract unavailable. data needs to be extracted from dd. Expected time a few minutes ")
             df_dd_dao, org_details, org_assets = DDDAODownloader.load_org_details_from_dd()
             df_org_infos = DDDAODownloader.flatten_curate_data_from_dd(df_dd_dao, org_details, org_assets)
-            df_org_infos.to_csv(data_path)
-
-            
-    
-
-        
-
-
-
+            storage.write_table(df_org_infos, data_path)
+            DDDAOIndex.invalidate(data_path)
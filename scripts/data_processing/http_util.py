@@ -0,0 +1,471 @@
+"""
+The Module is the single entry point for outgoing HTTP calls
+    - bounds the number of in-flight requests per host
+    - paces the requests of each host with an adaptive rate (AIMD token bucket),
+      429 responses are retried after Retry-After and the rate limit headers are honored
+    - reuses pooled keep-alive connections, one session per host
+    - the hosts of HTTP_SHARDED_HOSTS get these limits per shard, eg one per Covalent chain,
+      on top of the limits of the host shared by all its shards (one api key quota)
+    - applies timeouts and retries 5xx / connection errors with backoff
+    - caches responses on disk (see HTTP_CACHE_* in config)
+    - records per source request metrics (see metrics)
+"""
+# =============================================================================
+
+import email.utils
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import ExitStack
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import requests
+from requests.adapters import HTTPAdapter
+import config
+import metrics
+
+RETRY_STATUS_CODES = [500, 502, 503, 504]
+RATE_LIMITED_STATUS_CODE = 429
+
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+_host_sessions = {}
+_host_sessions_lock = threading.Lock()
+_host_rate_limiters = {}
+_host_rate_limiters_lock = threading.Lock()
+
+
+def get_limit_key(host, path):
+    """
+    key of the semaphore, session and rate limiter of a request: the host, or <host>/<shard>
+    for the hosts of HTTP_SHARDED_HOSTS (eg api.covalenthq.com/137)
+    """
+    pattern = config.HTTP_SHARDED_HOSTS.get(host)
+    if pattern is not None:
+        match = re.match(pattern, path)
+        if match is not None:
+            return '{}/{}'.format(host, match.group(1))
+    return host
+
+
+def get_limit_setting(settings, key, default):
+    """
+    setting of a limit key. A shard without its own entry takes the '<host>/*' entry of the shards of
+    its host if any, else the one of the host
+    """
+    if key in settings:
+        return settings[key]
+    host = key.split('/')[0]
+    if key != host and host + '/*' in settings:
+        return settings[host + '/*']
+    return settings.get(host, default)
+
+
+def get_host_semaphore(host):
+    """
+    returns the semaphore guarding the given host (or limit key), created on first use
+    """
+    with _host_semaphores_lock:
+        if host not in _host_semaphores:
+            limit = get_limit_setting(config.HOST_CONCURRENCY_LIMITS, host, config.DEFAULT_HOST_CONCURRENCY)
+            _host_semaphores[host] = threading.BoundedSemaphore(limit)
+        return _host_semaphores[host]
+
+
+def get_host_session(host):
+    """
+    returns the pooled session of the given host (or limit key), created on first use
+    """
+    with _host_sessions_lock:
+        if host not in _host_sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.HTTP_POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _host_sessions[host] = session
+        return _host_sessions[host]
+
+
+class HostRateLimiter:
+    """
+    Token bucket pacing the requests of one host at `rate` per second, shared by all threads.
+    The rate grows by HTTP_RATE_INCREASE after each successful response up to max_rate and is multiplied
+    by HTTP_RATE_DECREASE on each 429, at most once per HTTP_RATE_DECREASE_COOLDOWN seconds so that the 429s
+    of requests sent together count once. Retry-After and exhausted rate limit windows pause the host
+    """
+
+    def __init__(self, rate, max_rate):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.tokens = min(config.HTTP_RATE_BURST, 1)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0
+        self.decreased_at = None
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        block until the host accepts a new request
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(config.HTTP_RATE_BURST, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                wait = self.paused_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + config.HTTP_RATE_INCREASE)
+
+    def on_rate_limited(self, retry_after=None):
+        """
+        slow down and pause the host for retry_after seconds (one request interval if not given)
+        """
+        with self.lock:
+            now = time.monotonic()
+            if self.decreased_at is None or now - self.decreased_at >= config.HTTP_RATE_DECREASE_COOLDOWN:
+                self.rate = max(config.HTTP_RATE_MIN, self.rate * config.HTTP_RATE_DECREASE)
+                self.decreased_at = now
+            self.tokens = 0
+            pause = retry_after if retry_after is not None else 1.0 / self.rate
+            self.paused_until = max(self.paused_until, now + pause)
+
+    def on_quota(self, remaining, reset_after):
+        """
+        keep within the quota announced by the rate limit headers: remaining requests in the next reset_after seconds
+        """
+        with self.lock:
+            if remaining <= 0:
+                self.paused_until = max(self.paused_until, time.monotonic() + reset_after)
+            elif reset_after > 0:
+                self.rate = max(config.HTTP_RATE_MIN, min(self.rate, remaining / reset_after))
+
+
+def get_host_rate_limiter(host):
+    """
+    returns the rate limiter of the given host (or limit key), created on first use
+    """
+    with _host_rate_limiters_lock:
+        if host not in _host_rate_limiters:
+            rate, max_rate = get_limit_setting(config.HTTP_HOST_RATES, host, config.HTTP_DEFAULT_RATE)
+            _host_rate_limiters[host] = HostRateLimiter(rate, max_rate)
+        return _host_rate_limiters[host]
+
+
+def get_host_rates():
+    """
+    current request rate (per second) of each host and shard
+    """
+    with _host_rate_limiters_lock:
+        return {host: round(limiter.rate, 3) for host, limiter in _host_rate_limiters.items()}
+
+
+def parse_seconds(value, allow_date=False):
+    """
+    seconds from now of a header value: a number of seconds, an epoch timestamp or an http date
+    """
+    if value is None:
+        return None
+    try:
+        seconds = float(value)
+        #epoch timestamps (eg x-rate-limit-reset of twitter)
+        return max(seconds - time.time(), 0) if seconds > 10 ** 9 else max(seconds, 0)
+    except ValueError:
+        pass
+    if allow_date:
+        try:
+            return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0)
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+def parse_rate_limit_headers(headers):
+    """
+    (retry_after, remaining, reset_after) from the Retry-After and (X-)RateLimit-* headers, None when absent
+    """
+    retry_after = parse_seconds(headers.get('Retry-After'), allow_date=True)
+    remaining = None
+    for name in ('X-RateLimit-Remaining', 'RateLimit-Remaining', 'X-Rate-Limit-Remaining'):
+        if headers.get(name) is not None:
+            try:
+                remaining = int(float(headers.get(name)))
+            except ValueError:
+                pass
+            break
+    reset_after = None
+    for name in ('X-RateLimit-Reset-After', 'X-RateLimit-Reset', 'RateLimit-Reset', 'X-Rate-Limit-Reset'):
+        if headers.get(name) is not None:
+            reset_after = parse_seconds(headers.get(name))
+            break
+    return retry_after, remaining, reset_after
+
+
+def override_host(url):
+    """
+    point the url to the base url configured for its host in HTTP_HOST_OVERRIDES if any,
+    eg {'hub.snapshot.org': 'http://127.0.0.1:8765/hub.snapshot.org'} for a local stand-in server
+    """
+    parts = urlsplit(url)
+    base_url = config.HTTP_HOST_OVERRIDES.get(parts.netloc)
+    if base_url is None:
+        return url
+    return base_url.rstrip('/') + urlunsplit(('', '', parts.path, parts.query, parts.fragment))
+
+
+def get_backoff_delay(attempt):
+    """
+    exponential backoff with full jitter
+    """
+    delay = min(config.HTTP_BACKOFF_MAX, config.HTTP_BACKOFF_BASE * (2 ** attempt))
+    return random.uniform(0, delay)
+
+
+def send(method, url, **kwargs):
+    """
+    issue the request on the pooled session of the host once its rate limiter and a slot allow it,
+    5xx responses and connection errors are retried up to HTTP_MAX_RETRIES times,
+    429 responses up to HTTP_MAX_RATE_LIMIT_RETRIES times once the host is allowed again.
+    A request to a shard also waits for the rate limiter and a slot of its host, shared by all the shards
+    """
+    parts = urlsplit(url)
+    host = parts.netloc
+    limit_key = get_limit_key(host, parts.path)
+    source = metrics.get_source(host)
+    session = get_host_session(limit_key)
+    #(limit key, gauge name) of the shard then of the host, or of the host only
+    limit_keys = [(host, 'request_rate')]
+    if limit_key != host:
+        limit_keys.insert(0, (limit_key, 'request_rate_' + limit_key[len(host) + 1:]))
+    rate_limiters = [get_host_rate_limiter(key) for key, _ in limit_keys]
+    kwargs.setdefault('timeout', (config.HTTP_CONNECT_TIMEOUT, config.HTTP_READ_TIMEOUT))
+    url = override_host(url)
+
+    attempt = 0
+    n_rate_limited = 0
+    while True:
+        for rate_limiter in rate_limiters:
+            rate_limiter.acquire()
+        try:
+            with ExitStack() as slots:
+                for key, _ in limit_keys:
+                    slots.enter_context(get_host_semaphore(key))
+                start_time = time.perf_counter()
+                response = session.request(method, url, **kwargs)
+                elapsed = time.perf_counter() - start_time
+            metrics.record_request(source, elapsed, response.status_code,
+                                   len(response.request.body or b''), len(response.content))
+
+            #the quota of the rate limit headers and the 429s are the ones of the api key, shared by the shards
+            retry_after, remaining, reset_after = parse_rate_limit_headers(response.headers)
+            for rate_limiter, (_, rate_gauge) in zip(rate_limiters, limit_keys):
+                if remaining is not None and reset_after is not None:
+                    rate_limiter.on_quota(remaining, reset_after)
+                if response.status_code == RATE_LIMITED_STATUS_CODE:
+                    rate_limiter.on_rate_limited(retry_after)
+                elif response.status_code not in RETRY_STATUS_CODES:
+                    rate_limiter.on_success()
+                metrics.set_gauge(source, rate_gauge, rate_limiter.rate)
+
+            if response.status_code == RATE_LIMITED_STATUS_CODE and n_rate_limited < config.HTTP_MAX_RATE_LIMIT_RETRIES:
+                #the rate limiter holds the next attempt until the host accepts requests again
+                n_rate_limited += 1
+                metrics.record_retry(source, response.status_code)
+                continue
+            if response.status_code not in RETRY_STATUS_CODES or attempt == config.HTTP_MAX_RETRIES:
+                if response.status_code >= 400:
+                    metrics.record_error(source, 'http_{}'.format(response.status_code))
+                return response
+            metrics.record_retry(source, response.status_code)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt == config.HTTP_MAX_RETRIES:
+                metrics.record_exception(source, e)
+                raise
+            metrics.record_retry(source, type(e).__name__)
+        time.sleep(get_backoff_delay(attempt))
+        attempt += 1
+
+
+class CacheMissError(requests.exceptions.RequestException):
+    """
+    raised in replay mode when a request has no cached response
+    """
+
+
+def strip_secret_params(url):
+    """
+    the url without the HTTP_CACHE_SECRET_PARAMS query params (api keys)
+    """
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                if k not in config.HTTP_CACHE_SECRET_PARAMS]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
+
+
+class ResponseCache:
+    """
+    On-disk cache of successful responses with a size bounded LRU eviction.
+    Each entry is one file: a json header line followed by the raw body
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        #key -> size, least recently used first
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        cached_files = [entry for entry in os.scandir(cache_dir) if entry.name.endswith('.cache')]
+        for entry in sorted(cached_files, key=lambda e: e.stat().st_mtime):
+            self.entries[entry.name[:-len('.cache')]] = entry.stat().st_size
+            self.total_bytes += entry.stat().st_size
+
+    @staticmethod
+    def make_key(method, url, body):
+        """
+        hash of method, url and body with the secret query params removed
+        """
+        url = strip_secret_params(url)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        return hashlib.sha256(method.encode('utf-8') + b' ' + url.encode('utf-8') + b'\n' + (body or b'')).hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, key + '.cache')
+
+    def get(self, key, ttl):
+        """
+        returns the cached response if present and younger than ttl seconds
+        """
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+        try:
+            with open(self.get_path(key), 'rb') as f:
+                header = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            header = None
+        with self.lock:
+            if header is None or time.time() - header['stored_at'] > ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+        try:
+            os.utime(self.get_path(key))
+        except OSError:
+            #evicted by a concurrent put since it was read, the body read is still valid
+            pass
+
+        response = requests.Response()
+        response.status_code = header['status_code']
+        response.headers = requests.structures.CaseInsensitiveDict(header['headers'])
+        response.url = header['url']
+        response._content = body
+        return response
+
+    def put(self, key, response):
+        """
+        store the response and evict the least recently used entries above max_bytes
+        """
+        header = {
+            'stored_at': time.time(),
+            'status_code': response.status_code,
+            'headers': dict(response.headers),
+            #the api keys are not written to disk
+            'url': strip_secret_params(response.url or ''),
+        }
+        data = json.dumps(header).encode('utf-8') + b'\n' + response.content
+        path = self.get_path(key)
+        tmp_path = '{}.{}.tmp'.format(path, threading.get_ident())
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            self.total_bytes += len(data) - self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                evicted_key, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                try:
+                    os.remove(self.get_path(evicted_key))
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self.entries), 'bytes': self.total_bytes}
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    returns the process wide response cache, created on first use
+    """
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(config.HTTP_CACHE_DIR, config.HTTP_CACHE_MAX_BYTES)
+        return _response_cache
+
+
+def request(method, url, **kwargs):
+    """
+    serve the request from the cache if possible, otherwise send it
+    """
+    host = urlsplit(url).netloc
+    cache_mode = config.HTTP_CACHE_MODE
+    if cache_mode == 'off':
+        return send(method, url, **kwargs)
+
+    prepared = requests.Request(method, url, params=kwargs.get('params'),
+                    data=kwargs.get('data'), json=kwargs.get('json')).prepare()
+    cache = get_response_cache()
+    key = ResponseCache.make_key(method, prepared.url, prepared.body)
+    ttl = config.HTTP_CACHE_TTLS.get(host, config.HTTP_CACHE_DEFAULT_TTL)
+    if cache_mode == 'replay':
+        ttl = float('inf')
+
+    response = cache.get(key, ttl)
+    metrics.record_cache(metrics.get_source(host), response is not None)
+    if response is not None:
+        return response
+    if cache_mode == 'replay':
+        error = CacheMissError('no cached response for {} {}'.format(method, urlsplit(url).path))
+        metrics.record_exception(metrics.get_source(host), error)
+        raise error
+
+    response = send(method, url, **kwargs)
+    if response.status_code == 200:
+        cache.put(key, response)
+    return response
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
@@ -8,10 +8,16 @@ and transforms it to csv format
 """
 # =============================================================================
 
+import time
+STARTUP_TIME = time.perf_counter()
+
 import logging
 import sys
 from argparse import ArgumentParser
-from dao_extract import format_curated_data, collect_snapshot_orgs_data
+import config
+
+#The pipeline modules (pandas, requests, spaCy) are imported only once the arguments are validated,
+#and the spaCy model is loaded only when expand mode first extracts hotwords
 
 def init_logger():
     """
@@ -35,6 +41,22 @@ if __name__ == "__main__":
                         help="output_file_location")
     parser.add_argument("-i", "--infile", dest="in_file",
                     help="input_file_location", default='')
+    parser.add_argument("--refresh-dd", dest="refresh_dd", action="store_true",
+                    help="refetch new and changed DeepDAO orgs before collecting")
+    parser.add_argument("--cache-mode", dest="cache_mode", choices=['on','off','replay'],
+                    help="http response cache mode, replay serves only cached responses", default=None)
+    parser.add_argument("--resume", dest="resume", action="store_true",
+                    help="continue an interrupted run, completed DAOs are skipped and failed ones retried")
+    parser.add_argument("--metrics-json", dest="metrics_json", default=config.METRICS_JSON_FILE,
+                    help="where the json summary of the run metrics is written")
+    parser.add_argument("--metrics-prom", dest="metrics_prom", default=config.METRICS_PROMETHEUS_FILE,
+                    help="where the prometheus textfile of the run metrics is written")
+    parser.add_argument("--history-dir", dest="history_dir", default=config.HISTORY_DIR,
+                    help="where expand appends the history of the DAO metrics, '' disables it")
+    parser.add_argument("--progress-interval", dest="progress_interval", type=float, default=config.PROGRESS_INTERVAL,
+                    help="log the throughput and ETA every n seconds, 0 disables it")
+    parser.add_argument("--profile-startup", dest="profile_startup", action="store_true",
+                    help="log the time spent on argument parsing and on importing the mode dependencies")
 
     args = parser.parse_args()
     mode = args.mode
@@ -45,16 +67,66 @@ if __name__ == "__main__":
         logging.info('Please choose valid options')
         sys.exit(1)
 
+    if args.out_file is None or args.out_file=='':
+        logging.info('Please provide output file')
+        sys.exit(1)
+
     if args.mode == 'expand' and args.in_file=='':
         logging.info('Please provide input file')
         sys.exit(1)
 
-    #Workflow#1 : Collects the basic DAO information and write to a csv for manual curation
-    if args.mode == 'collect':
-        df_dao_list = collect_snapshot_orgs_data()
-        df_dao_list.to_csv(args.out_file)
+    if args.cache_mode is not None:
+        config.HTTP_CACHE_MODE = args.cache_mode
+
+    args_parsed_time = time.perf_counter()
+    import http_util
+    import metrics
+    from dao_extract import format_curated_data, collect_snapshot_orgs_data, COLLECT_COLUMNS, EXPAND_COLUMNS
+    from output_writer import CheckpointedWriter
+    from dao_history import DAOHistoryStore
+    import storage
+    if args.profile_startup:
+        logging.info('startup: arguments parsed in {:.1f} ms, pipeline modules imported in {:.1f} ms'.format(
+            (args_parsed_time - STARTUP_TIME) * 1000, (time.perf_counter() - args_parsed_time) * 1000))
+
+    #Rows are streamed to a csv, converted at the end if a columnar output (.parquet / .feather) is requested
+    stream_file = args.out_file
+    if storage.get_format(args.out_file) != storage.CSV:
+        stream_file = args.out_file + '.csv'
+
+    progress_reporter = metrics.ProgressReporter(args.progress_interval).start()
+    try:
+        #Workflow#1 : Collects the basic DAO information and write to a csv for manual curation
+        if args.mode == 'collect':
+            writer = CheckpointedWriter(stream_file, COLLECT_COLUMNS, resume=args.resume)
+            try:
+                collect_snapshot_orgs_data(refresh_dd=args.refresh_dd, writer=writer)
+            finally:
+                writer.close()
+
+        #Workflow#2 : Once the manual curation is done, this workflow computes additional data points (eg discord followers count etc)
+        if args.mode == 'expand':
+            writer = CheckpointedWriter(stream_file, EXPAND_COLUMNS, resume=args.resume)
+            try:
+                format_curated_data(args.in_file, writer=writer)
+            finally:
+                writer.close()
+
+        if stream_file != args.out_file:
+            storage.convert_table(stream_file, args.out_file)
+
+        #only complete expand runs are added to the history
+        if args.mode == 'expand' and args.history_dir:
+            DAOHistoryStore(args.history_dir).append_expand_output(args.out_file, args.in_file)
 
-    #Workflow#2 : Once the manual curation is done, this workflow computes additional data points (eg discord followers count etc)
-    if args.mode == 'expand':
-        df_dao_final = format_curated_data(args.in_file)
-        df_dao_final.to_csv(args.out_file)
+        if config.HTTP_CACHE_MODE != 'off':
+            logging.info('http cache stats: {}'.format(http_util.get_response_cache().stats()))
+        logging.info('request rates per second: {}'.format(http_util.get_host_rates()))
+    finally:
+        #metrics are written for interrupted runs too
+        progress_reporter.stop()
+        if args.metrics_json:
+            metrics.write_json(args.metrics_json)
+        if args.metrics_prom:
+            metrics.write_prometheus(args.metrics_prom)
+        logging.info('run metrics written to {} {}'.format(args.metrics_json or '', args.metrics_prom or ''))
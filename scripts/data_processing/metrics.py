@@ -0,0 +1,371 @@
+"""
+The Module records per source metrics of a pipeline run
+    - http requests, latency histogram, bytes, retries, errors by type and cache hits (recorded by http_util)
+    - duration of the loader calls and of the NLP step
+    - DAOs completed, skipped and failed, with an optional periodic progress line
+The metrics are written at the end of the run as a json summary and a prometheus textfile
+"""
+# =============================================================================
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+import config
+
+_lock = threading.Lock()
+
+
+class Histogram:
+    """
+    Counts observations per upper bound bucket, the last bucket is +Inf
+    """
+
+    def __init__(self, buckets=None):
+        self.buckets = list(buckets or config.METRICS_LATENCY_BUCKETS)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        idx = 0
+        while idx < len(self.buckets) and value > self.buckets[idx]:
+            idx += 1
+        self.bucket_counts[idx] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self):
+        counts = []
+        total = 0
+        for count in self.bucket_counts:
+            total += count
+            counts.append(total)
+        return counts
+
+    def quantile(self, q):
+        """
+        upper bound of the bucket holding the q quantile, None when empty or beyond the last bucket
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        for upper_bound, total in zip(self.buckets, self.cumulative_counts()):
+            if total >= rank:
+                return upper_bound
+        return None
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'buckets': {str(b): c for b, c in zip(self.buckets + ['+Inf'], self.cumulative_counts())},
+        }
+
+
+class SourceMetrics:
+    """
+    Metrics of one source (snapshot, deepdao, covalent, discord, twitter, spacy)
+    """
+
+    def __init__(self):
+        self.responses = Counter() #status code -> count
+        self.latency = Histogram()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.retries = Counter() #reason -> count
+        self.errors = Counter() #error type -> count
+        self.cache = Counter() #hit / miss -> count
+        self.calls = {} #operation -> duration histogram
+        self.counts = Counter() #other counters, eg texts processed
+        self.gauges = {} #current values, eg request rate
+
+    def to_dict(self):
+        return {
+            'requests': sum(self.responses.values()),
+            'responses': {str(k): v for k, v in sorted(self.responses.items())},
+            'latency_s': self.latency.to_dict(),
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'retries': dict(self.retries),
+            'errors': dict(self.errors),
+            'cache': dict(self.cache),
+            'calls': {operation: histogram.to_dict() for operation, histogram in sorted(self.calls.items())},
+            'counts': dict(self.counts),
+            'gauges': dict(self.gauges),
+        }
+
+
+_sources = {}
+_items = Counter() #completed / skipped / failed DAOs
+_progress = {'total': None, 'counted': None}
+_started_at = time.time()
+
+
+def get_source(host):
+    """
+    source name of the host, the host itself when it is not listed in METRICS_SOURCES
+    """
+    return config.METRICS_SOURCES.get(host, host)
+
+
+def _get(source):
+    if source not in _sources:
+        _sources[source] = SourceMetrics()
+    return _sources[source]
+
+
+def reset():
+    """
+    drop all the recorded metrics, eg between benchmark runs
+    """
+    global _started_at
+    with _lock:
+        _sources.clear()
+        _items.clear()
+        _progress.update(total=None, counted=None)
+        _started_at = time.time()
+
+
+def record_request(source, elapsed, status_code, bytes_sent=0, bytes_received=0):
+    with _lock:
+        metrics = _get(source)
+        metrics.responses[status_code] += 1
+        metrics.latency.observe(elapsed)
+        metrics.bytes_sent += bytes_sent
+        metrics.bytes_received += bytes_received
+
+
+def record_retry(source, reason):
+    with _lock:
+        _get(source).retries[str(reason)] += 1
+
+
+def record_error(source, error_type):
+    with _lock:
+        _get(source).errors[error_type] += 1
+
+
+def record_exception(source, e):
+    """
+    record the type of an exception once, the callers up the stack (loader, timed) see it
+    as already recorded when the transport or an inner call recorded it
+    """
+    if getattr(e, 'metrics_recorded', False):
+        return
+    record_error(source, type(e).__name__)
+    try:
+        e.metrics_recorded = True
+    except AttributeError:
+        pass
+
+
+def record_cache(source, hit):
+    with _lock:
+        _get(source).cache['hit' if hit else 'miss'] += 1
+
+
+def increment(source, name, value=1):
+    with _lock:
+        _get(source).counts[name] += value
+
+
+def set_gauge(source, name, value):
+    with _lock:
+        _get(source).gauges[name] = value
+
+
+def record_call(source, operation, elapsed):
+    with _lock:
+        metrics = _get(source)
+        if operation not in metrics.calls:
+            metrics.calls[operation] = Histogram()
+        metrics.calls[operation].observe(elapsed)
+
+
+@contextmanager
+def timed(source, operation):
+    """
+    record the duration of a loader call and the type of the error it raises if any,
+    usable as a context manager or as a decorator
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        record_exception(source, e)
+        raise
+    finally:
+        record_call(source, operation, time.perf_counter() - start_time)
+
+
+def record_item(status):
+    """
+    one DAO is done: completed, skipped or failed
+    """
+    with _lock:
+        _items[status] += 1
+
+
+def set_progress_total(total, counted=None):
+    """
+    number of DAOs expected for the progress ETA, counted : statuses counting toward it (all by default)
+    """
+    with _lock:
+        _progress.update(total=total, counted=counted)
+
+
+def get_summary():
+    with _lock:
+        return {
+            'started_at': _started_at,
+            'duration_s': round(time.time() - _started_at, 3),
+            'items': dict(_items),
+            'sources': {source: metrics.to_dict() for source, metrics in sorted(_sources.items())},
+        }
+
+
+def write_json(path):
+    """
+    write the metrics summary as json
+    """
+    write_file(path, json.dumps(get_summary(), indent=4))
+
+
+def format_labels(**labels):
+    return ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels.items())
+
+
+def get_rate_labels(source, gauge):
+    """
+    labels of a request rate gauge, request_rate_<chain> are the rates of the shards of a host
+    """
+    if gauge == 'request_rate':
+        return {'source': source}
+    return {'source': source, 'chain': gauge[len('request_rate_'):]}
+
+
+def format_prometheus(summary):
+    """
+    prometheus text exposition of the summary, for the node exporter textfile collector
+    """
+    prefix = config.METRICS_PROMETHEUS_PREFIX
+    lines = []
+
+    def add(name, metric_type, help_text, samples):
+        lines.append('# HELP {}_{} {}'.format(prefix, name, help_text))
+        lines.append('# TYPE {}_{} {}'.format(prefix, name, metric_type))
+        for suffix, labels, value in samples:
+            label_text = '{{{}}}'.format(format_labels(**labels)) if labels else ''
+            lines.append('{}_{}{}{} {}'.format(prefix, name, suffix, label_text, value))
+
+    def histogram_samples(histogram, **labels):
+        samples = [('_bucket', dict(labels, le=le), count) for le, count in histogram['buckets'].items()]
+        samples.append(('_sum', labels, histogram['sum']))
+        samples.append(('_count', labels, histogram['count']))
+        return samples
+
+    sources = summary['sources'].items()
+    add('http_requests_total', 'counter', 'HTTP responses by source and status code',
+        [('', {'source': s, 'status': status}, n) for s, m in sources for status, n in m['responses'].items()])
+    add('http_request_duration_seconds', 'histogram', 'HTTP request latency by source, per attempt',
+        [sample for s, m in sources if m['latency_s']['count'] for sample in histogram_samples(m['latency_s'], source=s)])
+    add('http_sent_bytes_total', 'counter', 'HTTP request body bytes by source',
+        [('', {'source': s}, m['bytes_sent']) for s, m in sources if m['requests']])
+    add('http_received_bytes_total', 'counter', 'HTTP response body bytes by source',
+        [('', {'source': s}, m['bytes_received']) for s, m in sources if m['requests']])
+    add('http_retries_total', 'counter', 'HTTP retries by source and reason',
+        [('', {'source': s, 'reason': reason}, n) for s, m in sources for reason, n in m['retries'].items()])
+    add('errors_total', 'counter', 'errors by source and type',
+        [('', {'source': s, 'type': error_type}, n) for s, m in sources for error_type, n in m['errors'].items()])
+    add('cache_lookups_total', 'counter', 'HTTP cache lookups by source and result',
+        [('', {'source': s, 'result': result}, n) for s, m in sources for result, n in m['cache'].items()])
+    add('call_duration_seconds', 'histogram', 'loader and NLP call duration by source and operation',
+        [sample for s, m in sources for operation, histogram in m['calls'].items()
+                    for sample in histogram_samples(histogram, source=s, operation=operation)])
+    add('request_rate', 'gauge', 'current adaptive request rate per second by source, and by chain for the sharded hosts',
+        [('', get_rate_labels(s, gauge), value) for s, m in sources for gauge, value in m['gauges'].items()
+                    if gauge == 'request_rate' or gauge.startswith('request_rate_')])
+    add('items_total', 'counter', 'DAOs by outcome',
+        [('', {'status': status}, n) for status, n in summary['items'].items()])
+    add('run_duration_seconds', 'gauge', 'duration of the run',
+        [('', {}, summary['duration_s'])])
+    add('run_start_timestamp_seconds', 'gauge', 'start time of the run',
+        [('', {}, summary['started_at'])])
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path):
+    """
+    write the metrics as a prometheus textfile
+    """
+    write_file(path, format_prometheus(get_summary()))
+
+
+def write_file(path, content):
+    """
+    atomic write, so that a collector never reads a partial file
+    """
+    directory = os.path.dirname(path)
+    if directory != '':
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return '{}h{:02d}m'.format(seconds // 3600, seconds % 3600 // 60)
+    return '{}m{:02d}s'.format(seconds // 60, seconds % 60)
+
+
+def get_progress_line(elapsed):
+    with _lock:
+        items = dict(_items)
+        total, counted = _progress['total'], _progress['counted']
+        n_requests = sum(sum(m.responses.values()) for m in _sources.values())
+    done = sum(n for status, n in items.items() if counted is None or status in counted)
+    rate = done / elapsed if elapsed > 0 else 0
+    line = 'progress: {} done ({} completed, {} skipped, {} failed), {:.2f} DAO/s, {:.1f} req/s'.format(
+        done, items.get('completed', 0), items.get('skipped', 0), items.get('failed', 0),
+        rate, n_requests / elapsed if elapsed > 0 else 0)
+    if total is not None:
+        eta = format_duration(max(total - done, 0) / rate) if rate > 0 else '?'
+        line += ', {}/{}, eta {}'.format(done, total, eta)
+    return line
+
+
+class ProgressReporter:
+    """
+    Logs the throughput and the ETA every `interval` seconds from a background thread
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+        self.started_at = time.perf_counter()
+
+    def start(self):
+        if self.interval and self.interval > 0:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            logging.info(get_progress_line(time.perf_counter() - self.started_at))
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
@@ -5,19 +5,40 @@
 """The Module applies NLP to extract entities from tweets"""
 # =============================================================================
 
-import en_core_web_sm
-nlp = en_core_web_sm.load()
+import config
+import metrics
+import threading
+import time
+import logging
 
 from collections import Counter
 from string import punctuation
 
-def get_hotwords(text):
+_nlp = None
+_nlp_lock = threading.Lock()
+
+def get_nlp():
     """
-    identify keywords from the text
+    returns the spaCy model, loaded on first use
+    only POS tags are used, the components excluded in config are not loaded
     """
+    global _nlp
+    with _nlp_lock:
+        if _nlp is None:
+            start_time = time.perf_counter()
+            import en_core_web_sm
+            _nlp = en_core_web_sm.load(exclude=config.NLP_EXCLUDED_COMPONENTS)
+            metrics.record_call('spacy', 'load_model', time.perf_counter() - start_time)
+            logging.info('spaCy model loaded in {:.1f} s'.format(time.perf_counter() - start_time))
+        return _nlp
+
+def extract_hotwords(doc):
+    """
+    identify keywords from the processed text
+    """
+    nlp = get_nlp()
     result = []
     pos_tag = ['PROPN', 'ADJ', 'NOUN'] 
-    doc = nlp(text.lower())
     for token in doc:
         if(token.text in nlp.Defaults.stop_words or token.text in punctuation):
             continue
@@ -31,3 +52,28 @@ def get_hotwords(text):
                 
     return set(result)
 
+@metrics.timed('spacy', 'hotwords_batch')
+def get_hotwords_batch(texts, batch_size=None, n_process=None):
+    """
+    identify keywords from each of the texts, processed together with nlp.pipe
+    texts which are not available (None) get an empty set
+    """
+    batch_size = batch_size or config.NLP_BATCH_SIZE
+    n_process = n_process or config.NLP_PROCESSES
+    results = [set() for _ in texts]
+    if not config.NLP_ENABLED:
+        return results
+    indexed_texts = [(idx, text.lower()) for idx, text in enumerate(texts) if isinstance(text, str)]
+    if len(indexed_texts) == 0:
+        return results
+    metrics.increment('spacy', 'texts', len(indexed_texts))
+    docs = get_nlp().pipe((text for _, text in indexed_texts), batch_size=batch_size, n_process=n_process)
+    for (idx, _), doc in zip(indexed_texts, docs):
+        results[idx] = extract_hotwords(doc)
+    return results
+
+def get_hotwords(text):
+    """
+    identify keywords from the text
+    """
+    return get_hotwords_batch([text])[0]
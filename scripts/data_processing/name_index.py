@@ -0,0 +1,168 @@
+"""
+The Module provides an approximate name index to map snapshot spaces to deepdao orgs
+when their names do not match exactly
+    - names, eth names, website domains and twitter handles are normalized into keys
+    - keys are indexed by character trigrams, a query only visits the postings of its own trigrams
+    - candidates are ranked by the dice similarity of their trigram sets
+"""
+# =============================================================================
+
+import re
+from urllib.parse import urlsplit
+import numpy as np
+import config
+
+NON_ALPHANUMERIC = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_name(text):
+    """
+    lowercase alphanumeric name without the .eth suffix and the generic words (dao, finance...)
+    """
+    if not isinstance(text, str):
+        return ''
+    text = text.strip().lower()
+    if text.endswith('.eth'):
+        text = text[:-len('.eth')]
+    words = [word for word in NON_ALPHANUMERIC.split(text) if word != '']
+    significant_words = [word for word in words if word not in config.DD_FUZZY_STOPWORDS]
+    return ''.join(significant_words or words)
+
+
+def normalize_domain(url):
+    """
+    the distinctive part of a website: uniswap for https://app.uniswap.org/#/swap,
+    the subdomain or first path segment on shared hosts (xyz.gitbook.io, medium.com/xyz)
+    """
+    if not isinstance(url, str) or url.strip() == '':
+        return ''
+    url = url.strip().lower()
+    if '://' not in url:
+        url = 'http://' + url
+    parts = urlsplit(url)
+    host = parts.netloc.split('@')[-1].split(':')[0]
+    if host.startswith('www.'):
+        host = host[len('www.'):]
+    labels = [label for label in host.split('.') if label != '']
+    if len(labels) == 0:
+        return ''
+    if '.'.join(labels[-2:]) in config.DD_FUZZY_SHARED_DOMAINS:
+        if len(labels) > 2:
+            return normalize_name(labels[0])
+        path_segments = [segment for segment in parts.path.split('/') if segment != '']
+        return normalize_name(path_segments[0].lstrip('@')) if path_segments else ''
+    return normalize_name(labels[-2] if len(labels) >= 2 else labels[0])
+
+
+def normalize_handle(handle):
+    """
+    twitter handle without @ or url prefix
+    """
+    if not isinstance(handle, str):
+        return ''
+    handle = handle.strip().rstrip('/').split('/')[-1].split('?')[0]
+    return normalize_name(handle.lstrip('@'))
+
+
+def get_trigrams(key):
+    padded = ' {} '.format(key)
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class NameIndex:
+    """
+    Character trigram inverted index over normalized keys, each key belongs to one record
+    """
+
+    def __init__(self):
+        self.key_records = []
+        self.key_sizes = []
+        self.postings = {}
+
+    def add(self, record_idx, key):
+        if len(key) < config.DD_FUZZY_MIN_KEY_LENGTH:
+            return
+        key_idx = len(self.key_records)
+        trigrams = get_trigrams(key)
+        self.key_records.append(record_idx)
+        self.key_sizes.append(len(trigrams))
+        for trigram in trigrams:
+            self.postings.setdefault(trigram, []).append(key_idx)
+
+    def freeze(self):
+        """
+        convert the postings to arrays once every key is added
+        """
+        self.key_records = np.asarray(self.key_records, dtype=np.int64)
+        self.key_sizes = np.asarray(self.key_sizes, dtype=np.float64)
+        self.postings = {trigram: np.asarray(keys, dtype=np.int64) for trigram, keys in self.postings.items()}
+        return self
+
+    @staticmethod
+    def from_records(records):
+        """
+        index the name, eth names, website and twitter handle of each record
+        """
+        index = NameIndex()
+        for record_idx, record in enumerate(records):
+            keys = set()
+            keys.add(normalize_name(record.get('name')))
+            for eth_name in record.get('dd_eth_names') or []:
+                keys.add(normalize_name(eth_name))
+            keys.add(normalize_domain(record.get('website')))
+            keys.add(normalize_handle(record.get('twitter')))
+            for key in keys:
+                index.add(record_idx, key)
+        return index.freeze()
+
+    @staticmethod
+    def get_query_keys(eth_name, name, website=None, twitter=None):
+        """
+        normalized keys of a snapshot space
+        """
+        return [normalize_name(eth_name), normalize_name(name), normalize_domain(website), normalize_handle(twitter)]
+
+    def search_key(self, key, min_score):
+        """
+        (key ids, scores) of the keys scoring at least min_score against the key.
+        The shared trigrams are counted in a dense array with one slot per key (each posting holds a key once),
+        a key reaching min_score shares at least min_shared trigrams with the query
+        """
+        trigrams = get_trigrams(key)
+        n_trigrams = len(trigrams)
+        shared = np.zeros(len(self.key_records), dtype=np.int16)
+        for trigram in trigrams:
+            postings = self.postings.get(trigram)
+            if postings is not None:
+                shared[postings] += 1
+
+        min_shared = max(int(np.ceil(min_score * n_trigrams / (2.0 - min_score) - 1e-9)), 1)
+        key_ids = np.flatnonzero(shared >= min_shared)
+        scores = 2.0 * shared[key_ids] / (n_trigrams + self.key_sizes[key_ids])
+        keep = scores >= min_score
+        return key_ids[keep], scores[keep]
+
+    def search(self, keys, top_k=5, min_score=None):
+        """
+        ranked [(record index, score)] of the records best matching any of the query keys, scores at least min_score
+        (DD_FUZZY_CANDIDATE_MIN_SCORE by default). The score of a record is the best dice similarity
+        between a query key and one of its keys
+        """
+        if min_score is None:
+            min_score = config.DD_FUZZY_CANDIDATE_MIN_SCORE
+        best_scores = {}
+        for key in set(keys):
+            if len(key) < config.DD_FUZZY_MIN_KEY_LENGTH:
+                continue
+            key_ids, scores = self.search_key(key, min_score)
+            #a record may have several keys in the top ones, keep a few more than top_k
+            n_top_keys = top_k * 4
+            if len(scores) > n_top_keys:
+                top = np.argpartition(scores, -n_top_keys)[-n_top_keys:]
+                key_ids, scores = key_ids[top], scores[top]
+            for record_idx, score in zip(self.key_records[key_ids].tolist(), scores.tolist()):
+                if score > best_scores.get(record_idx, 0):
+                    best_scores[record_idx] = score
+
+        ranked = sorted(best_scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:top_k]
@@ -0,0 +1,166 @@
+"""
+The Module writes the pipeline output
+    - streams rows to the csv as each DAO finishes
+    - journals the completed, skipped and failed DAOs so that a run can be resumed
+"""
+# =============================================================================
+
+import csv
+import json
+import logging
+import math
+import os
+import threading
+import pandas as pd
+import metrics
+
+COMPLETED = 'completed'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+
+def format_value(value):
+    """
+    format the value the same way DataFrame.to_csv does
+    """
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ''
+    return value
+
+
+def truncate_csv_records(path, n_records):
+    """
+    keep the first n_records records of the csv (quoted values may span lines), returns the number dropped
+    """
+    record_ends = []
+    with open(path, newline='') as f:
+        offset = 0
+
+        def iter_lines():
+            nonlocal offset
+            for line in f:
+                offset += len(line.encode(f.encoding))
+                yield line
+
+        for _ in csv.reader(iter_lines()):
+            record_ends.append(offset)
+    if len(record_ends) <= n_records:
+        return 0
+    with open(path, 'rb+') as f:
+        f.truncate(record_ends[n_records - 1] if n_records > 0 else 0)
+    return len(record_ends) - n_records
+
+
+class RowCollector:
+    """
+    Keeps the rows in memory, used when no output file is streamed
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.done = set()
+        self.n_rows = 0
+
+    def is_done(self, eth_name):
+        return eth_name in self.done
+
+    def write_row(self, eth_name, row):
+        self.rows.append(row)
+        self.done.add(eth_name)
+        self.n_rows += 1
+        metrics.record_item(COMPLETED)
+
+    def mark_skipped(self, eth_name, reason=''):
+        self.done.add(eth_name)
+        metrics.record_item(SKIPPED)
+
+    def mark_failed(self, eth_name, reason=''):
+        metrics.record_item(FAILED)
+
+    def get_dataframe(self):
+        return pd.DataFrame(self.rows)
+
+    def close(self):
+        pass
+
+
+class CheckpointedWriter:
+    """
+    Streams rows to out_file as soon as they are written and records the status of
+    each DAO in <out_file>.journal. With resume, completed and skipped DAOs of
+    the previous run are not processed again and new rows are appended
+    """
+
+    def __init__(self, out_file, columns, resume=False):
+        self.out_file = out_file
+        self.journal_file = out_file + '.journal'
+        self.columns = columns
+        self.status = {}
+        self.n_rows = 0
+        self.lock = threading.Lock()
+
+        resume = resume and os.path.exists(out_file)
+        if resume:
+            journaled = os.path.exists(self.journal_file)
+            if journaled:
+                with open(self.journal_file, 'rb+') as f:
+                    content = f.read()
+                    #entry of an interrupted write, the next entries are appended after it
+                    if content != b'' and not content.endswith(b'\n'):
+                        f.truncate(content.rfind(b'\n') + 1)
+                for line in content.decode('utf-8').splitlines(keepends=True):
+                    if line.strip() == '' or not line.endswith('\n'):
+                        continue
+                    entry = json.loads(line)
+                    self.status[entry['eth_name']] = entry['status']
+            self.n_rows = sum(1 for status in self.status.values() if status == COMPLETED)
+            if journaled:
+                #a row is flushed before its journal entry, the rows of an interrupted write are dropped
+                n_dropped = truncate_csv_records(out_file, self.n_rows + 1)
+                if n_dropped > 0:
+                    logging.info('resuming {}: {} rows without a journal entry dropped'.format(out_file, n_dropped))
+            logging.info('resuming {}: {} completed, {} failed to retry'.format(
+                out_file, self.n_rows, sum(1 for status in self.status.values() if status == FAILED)))
+
+        self.out = open(out_file, 'a' if resume else 'w', newline='')
+        self.journal = open(self.journal_file, 'a' if resume else 'w')
+        self.writer = csv.DictWriter(self.out, fieldnames=[''] + columns)
+        if not resume:
+            self.writer.writeheader()
+            self.out.flush()
+
+    def is_done(self, eth_name):
+        return self.status.get(eth_name) in (COMPLETED, SKIPPED)
+
+    def write_journal(self, eth_name, status, reason=''):
+        self.status[eth_name] = status
+        metrics.record_item(status)
+        entry = {'eth_name': eth_name, 'status': status}
+        if reason != '':
+            entry['reason'] = reason
+        self.journal.write(json.dumps(entry) + '\n')
+        self.journal.flush()
+
+    def write_row(self, eth_name, row):
+        """
+        append the row to the output file and mark the DAO as completed
+        """
+        with self.lock:
+            out_row = {k: format_value(v) for k, v in row.items()}
+            out_row[''] = self.n_rows
+            self.writer.writerow(out_row)
+            self.out.flush()
+            self.n_rows += 1
+            self.write_journal(eth_name, COMPLETED)
+
+    def mark_skipped(self, eth_name, reason=''):
+        with self.lock:
+            self.write_journal(eth_name, SKIPPED, reason)
+
+    def mark_failed(self, eth_name, reason=''):
+        with self.lock:
+            self.write_journal(eth_name, FAILED, reason)
+
+    def close(self):
+        self.out.close()
+        self.journal.close()
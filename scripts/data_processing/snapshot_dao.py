@@ -6,15 +6,39 @@
 # =============================================================================
 
 
-import requests
+import http_util
 import pandas as pd
 import sys
 import logging
 import traceback
 import config
+import metrics
 
 
 SNAPSHOT_DAO_LIST_URL = config.SNAPSHOT_DAO_LIST_URL
+SPACES_QUERY = """
+query Spaces($ids: [String], $first: Int) {
+    spaces (
+        first: $first,
+        where: {
+            id_in: $ids
+        }
+    )
+    {
+        id
+        name
+        about
+        categories
+        network
+        avatar
+        website
+        twitter
+        symbol
+        followersCount
+        proposalsCount
+    }
+}
+"""
 
 class SnapshotDAOLoader:
 
@@ -24,74 +48,89 @@ class SnapshotDAOLoader:
         pass
 
     @staticmethod
-    def get_daos():
+    @metrics.timed('snapshot', 'get_daos')
+    def get_daos(top_k=None):
         """
         returns the list of DAOs available in Snapshot
         """
         try:
             url = SNAPSHOT_DAO_LIST_URL
-            resp = requests.get(url)
+            resp = http_util.get(url)
             dao_spaces = resp.json()['spaces']
+            return SnapshotDAOLoader.parse_daos(dao_spaces, top_k)
+            
+        except Exception as e:
+            metrics.record_exception('snapshot', e)
+            logging.error(traceback.format_exc())
 
-            #Insights #1
-            logging.info ('total num of daos found: {}'.format(len([dao for dao in dao_spaces])))
+    @staticmethod
+    def parse_daos(dao_spaces, top_k=None):
+        """
+        Transforms the explore payload to <dao_category, dao_eth_name, dao_name, dao_followers_count, dao_network> format
+        sorted by followers count. If DAO has more than one category, it has one entry per category.
+        top_k keeps only the top_k DAOs by followers count
+        """
+        spaces = dao_spaces.values()
+        df_daos = pd.DataFrame({
+            'category': [space.get('categories') or ['NA'] for space in spaces],
+            'eth_name': list(dao_spaces.keys()),
+            'name': [space['name'] for space in spaces],
+            'followers_count': [space.get('followers') or 0 for space in spaces],
+            'network': [space.get('network') for space in spaces],
+        })
 
-            #Insights #2
-            category_list = []
-            for dao_name in dao_spaces:
-                category_list = category_list + dao_spaces[dao_name].get('categories',[])
-            logging.info('categories found: {}'.format(','.join(set(category_list))))
+        #Insights #1
+        logging.info ('total num of daos found: {}'.format(df_daos.shape[0]))
 
-            # Transforms data to <dao_category, dao_eth_name, dao_name, dao_followers_count> format
-            # If DAO has more than one category, it will have multiple entries in the data frame one for each category
-            dao_list = []
-            for k,v in dao_spaces.items():
-                categories = v.get('categories',['NA']) 
-                categories = categories if len(categories) > 0 else ['NA']
-                dao_list = dao_list + [(c, k, v['name'], v.get('followers',0)) for c in categories]
+        df_dao_list = df_daos.explode('category')
 
-            df_dao_list = pd.DataFrame(dao_list)
-            df_dao_list.columns = ['category','eth_name','name','followers_count']
-            return df_dao_list.sort_values('followers_count', ascending=False).to_dict('records')
-            
-        except Exception as e:
-            logging.error(traceback.format_exc())
+        #Insights #2
+        category_counts = df_dao_list['category'].value_counts()
+        logging.info('categories found: {}'.format(','.join(c for c in category_counts.index if c != 'NA')))
+
+        if top_k is not None:
+            df_daos = df_daos.nlargest(top_k, 'followers_count')
+            df_dao_list = df_daos.explode('category')
 
+        return df_dao_list.sort_values('followers_count', ascending=False, kind='stable').to_dict('records')
 
+    @staticmethod
+    @metrics.timed('snapshot', 'get_daos_info')
+    def get_daos_info(eth_names, batch_size=None):
+        """
+        Fetches key data points from snapshot for many DAOs,
+        batch_size spaces per request. Returns a dict keyed by eth name, DAOs not found
+        in snapshot are left out, and the error of each DAO whose batch failed
+        """
+        batch_size = batch_size or config.SNAPSHOT_BATCH_SIZE
+        eth_names = list(dict.fromkeys(eth_names))
+        daos_info = {}
+        failed = {}
+        for start in range(0, len(eth_names), batch_size):
+            batch = eth_names[start:start + batch_size]
+            try:
+                url = config.SNAPSHOT_GRAPHQL_URL
+                variables = {'ids': batch, 'first': len(batch)}
+                resp = http_util.post(url, json={'query': SPACES_QUERY, 'variables': variables})
+                for space in resp.json()['data']['spaces']:
+                    daos_info[space['id']] = space
+            except Exception as e:
+                metrics.record_exception('snapshot', e)
+                logging.error(traceback.format_exc())
+                failed.update((eth_name, repr(e)) for eth_name in batch)
+        return daos_info, failed
+
+    @metrics.timed('snapshot', 'get_dao_info')
     def get_dao_info(self):
         """
         Fetches key data points from snapshot for the given DAO
         """
         try:
-            query = """
-            query Spaces {
-            spaces (
-                where:{
-                id:"eth_name"
-                }
-            )
-            {
-                id
-                name
-                about
-                categories
-                network
-                avatar
-                website
-                twitter
-                symbol
-                followersCount
-                proposalsCount
-            }
-            }
-            """
-            query = query.replace("eth_name",self.dao_name)
-
             url = config.SNAPSHOT_GRAPHQL_URL
-            resp = requests.post(url, json={'query': query})
+            variables = {'ids': [self.dao_name], 'first': 1}
+            resp = http_util.post(url, json={'query': SPACES_QUERY, 'variables': variables})
             self.dao_info = resp.json()['data']['spaces'][0] #get the first result
             return self.dao_info
         except Exception as e:
+            metrics.record_exception('snapshot', e)
             logging.error(traceback.format_exc())
-
-
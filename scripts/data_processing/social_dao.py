@@ -9,8 +9,9 @@
 """
 # =============================================================================
 
-import requests
+import http_util
 import config
+import metrics
 
 DISCORD_API_URL = config.DISCORD_API_URL
 TWITTER_API_URL = config.TWITTER_API_URL
@@ -28,24 +29,28 @@ class SocialDAOLoader:
         self.fetch_twitter_stats()
         return self.dao_info
 
+    @metrics.timed('discord', 'member_count')
     def fetch_discord_member_count(self):
         try:
             invite_id = self.dao_info['discord_url'].split('/')[-1]
             discord_count_ui_url = DISCORD_API_URL.format(invite_id)
-            response = requests.get(discord_count_ui_url)
+            response = http_util.get(discord_count_ui_url)
             self.dao_info['discord_member_count'] = response.json()['approximate_member_count']
         except Exception as e:
+            metrics.record_exception('discord', e)
             self.dao_info['discord_member_count'] = None
 
+    @metrics.timed('twitter', 'profile')
     def fetch_twitter_stats(self):
         try:
             twitter_handle = self.dao_info['twitter_handle']
             url = TWITTER_API_URL.format(twitter_handle)
             headers = {"Authorization": "Bearer {}".format(config.TWITTER_BEARER_TOKEN)}
-            response = requests.request("GET", url, headers = headers)
+            response = http_util.get(url, headers = headers)
             self.dao_info['twitter_profile_description'] = response.json()['description']
             self.dao_info['twitter_followers_count'] = response.json()['followers_count']
-        except:
+        except Exception as e:
+            metrics.record_exception('twitter', e)
             self.dao_info['twitter_profile_description'] = None
             self.dao_info['twitter_followers_count'] = None
         
\ No newline at end of file
@@ -0,0 +1,81 @@
+"""
+The Module runs the fetch stages of one DAO as a small dependency graph
+    - each stage declares the stages it needs, ready stages run concurrently
+    - a failed stage does not stop the others, the stages depending on it are skipped
+"""
+# =============================================================================
+
+import logging
+import traceback
+from concurrent.futures import wait, FIRST_COMPLETED
+import metrics
+
+
+class SkippedStageError(Exception):
+    """
+    recorded for a stage whose inputs failed
+    """
+
+
+class StageGraph:
+    """
+    Stages are functions without arguments, they exchange their data through the loaders they belong to.
+    run() returns the errors of the stages which failed or were skipped, by stage name
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, name, fn, inputs=(), source='pipeline'):
+        """
+        declare a stage, inputs : names of the stages which must complete first
+        """
+        self.stages[name] = (fn, list(inputs), source)
+        return self
+
+    @staticmethod
+    def run_stage(name, fn, source):
+        with metrics.timed(source, 'stage_' + name):
+            fn()
+
+    def run(self, executor):
+        """
+        run the stages on the executor, returns {stage name: error} for the failed and skipped stages
+        """
+        pending = dict(self.stages)
+        completed = set()
+        errors = {}
+        running = {}
+
+        while pending or running:
+            #submit the ready stages, skip the ones depending on a failed stage
+            changed = True
+            while changed:
+                changed = False
+                for name, (fn, inputs, source) in list(pending.items()):
+                    failed_inputs = [stage for stage in inputs if stage in errors]
+                    if failed_inputs:
+                        errors[name] = SkippedStageError('inputs failed: {}'.format(', '.join(failed_inputs)))
+                        del pending[name]
+                        changed = True
+                    elif all(stage in completed for stage in inputs):
+                        running[executor.submit(StageGraph.run_stage, name, fn, source)] = name
+                        del pending[name]
+
+            if not running:
+                #inputs which are never declared
+                for name, (_, inputs, _) in pending.items():
+                    errors[name] = SkippedStageError('unknown inputs: {}'.format(', '.join(inputs)))
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    future.result()
+                    completed.add(name)
+                except Exception as e:
+                    logging.error(traceback.format_exc())
+                    errors[name] = e
+
+        return errors
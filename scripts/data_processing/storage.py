@@ -0,0 +1,167 @@
+"""
+The Module reads and writes the pipeline tables, the format follows the file extension
+    - .csv : kept for manual curation, list values are comma joined
+    - .parquet / .feather : columnar with an explicit schema, list values are list columns,
+      readers can load only the columns they need, memory-mapped (requires pyarrow)
+"""
+# =============================================================================
+
+import os
+import re
+import pandas as pd
+
+CSV = 'csv'
+PARQUET = 'parquet'
+FEATHER = 'feather'
+
+#columns holding several values, comma joined in csv files
+LIST_COLUMNS = ['treasury_address', 'dd_eth_names']
+
+#quoted values of a python list / set repr, as the csv stream writes the categories and tags
+QUOTED_VALUE = re.compile(r"'([^']*)'|\"([^\"]*)\"")
+
+#explicit types of the known columns, the others are inferred
+ORG_INFOS_SCHEMA = {
+    'createdat': 'timestamp',
+    'fetched_at': 'timestamp',
+    'proposalscount': 'float',
+    'votescount': 'float',
+    'memberscount': 'float',
+    'voterparticipation': 'float',
+    'aum': 'float',
+    'treasury_address': 'list',
+    'dd_eth_names': 'list',
+}
+
+OUTPUT_SCHEMA = {
+    'ss_followers_count': 'float',
+    'ss_proposals_count': 'float',
+    'treasury_address': 'list',
+    'categories': 'list',
+    'tags': 'list',
+    'discord_users_count': 'float',
+    'twitter_followers_count': 'float',
+    'treasury_size': 'float',
+    'num_proposals': 'float',
+    'token_price_usd': 'float',
+    'market_cap_usd': 'float',
+    'num_token_holders': 'float',
+}
+
+
+def get_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.parquet':
+        return PARQUET
+    if extension in ('.feather', '.arrow'):
+        return FEATHER
+    return CSV
+
+
+def to_list(value):
+    """
+    list value of a list column cell, comma joined strings and python list / set reprs are split
+    """
+    if isinstance(value, str):
+        text = value.strip()
+        if text == 'set()':
+            return []
+        if text[:1] in ('[', '{', '('):
+            quoted = QUOTED_VALUE.findall(text)
+            if quoted:
+                values = [single or double for single, double in quoted]
+            else:
+                values = [v.strip() for v in text.strip('[]{}()').split(',')]
+            return sorted(set(values)) if text[:1] == '{' else [v for v in values if v != '']
+        return [v for v in value.split(',') if v != '']
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return []
+    if isinstance(value, (set, frozenset)):
+        return sorted(str(v) for v in value)
+    return [str(v) for v in value]
+
+
+def to_joined(value):
+    """
+    comma joined value of a list column cell
+    """
+    return ','.join(to_list(value))
+
+
+def apply_schema(df, schema):
+    """
+    convert the known columns to their types before a columnar write
+    """
+    df = df.copy()
+    for column, column_type in schema.items():
+        if column not in df.columns:
+            continue
+        if column_type == 'list':
+            df[column] = df[column].map(to_list)
+        elif column_type == 'timestamp':
+            df[column] = pd.to_datetime(df[column], utc=True, errors='coerce')
+        elif column_type == 'float':
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype('float64')
+    #remaining mixed object columns are stored as strings
+    for column in df.columns:
+        if column not in schema and df[column].dtype == object:
+            df[column] = df[column].map(lambda v: None if v is None or (isinstance(v, float) and pd.isna(v)) else str(v))
+    return df
+
+
+def read_table(path, columns=None, list_columns=LIST_COLUMNS):
+    """
+    read the table, only the given columns if any. list columns are returned as python lists
+    """
+    table_format = get_format(path)
+    if table_format == CSV:
+        index_columns = ('', 'Unnamed: 0')
+        usecols = None if columns is None else (lambda c: c in columns or c in index_columns)
+        df = pd.read_csv(path, usecols=usecols)
+        if len(df.columns) > 0 and df.columns[0] in index_columns:
+            df = df.set_index(df.columns[0]).rename_axis(None)
+    elif table_format == PARQUET:
+        import pyarrow.parquet as pq
+        df = pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+    else:
+        import pyarrow.feather as feather
+        df = feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+    for column in list_columns:
+        if column in df.columns:
+            df[column] = df[column].map(to_list)
+    return df
+
+
+def write_table(df, path, schema=ORG_INFOS_SCHEMA):
+    """
+    write the table in the format of the path extension
+    """
+    table_format = get_format(path)
+    if table_format == CSV:
+        df = df.copy()
+        for column, column_type in schema.items():
+            if column_type == 'list' and column in df.columns:
+                df[column] = df[column].map(to_joined)
+        df.to_csv(path)
+        return
+
+    import pyarrow as pa
+    df = apply_schema(df, schema)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp_path = path + '.tmp'
+    if table_format == PARQUET:
+        import pyarrow.parquet as pq
+        pq.write_table(table, tmp_path)
+    else:
+        import pyarrow.feather as feather
+        feather.write_feather(table, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def convert_table(src_path, dst_path, schema=OUTPUT_SCHEMA):
+    """
+    convert a table from one format to another, e.g. a streamed csv output to parquet
+    """
+    list_columns = [column for column, column_type in schema.items() if column_type == 'list']
+    write_table(read_table(src_path, list_columns=list_columns), dst_path, schema)
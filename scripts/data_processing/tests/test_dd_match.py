@@ -0,0 +1,44 @@
+"""
+Tests of the deepdao match of the collect filters (filter_dd_treasury, DDDAOIndex.lookup)
+"""
+
+import os
+from collections import Counter
+import pytest
+import config
+from dao_extract import filter_dd_treasury
+from dd_dao import DDDAOIndex
+from output_writer import RowCollector
+
+ORG_INFOS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'dd_org_infos.csv')
+
+
+@pytest.fixture
+def dd_index():
+    DDDAOIndex.invalidate(ORG_INFOS_FILE)
+    yield DDDAOIndex.load(ORG_INFOS_FILE)
+    DDDAOIndex.invalidate(ORG_INFOS_FILE)
+
+
+def run_filter(orgs, dd_index):
+    writer, drops = RowCollector(), Counter()
+    kept = [org['eth_name'] for _, org in filter_dd_treasury(enumerate(orgs), dd_index, writer, drops)]
+    return kept, drops
+
+
+def test_website_match_is_left_to_collect(monkeypatch, dd_index):
+    monkeypatch.setattr(config, 'DD_FUZZY_MATCH_ENABLED', True)
+    kept, drops = run_filter([{'eth_name': 'xyzq.eth', 'name': 'Qwerty Labs'}], dd_index)
+    assert kept == ['xyzq.eth']
+    assert drops['dd_match'] == 0
+
+    #the early filter did not cache a name-only result
+    record = dd_index.lookup('xyzq.eth', 'Qwerty Labs', website='https://compound.finance/')
+    assert record is not None and record['name'] == 'Compound'
+
+
+def test_no_match_is_dropped_without_fuzzy_match(monkeypatch, dd_index):
+    monkeypatch.setattr(config, 'DD_FUZZY_MATCH_ENABLED', False)
+    kept, drops = run_filter([{'eth_name': 'xyzq.eth', 'name': 'Qwerty Labs'}], dd_index)
+    assert kept == []
+    assert drops['dd_match'] == 1
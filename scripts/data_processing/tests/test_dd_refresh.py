@@ -0,0 +1,101 @@
+"""
+Tests of the DeepDAO refresh diff (DDDAODownloader.refresh_data / is_summary_changed)
+"""
+
+import os
+import time
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pandas as pd
+import pytest
+import storage
+from dd_dao_download import DDDAODownloader
+
+DAY = 24 * 3600
+
+
+def make_summary(org_id, proposals=10, votes=20, aum=1000.0):
+    return {'organizationId': org_id, 'name': org_id, 'proposalsCount': proposals, 'votesCount': votes, 'aum': aum}
+
+
+@pytest.fixture
+def crawled(monkeypatch):
+    """
+    stands in for the deepdao api, records the orgs refetched by refresh_data
+    """
+    state = {'summaries': [], 'crawled': []}
+
+    def crawl_orgs(org_ids, crawl_dir=None, fetched_after=None):
+        state['crawled'].extend(org_ids)
+        fetched_at = datetime.now(timezone.utc).isoformat()
+        return {}, {}, {org_id: fetched_at for org_id in org_ids}
+
+    def flatten(df_dd_dao, org_details, org_assets):
+        return pd.DataFrame({'organizationid': df_dd_dao['organizationId'], 'fetched_at': df_dd_dao['fetched_at']})
+
+    monkeypatch.setattr(DDDAODownloader, 'get_orgs', staticmethod(lambda: {'daosSummary': state['summaries']}))
+    monkeypatch.setattr(DDDAODownloader, 'crawl_orgs', staticmethod(crawl_orgs))
+    monkeypatch.setattr(DDDAODownloader, 'flatten_curate_data_from_dd', staticmethod(flatten))
+    return state
+
+
+def write_legacy_extract(path, org_ids, age_s, proposals=None):
+    """
+    extract without organizationid / fetched_at columns, as the shipped dd_org_infos.csv
+    """
+    pd.DataFrame({
+        'id': org_ids,
+        'proposalscount': proposals if proposals is not None else [10] * len(org_ids),
+        'votescount': [20] * len(org_ids),
+        'aum': [1000.0] * len(org_ids),
+    }).to_csv(path)
+    file_time = time.time() - age_s
+    os.utime(path, (file_time, file_time))
+
+
+@pytest.mark.parametrize('new_value, old_value', [(None, np.nan), (np.nan, np.nan), (None, None), (10, 10.0), (10, '10')])
+def test_summary_not_changed(new_value, old_value):
+    assert not DDDAODownloader.is_summary_changed({'proposalscount': new_value}, {'proposalscount': old_value})
+
+
+@pytest.mark.parametrize('new_value, old_value', [(11, 10.0), (None, 10.0), (10, np.nan), ('abc', 'abd')])
+def test_summary_changed(new_value, old_value):
+    assert DDDAODownloader.is_summary_changed({'proposalscount': new_value}, {'proposalscount': old_value})
+
+
+def test_missing_values_are_not_refetched(tmp_path, crawled):
+    path = str(tmp_path / 'dd_org_infos.csv')
+    write_legacy_extract(path, ['a', 'b'], age_s=DAY, proposals=[np.nan, 10])
+    crawled['summaries'] = [make_summary('a', proposals=None), make_summary('b')]
+    DDDAODownloader.refresh_data(path)
+    assert crawled['crawled'] == []
+
+
+def test_changed_and_new_orgs_are_refetched(tmp_path, crawled):
+    path = str(tmp_path / 'dd_org_infos.csv')
+    write_legacy_extract(path, ['a', 'b'], age_s=DAY)
+    crawled['summaries'] = [make_summary('a', proposals=11), make_summary('b'), make_summary('c')]
+    df = DDDAODownloader.refresh_data(path)
+    assert crawled['crawled'] == ['a', 'c']
+    assert list(df['organizationid']) == ['a', 'b', 'c']
+
+
+def test_legacy_rows_age_out_after_rewrites(tmp_path, crawled):
+    path = str(tmp_path / 'dd_org_infos.csv')
+    write_legacy_extract(path, ['a', 'b'], age_s=6 * DAY)
+    crawled['summaries'] = [make_summary('a'), make_summary('b')]
+
+    #the rows take the file time once, it is kept when the file is rewritten
+    df = DDDAODownloader.refresh_data(path)
+    assert crawled['crawled'] == []
+    file_time = datetime.now(timezone.utc) - timedelta(seconds=6 * DAY)
+    for fetched_at in df['fetched_at']:
+        assert abs((datetime.fromisoformat(fetched_at) - file_time).total_seconds()) < 60
+    storage.write_table(df, path)
+
+    #two days later the rewritten file is recent but its rows are 8 days old
+    stored = pd.read_csv(path, index_col=0)
+    stored['fetched_at'] = [(datetime.fromisoformat(t) - timedelta(days=2)).isoformat() for t in stored['fetched_at']]
+    stored.to_csv(path)
+    DDDAODownloader.refresh_data(path)
+    assert crawled['crawled'] == ['a', 'b']
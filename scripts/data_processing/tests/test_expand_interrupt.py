@@ -0,0 +1,56 @@
+"""
+Tests of the rows buffered for the tag extraction in expand (format_curated_data)
+"""
+
+import pandas as pd
+import pytest
+import dao_extract
+from covalent_dao import CovalentBatchClient
+from output_writer import RowCollector
+
+
+class InterruptingStages:
+    """
+    stage graph stand-in, interrupts the run at the given DAO
+    """
+
+    def __init__(self, eth_names, interrupt_at):
+        self.eth_names = iter(eth_names)
+        self.interrupt_at = interrupt_at
+
+    def run(self, executor):
+        if next(self.eth_names) == self.interrupt_at:
+            raise KeyboardInterrupt()
+        return []
+
+
+def write_curated_data(path, eth_names):
+    pd.DataFrame({
+        'eth_name': eth_names, 'name': eth_names, 'data_clean_status': 'Y', 'logo': '', 'mission': '', 'about': '',
+        'network': '1', 'categories': "['protocol']", 'website': '', 'discord': '', 'twitter': '', 'symbol': '',
+        'contract_address': '', 'treasury_address': "['0x1']", 'ss_proposals_count': 1,
+    }).to_csv(path)
+
+
+@pytest.mark.parametrize('tags_fail', [False, True])
+def test_fetched_rows_are_written_on_interrupt(tmp_path, monkeypatch, tags_fail):
+    eth_names = ['dao{}.eth'.format(i) for i in range(5)]
+    path = str(tmp_path / 'curated.csv')
+    write_curated_data(path, eth_names)
+
+    stages = InterruptingStages(eth_names, interrupt_at='dao3.eth')
+    monkeypatch.setattr(dao_extract, 'build_dao_stages', lambda social_dao_loader, covalent_dao_loader: stages)
+    monkeypatch.setattr(CovalentBatchClient, 'prefetch', lambda self, wallets, tokens: None)
+
+    def get_hotwords_batch(texts):
+        if tags_fail:
+            raise RuntimeError('nlp model not available')
+        return [{'tag'} for _ in texts]
+    monkeypatch.setattr(dao_extract, 'get_hotwords_batch', get_hotwords_batch)
+
+    writer = RowCollector()
+    with pytest.raises(KeyboardInterrupt):
+        dao_extract.format_curated_data(path, writer)
+    assert [writer.is_done(eth_name) for eth_name in eth_names] == [True, True, True, False, False]
+    df = writer.get_dataframe()
+    assert list(df['tags']) == ([None] * 3 if tags_fail else [{'tag'}] * 3)
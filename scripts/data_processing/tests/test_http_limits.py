@@ -0,0 +1,45 @@
+"""
+Tests of the per host and per shard request limits (http_util.send)
+"""
+
+import time
+import pytest
+import requests
+import config
+import http_util
+
+
+class FakeSession:
+
+    def request(self, method, url, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response.request = requests.Request(method, url).prepare()
+        response._content = b'{}'
+        return response
+
+
+@pytest.fixture
+def sharded_host(monkeypatch):
+    monkeypatch.setattr(config, 'HTTP_SHARDED_HOSTS', {'api.example.org': r'^/v1/(\d+)/'})
+    monkeypatch.setattr(config, 'HTTP_HOST_RATES', {'api.example.org': (20, 20), 'api.example.org/*': (1000, 1000)})
+    monkeypatch.setattr(config, 'HOST_CONCURRENCY_LIMITS', {'api.example.org': 8, 'api.example.org/*': 4})
+    monkeypatch.setattr(config, 'HTTP_RATE_BURST', 1)
+    monkeypatch.setattr(http_util, '_host_rate_limiters', {})
+    monkeypatch.setattr(http_util, '_host_semaphores', {})
+    monkeypatch.setattr(http_util, 'get_host_session', lambda key: FakeSession())
+
+
+def test_shard_settings(sharded_host):
+    assert http_util.get_limit_key('api.example.org', '/v1/137/tokens/') == 'api.example.org/137'
+    assert http_util.get_limit_setting(config.HTTP_HOST_RATES, 'api.example.org/137', None) == (1000, 1000)
+    assert http_util.get_limit_setting(config.HTTP_HOST_RATES, 'api.example.org', None) == (20, 20)
+
+
+def test_shards_share_the_host_rate(sharded_host):
+    start_time = time.perf_counter()
+    for i in range(10):
+        http_util.send('GET', 'https://api.example.org/v1/{}/tokens/'.format(1 + i % 2))
+    #the first request is sent at once, the next ones at the 20 per second of the host
+    assert time.perf_counter() - start_time >= 9 / 20 * 0.9
+    assert set(http_util.get_host_rates()) == {'api.example.org', 'api.example.org/1', 'api.example.org/2'}
@@ -0,0 +1,44 @@
+"""
+Tests of the run metrics (metrics.py) recorded by the transport and the loaders
+"""
+
+import pytest
+import requests
+import config
+import metrics
+from dd_dao_download import DDDAODownloader
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_transport_error_is_recorded_once(monkeypatch):
+    #nothing listens on port 1 of the loopback
+    monkeypatch.setattr(config, 'HTTP_HOST_OVERRIDES', {'golden-gate-server.deepdao.io': 'http://127.0.0.1:1'})
+    monkeypatch.setattr(config, 'HTTP_CACHE_MODE', 'off')
+    monkeypatch.setattr(config, 'HTTP_MAX_RETRIES', 0)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        DDDAODownloader.get_org_details('org-id')
+    assert metrics.get_summary()['sources']['deepdao']['errors'] == {'ConnectionError': 1}
+
+
+def test_loader_error_is_recorded():
+    with pytest.raises(KeyError):
+        with metrics.timed('deepdao', 'parse'):
+            {}['data']
+    assert metrics.get_summary()['sources']['deepdao']['errors'] == {'KeyError': 1}
+
+
+def test_request_rates_of_every_chain_are_exported():
+    metrics.set_gauge('covalent', 'request_rate_1', 12.5)
+    metrics.set_gauge('covalent', 'request_rate_137', 7.0)
+    metrics.set_gauge('snapshot', 'request_rate', 20.0)
+    text = metrics.format_prometheus(metrics.get_summary())
+    prefix = config.METRICS_PROMETHEUS_PREFIX
+    assert '{}_request_rate{{source="covalent",chain="1"}} 12.5'.format(prefix) in text
+    assert '{}_request_rate{{source="covalent",chain="137"}} 7.0'.format(prefix) in text
+    assert '{}_request_rate{{source="snapshot"}} 20.0'.format(prefix) in text
@@ -0,0 +1,58 @@
+"""
+Tests of the resumable output (output_writer.CheckpointedWriter)
+"""
+
+import pandas as pd
+import pytest
+from output_writer import CheckpointedWriter
+
+COLUMNS = ['eth_name', 'about']
+
+
+def write_rows(writer, eth_names):
+    for eth_name in eth_names:
+        #multiline values are quoted over several lines
+        writer.write_row(eth_name, {'eth_name': eth_name, 'about': 'about\n{}'.format(eth_name)})
+
+
+@pytest.mark.parametrize('partial', [False, True])
+def test_row_without_journal_entry_is_not_duplicated(tmp_path, partial):
+    out_file = str(tmp_path / 'out.csv')
+    writer = CheckpointedWriter(out_file, COLUMNS)
+    write_rows(writer, ['a.eth', 'b.eth'])
+
+    #interrupted between the row and its journal entry
+    writer.writer.writerow({'': 2, 'eth_name': 'c.eth', 'about': 'about\nc.eth'})
+    writer.close()
+    if partial:
+        with open(out_file, 'rb+') as f:
+            f.truncate(f.seek(0, 2) - 5)
+
+    writer = CheckpointedWriter(out_file, COLUMNS, resume=True)
+    assert writer.n_rows == 2 and not writer.is_done('c.eth')
+    write_rows(writer, ['c.eth'])
+    writer.close()
+
+    df = pd.read_csv(out_file, index_col=0)
+    assert df['eth_name'].tolist() == ['a.eth', 'b.eth', 'c.eth']
+    assert df.index.tolist() == [0, 1, 2]
+    assert df['about'].tolist() == ['about\na.eth', 'about\nb.eth', 'about\nc.eth']
+
+
+def test_partial_journal_entry_is_dropped(tmp_path):
+    out_file = str(tmp_path / 'out.csv')
+    writer = CheckpointedWriter(out_file, COLUMNS)
+    write_rows(writer, ['a.eth', 'b.eth'])
+    writer.close()
+    with open(out_file + '.journal', 'rb+') as f:
+        f.truncate(f.seek(0, 2) - 5)
+
+    writer = CheckpointedWriter(out_file, COLUMNS, resume=True)
+    assert writer.is_done('a.eth') and not writer.is_done('b.eth')
+    write_rows(writer, ['b.eth'])
+    writer.close()
+
+    assert pd.read_csv(out_file, index_col=0)['eth_name'].tolist() == ['a.eth', 'b.eth']
+    writer = CheckpointedWriter(out_file, COLUMNS, resume=True)
+    assert writer.n_rows == 2
+    writer.close()
@@ -0,0 +1,44 @@
+"""
+Tests of the on-disk response cache (http_util.ResponseCache)
+"""
+
+import os
+import requests
+import http_util
+from http_util import ResponseCache
+
+
+def make_response(content):
+    response = requests.Response()
+    response.status_code = 200
+    response.url = 'https://example.org/'
+    response._content = content
+    return response
+
+
+def test_hit_of_an_entry_evicted_after_the_read(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path), max_bytes=1 << 20)
+    key = ResponseCache.make_key('GET', 'https://example.org/', None)
+    cache.put(key, make_response(b'body'))
+
+    def utime(path, *args, **kwargs):
+        #a concurrent put evicts the entry between the read and the mtime update
+        os.remove(path)
+        raise FileNotFoundError(path)
+    monkeypatch.setattr(http_util.os, 'utime', utime)
+
+    response = cache.get(key, ttl=60)
+    assert response is not None and response.content == b'body'
+
+
+def test_api_key_is_not_stored(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=1 << 20)
+    url = 'https://api.covalenthq.com/v1/1/address/0x1/balances_v2/?key=ckey_secret&nft=false'
+    key = ResponseCache.make_key('GET', url, None)
+    response = make_response(b'body')
+    response.url = url
+    cache.put(key, response)
+
+    with open(cache.get_path(key), 'rb') as f:
+        assert b'ckey_secret' not in f.read()
+    assert cache.get(key, ttl=60).url == 'https://api.covalenthq.com/v1/1/address/0x1/balances_v2/?nft=false'
@@ -0,0 +1,30 @@
+"""
+Tests of the batched snapshot fetch (SnapshotDAOLoader.get_daos_info)
+"""
+
+import http_util
+from snapshot_dao import SnapshotDAOLoader
+
+
+class FakeResponse:
+
+    def __init__(self, spaces):
+        self.spaces = spaces
+
+    def json(self):
+        return {'data': {'spaces': self.spaces}}
+
+
+def test_failed_batch_is_reported(monkeypatch):
+    def post(url, json=None, **kwargs):
+        ids = json['variables']['ids']
+        if 'c.eth' in ids:
+            raise TimeoutError('snapshot timed out')
+        #b.eth is not a snapshot space
+        return FakeResponse([{'id': eth_name} for eth_name in ids if eth_name != 'b.eth'])
+
+    monkeypatch.setattr(http_util, 'post', post)
+    daos_info, failed = SnapshotDAOLoader.get_daos_info(['a.eth', 'b.eth', 'c.eth', 'd.eth'], batch_size=2)
+    assert sorted(daos_info) == ['a.eth']
+    assert sorted(failed) == ['c.eth', 'd.eth']
+    assert 'TimeoutError' in failed['c.eth']
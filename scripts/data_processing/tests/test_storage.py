@@ -0,0 +1,49 @@
+"""
+Tests of the table formats (storage.py)
+"""
+
+import pandas as pd
+import pytest
+import storage
+
+pytest.importorskip('pyarrow')
+
+
+@pytest.mark.parametrize('value, expected', [
+    ("['protocol', 'grant']", ['protocol', 'grant']),
+    ("{'governance', 'defi'}", ['defi', 'governance']),
+    ('set()', []),
+    ('[]', []),
+    ('0x1,0x2', ['0x1', '0x2']),
+    (float('nan'), []),
+    ({'b', 'a'}, ['a', 'b']),
+])
+def test_to_list(value, expected):
+    assert storage.to_list(value) == expected
+
+
+@pytest.mark.parametrize('extension', ['.parquet', '.feather'])
+def test_streamed_output_lists_are_converted(tmp_path, extension):
+    #the csv stream holds the reprs of the categories and tags
+    stream_file = str(tmp_path / 'out.csv')
+    pd.DataFrame({
+        'name': ['a', 'b'],
+        'categories': [str(['protocol', 'grant']), str(['media'])],
+        'tags': [str({'governance'}), str(set())],
+        'treasury_address': ['0x1,0x2', '0x3'],
+    }).to_csv(stream_file)
+
+    out_file = str(tmp_path / ('out' + extension))
+    storage.convert_table(stream_file, out_file)
+    df = storage.read_table(out_file, list_columns=['categories', 'tags', 'treasury_address'])
+    assert df['categories'].tolist() == [['protocol', 'grant'], ['media']]
+    assert df['tags'].tolist() == [['governance'], []]
+    assert df['treasury_address'].tolist() == [['0x1', '0x2'], ['0x3']]
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+    table = pq.read_table(out_file) if extension == '.parquet' else feather.read_table(out_file)
+    for column in ['categories', 'tags']:
+        column_type = table.schema.field(column).type
+        assert pa.types.is_list(column_type) and pa.types.is_string(column_type.value_type)